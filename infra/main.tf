@@ -21,6 +21,14 @@ resource "random_id" "suffix" {
   byte_length = 4
 }
 
+locals {
+  bloom_filter_key = "bloom/users.bloom"
+
+  # Partitions per day of the registration time index; every function that
+  # writes or lists registrations must use the same value
+  registered_at_shards = "4"
+}
+
 # DynamoDB Module
 module "dynamodb" {
   source = "./modules/dynamodb"
@@ -41,38 +49,132 @@ module "s3" {
   tags            = var.tags
 }
 
+# SQS Module (write-behind registration queue)
+module "sqs" {
+  source = "./modules/sqs"
+
+  environment   = var.environment
+  random_suffix = random_id.suffix.hex
+  tags          = var.tags
+}
+
 # Lambda Modules
-module "register_user_lambda" {
+# One function serves both routes (see src/user_api.py), so register and
+# verify traffic share a single warm pool, AWS clients and caches
+module "user_api_lambda" {
+  source = "./modules/lambda"
+
+  function_name = "user_api"
+  handler       = "user_api.lambda_handler"
+  runtime       = "python3.9"
+  zip_path      = "./modules/lambda/user_api.zip"
+  environment   = var.environment
+  environment_variables = {
+    DYNAMODB_TABLE                        = module.dynamodb.dynamodb_table_name
+    S3_BUCKET                             = module.s3.s3_bucket_name
+    HTML_CACHE_TTL_SECONDS                = "300"
+    HTML_COMPRESSION                      = "true"
+    HTML_PRECOMPRESSED                    = "true"
+    VERIFY_CACHE_CONTROL                  = "public, max-age=60"
+    VERIFY_NEGATIVE_CACHE_CONTROL         = "no-cache"
+    VERIFY_VARY                           = "Accept-Encoding"
+    MEMBERSHIP_CACHE_MAX_ENTRIES          = "10000"
+    MEMBERSHIP_CACHE_POSITIVE_TTL_SECONDS = "60"
+    MEMBERSHIP_CACHE_NEGATIVE_TTL_SECONDS = "5"
+    MEMBERSHIP_CONSISTENT_READ            = "false"
+    BLOOM_DELTA_TABLE                     = module.dynamodb.bloom_delta_table_name
+    BLOOM_FILTER_KEY                      = local.bloom_filter_key
+    BLOOM_REFRESH_SECONDS                 = "300"
+    BLOOM_DELTA_REFRESH_SECONDS           = "1"
+    METRICS_NAMESPACE                     = "UserManagement"
+    ASYNC_REGISTRATION                    = "false"
+    REGISTRATION_QUEUE_URL                = module.sqs.queue_url
+    CALLER_RATE_PER_SECOND                = "20"
+    CALLER_BURST                          = "40"
+    SHED_P99_THRESHOLD_MS                 = "2000"
+    SHED_WINDOW_SECONDS                   = "10"
+    SHED_PROBE_RATE                       = "0.05"
+    OVERLOAD_RETRY_AFTER_SECONDS          = "1"
+    HEDGE_ENABLED                         = "true"
+    HEDGE_PERCENTILE                      = "95"
+    HEDGE_MAX_DELAY_MS                    = "500"
+    CIRCUIT_FAILURE_THRESHOLD             = "5"
+    CIRCUIT_RESET_SECONDS                 = "10"
+    WARMUP_HOLD_MS                        = "150"
+    PROFILE_SAMPLE_EVERY                  = "0"
+    PROFILE_DESTINATION                   = "log"
+    REGISTERED_AT_INDEX                   = module.dynamodb.registered_at_index_name
+    REGISTERED_AT_SHARDS                  = local.registered_at_shards
+    REGISTRATION_TTL_DAYS                 = "0"
+    LIST_USERS_MAX_LIMIT                  = "500"
+    LIST_USERS_MAX_QUERIES                = "32"
+  }
+  warmer = {
+    schedule_expression = "rate(5 minutes)"
+    concurrency         = 3
+  }
+  dynamodb_table_arn             = module.dynamodb.dynamodb_table_arn
+  additional_dynamodb_table_arns = [module.dynamodb.bloom_delta_table_arn]
+  s3_bucket_arn                  = module.s3.s3_bucket_arn
+  sqs_send_queue_arns            = [module.sqs.queue_arn]
+  reserved_concurrent_executions = 20
+}
+
+# Drains the registration queue in batches (same package as user_api)
+module "registration_consumer_lambda" {
   source = "./modules/lambda"
 
-  function_name = "register_user"
-  handler       = "register_user.lambda_handler"
+  function_name = "registration_consumer"
+  handler       = "registration_consumer.lambda_handler"
   runtime       = "python3.9"
-  zip_path      = "./modules/lambda/register_user.zip"
+  zip_path      = "./modules/lambda/user_api.zip"
   environment   = var.environment
   environment_variables = {
-    DYNAMODB_TABLE = module.dynamodb.dynamodb_table_name
+    DYNAMODB_TABLE        = module.dynamodb.dynamodb_table_name
+    BLOOM_DELTA_TABLE     = module.dynamodb.bloom_delta_table_name
+    METRICS_NAMESPACE     = "UserManagement"
+    REGISTERED_AT_SHARDS  = local.registered_at_shards
+    REGISTRATION_TTL_DAYS = "0"
   }
   dynamodb_table_arn             = module.dynamodb.dynamodb_table_arn
+  additional_dynamodb_table_arns = [module.dynamodb.bloom_delta_table_arn]
   s3_bucket_arn                  = module.s3.s3_bucket_arn
-  reserved_concurrent_executions = 10
+  sqs_consume_queue_arns         = [module.sqs.queue_arn]
+  sqs_event_source = {
+    queue_arn                          = module.sqs.queue_arn
+    batch_size                         = 100
+    maximum_batching_window_in_seconds = 5
+    maximum_concurrency                = 2
+  }
+  reserved_concurrent_executions = 5
 }
 
-module "verify_user_lambda" {
+# Rebuilds the Bloom filter snapshot (same package as user_api). verify_user
+# stops using a snapshot older than BLOOM_MAX_AGE_SECONDS (1 hour), so the
+# schedule must stay well inside that.
+module "bloom_builder_lambda" {
   source = "./modules/lambda"
 
-  function_name = "verify_user"
-  handler       = "verify_user.lambda_handler"
+  function_name = "bloom_builder"
+  handler       = "bloom_builder.lambda_handler"
   runtime       = "python3.9"
-  zip_path      = "./modules/lambda/verify_user.zip"
+  zip_path      = "./modules/lambda/user_api.zip"
   environment   = var.environment
   environment_variables = {
-    DYNAMODB_TABLE = module.dynamodb.dynamodb_table_name
-    S3_BUCKET      = module.s3.s3_bucket_name
+    DYNAMODB_TABLE    = module.dynamodb.dynamodb_table_name
+    S3_BUCKET         = module.s3.s3_bucket_name
+    BLOOM_FILTER_KEY  = local.bloom_filter_key
+    METRICS_NAMESPACE = "UserManagement"
   }
+  schedule = {
+    schedule_expression = "rate(15 minutes)"
+  }
+  timeout                        = 300
   dynamodb_table_arn             = module.dynamodb.dynamodb_table_arn
+  scan_dynamodb_table_arns       = [module.dynamodb.dynamodb_table_arn]
   s3_bucket_arn                  = module.s3.s3_bucket_arn
-  reserved_concurrent_executions = 10
+  s3_put_object_arns             = ["${module.s3.s3_bucket_arn}/${local.bloom_filter_key}"]
+  reserved_concurrent_executions = 1
 }
 
 # API Gateway Module
@@ -84,15 +186,28 @@ module "api_gateway" {
 
   lambda_functions = {
     register_user = {
-      function_name = module.register_user_lambda.function_name
-      invoke_arn    = module.register_user_lambda.function_invoke_arn
+      function_name = module.user_api_lambda.function_name
+      invoke_arn    = module.user_api_lambda.function_invoke_arn
       route_key     = "POST /register"
     }
     verify_user = {
-      function_name = module.verify_user_lambda.function_name
-      invoke_arn    = module.verify_user_lambda.function_invoke_arn
+      function_name = module.user_api_lambda.function_name
+      invoke_arn    = module.user_api_lambda.function_invoke_arn
       route_key     = "GET /"
     }
+    verify_users = {
+      function_name = module.user_api_lambda.function_name
+      invoke_arn    = module.user_api_lambda.function_invoke_arn
+      route_key     = "POST /verify"
+    }
+    list_users = {
+      function_name = module.user_api_lambda.function_name
+      invoke_arn    = module.user_api_lambda.function_invoke_arn
+      route_key     = "GET /users"
+      # Lists every registered userId, so callers must sign their requests
+      # with credentials allowed execute-api:Invoke on this route
+      authorization_type = "AWS_IAM"
+    }
   }
 }
 
@@ -102,15 +217,18 @@ module "monitoring" {
 
   environment = var.environment
   lambda_function_names = [
-    module.register_user_lambda.function_name,
-    module.verify_user_lambda.function_name
+    module.user_api_lambda.function_name,
+    module.registration_consumer_lambda.function_name
   ]
 
-  create_api_gateway_alarms = true
-  api_gateway_name          = module.api_gateway.api_name
-  log_retention_days        = 14
-  lambda_duration_threshold = 5000
-  alarm_actions             = [] # Add SNS topic ARNs here if needed
+  create_api_gateway_alarms     = true
+  api_gateway_name              = module.api_gateway.api_name
+  log_retention_days            = 14
+  lambda_duration_threshold     = 5000
+  lambda_p95_duration_threshold = 1000
+  lambda_p99_duration_threshold = 3000
+  metrics_namespace             = "UserManagement"
+  alarm_actions                 = [] # Add SNS topic ARNs here if needed
 
   tags = var.tags
 }
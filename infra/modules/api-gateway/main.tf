@@ -122,15 +122,17 @@ resource "aws_apigatewayv2_route" "lambda_routes" {
   route_key = each.value.route_key
   target    = "integrations/${aws_apigatewayv2_integration.lambda_integrations[each.key].id}"
 
-  # Add authorization type - NONE for public endpoints
-  authorization_type = "NONE"
+  # NONE for public endpoints; AWS_IAM routes only accept SigV4-signed
+  # requests from principals allowed execute-api:Invoke on them
+  authorization_type = each.value.authorization_type
 }
 
-# Create Lambda permissions for API Gateway
+# Create Lambda permissions for API Gateway, one per route since several
+# routes may share a function
 resource "aws_lambda_permission" "api_gateway" {
   for_each = var.lambda_functions
 
-  statement_id  = "AllowExecutionFromAPIGateway"
+  statement_id  = "AllowExecutionFromAPIGateway-${each.key}"
   action        = "lambda:InvokeFunction"
   function_name = each.value.function_name
   principal     = "apigateway.amazonaws.com"
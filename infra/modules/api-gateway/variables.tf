@@ -15,5 +15,7 @@ variable "lambda_functions" {
     function_name = string
     invoke_arn   = string
     route_key    = string
+    # NONE for public routes, AWS_IAM for routes that need signed requests
+    authorization_type = optional(string, "NONE")
   }))
 } 
\ No newline at end of file
@@ -22,6 +22,34 @@ resource "aws_dynamodb_table" "users" {
     type = "S"
   }
 
+  attribute {
+    name = "registeredDate"
+    type = "S"
+  }
+
+  attribute {
+    name = "registeredAt"
+    type = "S"
+  }
+
+  # Registration time index for GET /users: REGISTERED_AT_SHARDS partitions
+  # per UTC day (registeredDate is e.g. 2026-03-01#3), sorted by registeredAt. Items without registeredDate (written before
+  # the index existed and not yet re-imported) are left out.
+  global_secondary_index {
+    name               = var.registered_at_index_name
+    hash_key           = "registeredDate"
+    range_key          = "registeredAt"
+    projection_type    = "INCLUDE"
+    non_key_attributes = ["expiresAt"]
+  }
+
+  # Registrations expire only if they carry expiresAt, which register_user
+  # writes when REGISTRATION_TTL_DAYS is set
+  ttl {
+    attribute_name = "expiresAt"
+    enabled        = true
+  }
+
   # Enable point-in-time recovery for backup
   point_in_time_recovery {
     enabled = true
@@ -33,4 +61,36 @@ resource "aws_dynamodb_table" "users" {
   }
 
   tags = var.tags
-} 
\ No newline at end of file
+} 
+
+# Registration delta for the Bloom filter snapshot of userIds. Entries are
+# written by every registration path before the user is reported
+# registered, and expire via TTL once no snapshot that verify_user would
+# still trust can predate them.
+resource "aws_dynamodb_table" "bloom_delta" {
+  name         = "users-${var.environment}-${var.random_suffix}-bloom-delta"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "shard"
+  range_key    = "entry"
+
+  attribute {
+    name = "shard"
+    type = "S"
+  }
+
+  attribute {
+    name = "entry"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expiresAt"
+    enabled        = true
+  }
+
+  server_side_encryption {
+    enabled = true
+  }
+
+  tags = var.tags
+}
@@ -8,4 +8,19 @@ output "dynamodb_table_name" {
 output "dynamodb_table_arn" {
   description = "ARN of the DynamoDB table"
   value       = aws_dynamodb_table.users.arn
-} 
\ No newline at end of file
+} 
+
+output "registered_at_index_name" {
+  description = "Name of the users table index on registration time"
+  value       = var.registered_at_index_name
+}
+
+output "bloom_delta_table_name" {
+  description = "Name of the Bloom filter registration delta table"
+  value       = aws_dynamodb_table.bloom_delta.name
+}
+
+output "bloom_delta_table_arn" {
+  description = "ARN of the Bloom filter registration delta table"
+  value       = aws_dynamodb_table.bloom_delta.arn
+}
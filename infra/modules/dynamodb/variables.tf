@@ -12,4 +12,10 @@ variable "tags" {
   description = "Tags to apply to resources"
   type        = map(string)
   default     = {}
-} 
\ No newline at end of file
+} 
+
+variable "registered_at_index_name" {
+  description = "Name of the users table index on registration time"
+  type        = string
+  default     = "registeredAt-index"
+}
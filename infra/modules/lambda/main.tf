@@ -31,7 +31,7 @@ resource "aws_iam_policy" "lambda_policy" {
   description = "IAM policy for Lambda function ${var.function_name}"
   policy = jsonencode({
     Version = "2012-10-17"
-    Statement = [
+    Statement = concat([
       {
         Effect = "Allow"
         Action = [
@@ -46,9 +46,15 @@ resource "aws_iam_policy" "lambda_policy" {
         Effect = "Allow"
         Action = [
           "dynamodb:PutItem",
-          "dynamodb:GetItem"
+          "dynamodb:GetItem",
+          "dynamodb:BatchWriteItem",
+          "dynamodb:BatchGetItem",
+          "dynamodb:Query"
         ]
-        Resource = var.dynamodb_table_arn
+        Resource = concat(
+          [var.dynamodb_table_arn, "${var.dynamodb_table_arn}/index/*"],
+          var.additional_dynamodb_table_arns
+        )
       },
       # S3 permissions - restricted to specific bucket and objects
       {
@@ -67,7 +73,47 @@ resource "aws_iam_policy" "lambda_policy" {
         ]
         Resource = "*"
       }
-    ]
+      ],
+      # SQS permissions, only when queues are configured
+      [for arns in [var.sqs_send_queue_arns] : {
+        Effect   = "Allow"
+        Action   = ["sqs:SendMessage"]
+        Resource = arns
+      } if length(arns) > 0],
+      [for arns in [var.sqs_consume_queue_arns] : {
+        Effect = "Allow"
+        Action = [
+          "sqs:ReceiveMessage",
+          "sqs:DeleteMessage",
+          "sqs:GetQueueAttributes",
+          "sqs:ChangeMessageVisibility"
+        ]
+        Resource = arns
+      } if length(arns) > 0],
+      # Sampled profiles, only when a profile bucket is configured
+      [for arn in (var.profile_bucket_arn != null ? [var.profile_bucket_arn] : []) : {
+        Effect   = "Allow"
+        Action   = ["s3:PutObject"]
+        Resource = "${arn}/*"
+      }],
+      # Self-invoke, for warm-ups that fan out to more than one container
+      [for w in (var.warmer != null ? [var.warmer] : []) : {
+        Effect   = "Allow"
+        Action   = ["lambda:InvokeFunction"]
+        Resource = "arn:aws:lambda:${data.aws_region.current.name}:${data.aws_caller_identity.current.account_id}:function:${var.function_name}"
+      } if w.concurrency > 1],
+      # Full-table reads, for scheduled jobs such as the Bloom filter builder
+      [for arns in [var.scan_dynamodb_table_arns] : {
+        Effect   = "Allow"
+        Action   = ["dynamodb:Scan"]
+        Resource = arns
+      } if length(arns) > 0],
+      [for arns in [var.s3_put_object_arns] : {
+        Effect   = "Allow"
+        Action   = ["s3:PutObject"]
+        Resource = arns
+      } if length(arns) > 0]
+    )
   })
 }
 
@@ -91,12 +137,13 @@ resource "aws_lambda_function" "this" {
   role             = aws_iam_role.lambda_exec.arn
   filename         = var.zip_path
   source_code_hash = filebase64sha256(var.zip_path)
+  layers           = var.layers
 
   environment {
     variables = var.environment_variables
   }
 
-  timeout = 10
+  timeout = var.timeout
 
   # Enable X-Ray tracing
   tracing_config {
@@ -124,6 +171,83 @@ resource "aws_lambda_function" "this" {
   }
 }
 
+# SQS trigger (optional). Failed messages are reported individually through
+# ReportBatchItemFailures; maximum_concurrency caps how hard a backlog can
+# push on downstream write capacity.
+resource "aws_lambda_event_source_mapping" "sqs" {
+  count = var.sqs_event_source != null ? 1 : 0
+
+  event_source_arn                   = var.sqs_event_source.queue_arn
+  function_name                      = aws_lambda_function.this.arn
+  batch_size                         = var.sqs_event_source.batch_size
+  maximum_batching_window_in_seconds = var.sqs_event_source.maximum_batching_window_in_seconds
+  function_response_types            = ["ReportBatchItemFailures"]
+
+  scaling_config {
+    maximum_concurrency = var.sqs_event_source.maximum_concurrency
+  }
+}
+
+# Scheduled warmer (optional). Invokes the function with a warm-up event
+# that primes its caches and fans out to `concurrency` containers; see
+# src/warmup.py.
+resource "aws_cloudwatch_event_rule" "warmer" {
+  count = var.warmer != null ? 1 : 0
+
+  name                = "${var.function_name}-warmer-${random_id.suffix.hex}"
+  description         = "Keeps ${var.warmer.concurrency} ${var.function_name} containers warm"
+  schedule_expression = var.warmer.schedule_expression
+}
+
+resource "aws_cloudwatch_event_target" "warmer" {
+  count = var.warmer != null ? 1 : 0
+
+  rule = aws_cloudwatch_event_rule.warmer[0].name
+  arn  = aws_lambda_function.this.arn
+  input = jsonencode({
+    warmup      = true
+    concurrency = var.warmer.concurrency
+  })
+}
+
+resource "aws_lambda_permission" "warmer" {
+  count = var.warmer != null ? 1 : 0
+
+  statement_id  = "AllowWarmerInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.this.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.warmer[0].arn
+}
+
+# Schedule (optional). Invokes the function with an empty event, for jobs
+# such as rebuilding the Bloom filter snapshot; see src/bloom_builder.py.
+resource "aws_cloudwatch_event_rule" "schedule" {
+  count = var.schedule != null ? 1 : 0
+
+  name                = "${var.function_name}-schedule-${random_id.suffix.hex}"
+  description         = "Runs ${var.function_name} on a schedule"
+  schedule_expression = var.schedule.schedule_expression
+}
+
+resource "aws_cloudwatch_event_target" "schedule" {
+  count = var.schedule != null ? 1 : 0
+
+  rule  = aws_cloudwatch_event_rule.schedule[0].name
+  arn   = aws_lambda_function.this.arn
+  input = jsonencode({})
+}
+
+resource "aws_lambda_permission" "schedule" {
+  count = var.schedule != null ? 1 : 0
+
+  statement_id  = "AllowScheduleInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.this.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.schedule[0].arn
+}
+
 # Data sources for current region and account
 data "aws_region" "current" {}
 data "aws_caller_identity" "current" {}
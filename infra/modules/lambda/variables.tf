@@ -34,11 +34,87 @@ variable "dynamodb_table_arn" {
   type        = string
 }
 
+variable "additional_dynamodb_table_arns" {
+  description = "ARNs of other DynamoDB tables the function may access"
+  type        = list(string)
+  default     = []
+}
+
+variable "scan_dynamodb_table_arns" {
+  description = "ARNs of DynamoDB tables the function may scan"
+  type        = list(string)
+  default     = []
+}
+
+variable "sqs_send_queue_arns" {
+  description = "ARNs of SQS queues the function may send messages to"
+  type        = list(string)
+  default     = []
+}
+
+variable "sqs_consume_queue_arns" {
+  description = "ARNs of SQS queues the function consumes"
+  type        = list(string)
+  default     = []
+}
+
+variable "sqs_event_source" {
+  description = "SQS queue that triggers the function (optional)"
+  type = object({
+    queue_arn                          = string
+    batch_size                         = number
+    maximum_batching_window_in_seconds = number
+    maximum_concurrency                = number
+  })
+  default = null
+}
+
+variable "profile_bucket_arn" {
+  description = "ARN of a bucket the function may write sampled profiles to (PROFILE_DESTINATION = s3); optional"
+  type        = string
+  default     = null
+}
+
+variable "layers" {
+  description = "ARNs of Lambda layers to attach, e.g. one published from dependencies_layer.zip"
+  type        = list(string)
+  default     = []
+}
+
+variable "warmer" {
+  description = "Scheduled warm-up (optional): how often to run it and how many containers to keep warm"
+  type = object({
+    schedule_expression = string
+    concurrency         = number
+  })
+  default = null
+}
+
+variable "schedule" {
+  description = "Scheduled invocation (optional), e.g. rate(15 minutes)"
+  type = object({
+    schedule_expression = string
+  })
+  default = null
+}
+
 variable "s3_bucket_arn" {
   description = "ARN of the S3 bucket"
   type        = string
 }
 
+variable "s3_put_object_arns" {
+  description = "ARNs of S3 objects the function may write"
+  type        = list(string)
+  default     = []
+}
+
+variable "timeout" {
+  description = "Timeout for the Lambda function in seconds"
+  type        = number
+  default     = 10
+}
+
 variable "reserved_concurrent_executions" {
   description = "Reserved concurrency for the Lambda function"
   type        = number
@@ -13,6 +13,7 @@ terraform {
 }
 
 data "aws_caller_identity" "current" {}
+data "aws_region" "current" {}
 
 # CloudWatch Log Groups for Lambda Functions
 resource "aws_cloudwatch_log_group" "lambda_logs" {
@@ -157,6 +158,130 @@ resource "aws_cloudwatch_metric_alarm" "lambda_duration" {
   tags = var.tags
 }
 
+# CloudWatch Alarms for Lambda tail latency
+resource "aws_cloudwatch_metric_alarm" "lambda_duration_p95" {
+  for_each = toset(var.lambda_function_names)
+
+  alarm_name          = "${each.value}-duration-p95"
+  comparison_operator = "GreaterThanThreshold"
+  evaluation_periods  = "3"
+  metric_name         = "Duration"
+  namespace           = "AWS/Lambda"
+  period              = "300"
+  extended_statistic  = "p95"
+  threshold           = var.lambda_p95_duration_threshold
+  alarm_description   = "Lambda function ${each.value} p95 duration exceeded threshold"
+  alarm_actions       = var.alarm_actions
+  treat_missing_data  = "notBreaching"
+
+  dimensions = {
+    FunctionName = each.value
+  }
+
+  tags = var.tags
+}
+
+resource "aws_cloudwatch_metric_alarm" "lambda_duration_p99" {
+  for_each = toset(var.lambda_function_names)
+
+  alarm_name          = "${each.value}-duration-p99"
+  comparison_operator = "GreaterThanThreshold"
+  evaluation_periods  = "3"
+  metric_name         = "Duration"
+  namespace           = "AWS/Lambda"
+  period              = "300"
+  extended_statistic  = "p99"
+  threshold           = var.lambda_p99_duration_threshold
+  alarm_description   = "Lambda function ${each.value} p99 duration exceeded threshold"
+  alarm_actions       = var.alarm_actions
+  treat_missing_data  = "notBreaching"
+
+  dimensions = {
+    FunctionName = each.value
+  }
+
+  tags = var.tags
+}
+
+# Per-phase latency dashboard built on the EMF metrics emitted by the handlers
+resource "aws_cloudwatch_dashboard" "request_phases" {
+  dashboard_name = "user-management-latency-${var.environment}"
+
+  dashboard_body = jsonencode({
+    widgets = concat(
+      [
+        for index, function_name in var.lambda_function_names : {
+          type   = "metric"
+          x      = 0
+          y      = index * 6
+          width  = 12
+          height = 6
+          properties = {
+            title  = "${function_name} phase latency (p99)"
+            region = data.aws_region.current.name
+            stat   = "p99"
+            period = 60
+            view   = "timeSeries"
+            metrics = [
+              for phase in ["DurationMs", "ValidationMs", "DynamoDBMs", "S3Ms", "SerializationMs"] :
+              [var.metrics_namespace, phase, "Function", function_name]
+            ]
+          }
+        }
+      ],
+      [
+        for index, function_name in var.lambda_function_names : {
+          type   = "metric"
+          x      = 12
+          y      = index * 6
+          width  = 12
+          height = 6
+          properties = {
+            title  = "${function_name} duration by start type (p95)"
+            region = data.aws_region.current.name
+            stat   = "p95"
+            period = 60
+            view   = "timeSeries"
+            metrics = [
+              [var.metrics_namespace, "DurationMs", "Function", function_name, "StartType", "cold"],
+              [var.metrics_namespace, "DurationMs", "Function", function_name, "StartType", "warm"],
+              [var.metrics_namespace, "InitMs", "Function", function_name, "StartType", "cold"]
+            ]
+          }
+        }
+      ],
+      [
+        # Hedged reads and circuit breakers (resilience.py); CircuitState is
+        # 0 closed, 1 half-open, 2 open
+        for index, function_name in var.lambda_function_names : {
+          type   = "metric"
+          x      = 0
+          y      = (length(var.lambda_function_names) + index) * 6
+          width  = 24
+          height = 6
+          properties = {
+            title  = "${function_name} hedges and circuit breakers"
+            region = data.aws_region.current.name
+            stat   = "Sum"
+            period = 60
+            view   = "timeSeries"
+            metrics = concat(
+              [
+                for name in ["DynamoDBHedged", "DynamoDBHedgeWins", "S3Hedged", "S3HedgeWins", "DynamoDBCircuitRejected", "S3CircuitRejected", "StaleMembership"] :
+                [var.metrics_namespace, name, "Function", function_name]
+              ],
+              [
+                for name in ["DynamoDBCircuitState", "S3CircuitState"] :
+                [var.metrics_namespace, name, "Function", function_name, { stat = "Maximum", yAxis = "right" }]
+              ]
+            )
+          }
+        }
+      ]
+    )
+  })
+}
+
 # CloudWatch Alarm for API Gateway 5XX Errors
 resource "aws_cloudwatch_metric_alarm" "api_gateway_5xx_errors" {
   count = var.create_api_gateway_alarms ? 1 : 0
@@ -32,6 +32,24 @@ variable "lambda_duration_threshold" {
   default     = 5000
 }
 
+variable "lambda_p95_duration_threshold" {
+  description = "Threshold for Lambda p95 duration alarm (ms)"
+  type        = number
+  default     = 1000
+}
+
+variable "lambda_p99_duration_threshold" {
+  description = "Threshold for Lambda p99 duration alarm (ms)"
+  type        = number
+  default     = 3000
+}
+
+variable "metrics_namespace" {
+  description = "CloudWatch namespace of the handlers' embedded metric format records"
+  type        = string
+  default     = "UserManagement"
+}
+
 variable "alarm_actions" {
   description = "List of ARNs to notify for alarms (e.g., SNS topics)"
   type        = list(string)
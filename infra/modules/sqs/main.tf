@@ -0,0 +1,35 @@
+terraform {
+  required_providers {
+    aws = {
+      source  = "hashicorp/aws"
+      version = "~> 5.0"
+    }
+  }
+  required_version = ">= 1.5.0"
+}
+
+# Write-behind registration queue. register_user enqueues validated
+# registrations when ASYNC_REGISTRATION is enabled and registration_consumer
+# drains them in batches. Messages that keep failing move to the DLQ.
+resource "aws_sqs_queue" "registrations_dlq" {
+  name                      = "registrations-${var.environment}-${var.random_suffix}-dlq"
+  message_retention_seconds = 1209600
+  sqs_managed_sse_enabled   = true
+
+  tags = var.tags
+}
+
+resource "aws_sqs_queue" "registrations" {
+  name                       = "registrations-${var.environment}-${var.random_suffix}"
+  visibility_timeout_seconds = var.visibility_timeout_seconds
+  message_retention_seconds  = 345600
+  receive_wait_time_seconds  = 20
+  sqs_managed_sse_enabled    = true
+
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.registrations_dlq.arn
+    maxReceiveCount     = var.max_receive_count
+  })
+
+  tags = var.tags
+}
@@ -0,0 +1,14 @@
+output "queue_url" {
+  description = "URL of the registration queue"
+  value       = aws_sqs_queue.registrations.url
+}
+
+output "queue_arn" {
+  description = "ARN of the registration queue"
+  value       = aws_sqs_queue.registrations.arn
+}
+
+output "dlq_arn" {
+  description = "ARN of the registration dead-letter queue"
+  value       = aws_sqs_queue.registrations_dlq.arn
+}
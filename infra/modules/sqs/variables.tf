@@ -0,0 +1,27 @@
+variable "environment" {
+  description = "Deployment environment (e.g., dev, dev)"
+  type        = string
+}
+
+variable "random_suffix" {
+  description = "Random suffix for resource uniqueness"
+  type        = string
+}
+
+variable "visibility_timeout_seconds" {
+  description = "Visibility timeout; must be at least the consumer Lambda timeout"
+  type        = number
+  default     = 60
+}
+
+variable "max_receive_count" {
+  description = "Receives before a message is moved to the dead-letter queue"
+  type        = number
+  default     = 5
+}
+
+variable "tags" {
+  description = "Tags to apply to resources"
+  type        = map(string)
+  default     = {}
+}
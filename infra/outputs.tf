@@ -31,11 +31,16 @@ output "api_gateway_id" {
 output "lambda_function_names" {
   description = "Names of the Lambda functions"
   value = {
-    register_user = module.register_user_lambda.function_name
-    verify_user   = module.verify_user_lambda.function_name
+    user_api              = module.user_api_lambda.function_name
+    registration_consumer = module.registration_consumer_lambda.function_name
   }
 }
 
+output "registration_queue_url" {
+  description = "URL of the write-behind registration queue"
+  value       = module.sqs.queue_url
+}
+
 data "aws_caller_identity" "current" {}
 data "aws_region" "current" {}
 
@@ -74,21 +74,10 @@ EOF
 print_success "Backend configuration updated ✓"
 
 print_status "Step 2: Building Lambda ZIPs..."
-cd "$PROJECT_ROOT/infra/modules/lambda"
-
-if [ -f "$PROJECT_ROOT/src/register_user.py" ]; then
-  echo "Building register_user from $PROJECT_ROOT/src/register_user.py → register_user.zip"
-  zip -j register_user.zip "$PROJECT_ROOT/src/register_user.py"
-else
-  print_warning "register_user.py not found, skipping zip."
-fi
-
-if [ -f "$PROJECT_ROOT/src/verify_user.py" ]; then
-  echo "Building verify_user from $PROJECT_ROOT/src/verify_user.py → verify_user.zip"
-  zip -j verify_user.zip "$PROJECT_ROOT/src/verify_user.py"
-else
-  print_warning "verify_user.py not found, skipping zip."
-fi
+# user_api.zip holds user_api, registration_consumer and the modules they
+# import; boto3 comes from the Lambda runtime. Sizes and import times are
+# in infra/modules/lambda/build_report.json.
+python3 "$PROJECT_ROOT/src/build_lambdas.py" --output-dir "$PROJECT_ROOT/infra/modules/lambda"
 
 print_success "Lambda ZIPs built ✓"
 
@@ -122,6 +111,59 @@ else
 fi
 print_success "HTML files uploaded to S3 (if present) ✓"
 
+STATIC_BUCKET=$(terraform output -raw s3_bucket_name 2>/dev/null || echo "")
+USERS_TABLE=$(terraform output -raw dynamodb_table_name 2>/dev/null || echo "")
+
+# Precompressed copies (<page>.gz, and <page>.br when the brotli CLI is
+# available) next to each page. source-md5 ties each copy to the page
+# version it was built from; verify_user ignores copies that do not match.
+# Set PRECOMPRESS_HTML=false to skip.
+print_status "Step 4b: Uploading precompressed HTML variants..."
+if [ "${PRECOMPRESS_HTML:-true}" = "true" ] && [ -n "$STATIC_BUCKET" ]; then
+  PRECOMPRESS_DIR=$(mktemp -d)
+  for page in index.html error.html; do
+    [ -f "$PROJECT_ROOT/html/$page" ] || continue
+    SOURCE_MD5=$(python3 -c "import hashlib, sys; print(hashlib.md5(open(sys.argv[1], 'rb').read()).hexdigest())" "$PROJECT_ROOT/html/$page")
+    gzip -9 -n -c "$PROJECT_ROOT/html/$page" > "$PRECOMPRESS_DIR/$page.gz"
+    aws s3 cp "$PRECOMPRESS_DIR/$page.gz" "s3://$STATIC_BUCKET/$page.gz" \
+      --content-type text/html --content-encoding gzip --metadata "source-md5=$SOURCE_MD5"
+    if command -v brotli > /dev/null 2>&1; then
+      brotli -q 11 -c "$PROJECT_ROOT/html/$page" > "$PRECOMPRESS_DIR/$page.br"
+      aws s3 cp "$PRECOMPRESS_DIR/$page.br" "s3://$STATIC_BUCKET/$page.br" \
+        --content-type text/html --content-encoding br --metadata "source-md5=$SOURCE_MD5"
+    fi
+  done
+  rm -rf "$PRECOMPRESS_DIR"
+  print_success "Precompressed HTML variants uploaded ✓"
+else
+  print_warning "Skipping precompressed HTML variants; verify_user will compress pages itself."
+fi
+
+print_status "Step 5: Publishing Bloom filter snapshot of registered users..."
+if [ -n "$STATIC_BUCKET" ] && [ -n "$USERS_TABLE" ]; then
+  python3 "$PROJECT_ROOT/src/bloom_filter.py" --table "$USERS_TABLE" --bucket "$STATIC_BUCKET" \
+    || print_warning "Bloom filter snapshot not published; verify_user will fall back to DynamoDB lookups."
+else
+  print_warning "Could not read bucket/table outputs, skipping Bloom filter snapshot."
+fi
+
+# A new release starts with no warm containers. Pre-warm as many as the
+# scheduled warmer keeps (WARMUP_CONCURRENCY, 0 to skip) so the first real
+# requests do not pay for cold starts.
+print_status "Step 6: Pre-warming user_api..."
+if [ "${WARMUP_CONCURRENCY:-3}" -gt 0 ]; then
+  WARMUP_OUTPUT=$(mktemp)
+  aws lambda invoke --function-name user_api \
+    --cli-binary-format raw-in-base64-out \
+    --payload "{\"warmup\":true,\"concurrency\":${WARMUP_CONCURRENCY:-3}}" \
+    "$WARMUP_OUTPUT" > /dev/null \
+    && print_success "Warm-up: $(cat "$WARMUP_OUTPUT") ✓" \
+    || print_warning "Warm-up invocation failed; the first requests will be cold starts."
+  rm -f "$WARMUP_OUTPUT"
+else
+  print_warning "Skipping pre-warming."
+fi
+
 cd "$PROJECT_ROOT"
 
 print_success "Deployment Complete! 🎉"
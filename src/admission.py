@@ -0,0 +1,200 @@
+import os
+import math
+import time
+import random
+import logging
+import functools
+import threading
+from collections import OrderedDict, deque
+
+import api_common
+import metrics
+import resilience
+
+# Admission control for the API routes.
+#
+# Two checks run before a request does any work. The latency-aware shedder
+# tracks how long recent requests spent in calls to DynamoDB and S3
+# (resilience.DEPENDENCY_TIMING, which only counts calls that were made,
+# not cache hits); once their p99 passes SHED_P99_THRESHOLD_MS, new
+# requests get an immediate 503 instead of queueing behind a slow table
+# until the Lambda timeout. A small fraction is still admitted as probes,
+# so the p99 follows the dependency back down and shedding stops on its
+# own. A token bucket per caller
+# (source IP) then caps how fast any one client can send requests (429).
+#
+# State is per container: the effective per-caller limit is
+# CALLER_RATE_PER_SECOND times the number of warm instances serving it.
+
+logger = logging.getLogger()
+
+# Per-caller token bucket; a rate of 0 disables it
+CALLER_RATE_PER_SECOND = float(os.environ.get('CALLER_RATE_PER_SECOND', '0'))
+CALLER_BURST = float(os.environ.get('CALLER_BURST', str(max(2 * CALLER_RATE_PER_SECOND, 1))))
+CALLER_BUCKETS_MAX = int(os.environ.get('CALLER_BUCKETS_MAX', '10000'))
+
+# Latency-aware shedding; a threshold of 0 disables it
+SHED_P99_THRESHOLD_MS = float(os.environ.get('SHED_P99_THRESHOLD_MS', '0'))
+SHED_WINDOW_SECONDS = float(os.environ.get('SHED_WINDOW_SECONDS', '10'))
+SHED_MIN_SAMPLES = int(os.environ.get('SHED_MIN_SAMPLES', '20'))
+SHED_PROBE_RATE = float(os.environ.get('SHED_PROBE_RATE', '0.05'))
+
+SHED_MAX_SAMPLES = 1000
+P99_REFRESH_SECONDS = 0.5
+
+
+class TokenBucket:
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now):
+        # Returns 0 if a token was taken, otherwise the seconds until one is
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class CallerLimiter:
+    # Token buckets for the most recently seen callers. An evicted caller
+    # starts again with a full bucket.
+
+    def __init__(self, rate, burst, max_callers):
+        self.rate = rate
+        self.burst = burst
+        self.max_callers = max_callers
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def check(self, caller, now):
+        with self.lock:
+            bucket = self.buckets.get(caller)
+            if bucket is None:
+                bucket = self.buckets[caller] = TokenBucket(self.rate, self.burst, now)
+                if len(self.buckets) > self.max_callers:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(caller)
+            return bucket.take(now)
+
+
+class LatencyShedder:
+
+    def __init__(self, threshold_ms, window_seconds, min_samples, probe_rate):
+        self.threshold_ms = threshold_ms
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.probe_rate = probe_rate
+        self.samples = deque(maxlen=SHED_MAX_SAMPLES)
+        self.p99 = 0.0
+        self.evaluated_at = None
+        self.lock = threading.Lock()
+
+    def record(self, elapsed_ms, now):
+        with self.lock:
+            self.samples.append((now, elapsed_ms))
+
+    def _evaluate(self, now):
+        while self.samples and now - self.samples[0][0] > self.window_seconds:
+            self.samples.popleft()
+        if len(self.samples) < self.min_samples:
+            self.p99 = 0.0
+        else:
+            values = sorted(elapsed_ms for _, elapsed_ms in self.samples)
+            self.p99 = values[math.ceil(len(values) * 0.99) - 1]
+        self.evaluated_at = now
+
+    def overloaded(self, now):
+        # The p99 is re-evaluated at most every P99_REFRESH_SECONDS
+        with self.lock:
+            if self.evaluated_at is None or now - self.evaluated_at >= P99_REFRESH_SECONDS:
+                self._evaluate(now)
+            return self.p99 > self.threshold_ms
+
+    def should_shed(self, now):
+        return self.overloaded(now) and random.random() >= self.probe_rate
+
+
+caller_limiter = (
+    CallerLimiter(CALLER_RATE_PER_SECOND, CALLER_BURST, CALLER_BUCKETS_MAX)
+    if CALLER_RATE_PER_SECOND > 0 else None
+)
+shedder = (
+    LatencyShedder(SHED_P99_THRESHOLD_MS, SHED_WINDOW_SECONDS, SHED_MIN_SAMPLES, SHED_PROBE_RATE)
+    if SHED_P99_THRESHOLD_MS > 0 else None
+)
+
+
+def caller_id(event):
+    # API Gateway v2 puts the client address in requestContext.http, v1 in
+    # requestContext.identity. X-Forwarded-For is client-controlled and is
+    # not used.
+    request_context = event.get('requestContext') or {}
+    return (
+        (request_context.get('http') or {}).get('sourceIp')
+        or (request_context.get('identity') or {}).get('sourceIp')
+        or 'unknown'
+    )
+
+
+def admit(event):
+    # Returns None if the request may proceed, otherwise the 503 or 429
+    # response to send
+    now = time.monotonic()
+    if shedder is not None and shedder.should_shed(now):
+        logger.warning(f"Shedding request: downstream p99 {shedder.p99} ms over {shedder.threshold_ms} ms")
+        metrics.set_outcome('shed')
+        metrics.put_metric('Shed', 1)
+        return api_common.overloaded()
+
+    if caller_limiter is not None:
+        caller = caller_id(event)
+        wait_seconds = caller_limiter.check(caller, now)
+        if wait_seconds:
+            logger.warning(f"Rate limiting caller {caller}")
+            metrics.set_outcome('rate_limited')
+            metrics.put_metric('RateLimited', 1)
+            return api_common.response(
+                429, api_common.RATE_LIMITED_BODY, api_common.retry_after_headers(math.ceil(wait_seconds))
+            )
+    return None
+
+
+def observe(response):
+    # Feeds the shedder with the downstream time of a completed request.
+    # Requests that made no dependency call (membership and page cache
+    # hits, Bloom filter misses, validation errors, open circuits) say
+    # nothing about the dependencies and are not sampled. An error 503
+    # means a dependency throttled us and counts as unboundedly slow.
+    if shedder is None:
+        return
+    request_metrics = metrics.current()
+    if request_metrics is None:
+        return
+    if isinstance(response, dict) and response.get('statusCode') == 503:
+        if request_metrics.outcome == 'error':
+            shedder.record(math.inf, time.monotonic())
+        return
+    elapsed_ms = request_metrics.values.get(resilience.DEPENDENCY_TIMING)
+    if elapsed_ms is not None:
+        shedder.record(elapsed_ms, time.monotonic())
+
+
+def controlled(handler):
+    # Decorator for route handlers: admission check first, then the
+    # handler, then its downstream latency is recorded
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        rejection = admit(event)
+        if rejection is not None:
+            return rejection
+        response = handler(event, context)
+        observe(response)
+        return response
+    return wrapper
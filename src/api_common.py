@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import base64
+import random
+import zlib
+from datetime import datetime, timedelta, timezone
+
+# Request parsing and response building shared by every route.
+#
+# Header dicts and the static error bodies are built once per container and
+# referenced by every response, so they must never be mutated per request;
+# copy them first when a response needs extra headers.
+
+JSON_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+}
+
+HTML_HEADERS = {
+    'Content-Type': 'text/html',
+    'Access-Control-Allow-Origin': '*'
+}
+
+MISSING_USER_ID_BODY = json.dumps({'error': 'Missing userId parameter'})
+EMPTY_USER_ID_BODY = json.dumps({'error': 'Empty userId value'})
+ROUTE_NOT_FOUND_BODY = json.dumps({'error': 'Route not found'})
+RATE_LIMITED_BODY = json.dumps({'error': 'Too many requests'})
+OVERLOADED_BODY = json.dumps({'error': 'Service temporarily overloaded'})
+
+# Seconds clients are asked to wait after a 503 for overload or throttling
+OVERLOAD_RETRY_AFTER_SECONDS = int(os.environ.get('OVERLOAD_RETRY_AFTER_SECONDS', '1'))
+
+# Error codes AWS services use when a request was throttled rather than failed
+THROTTLING_ERROR_CODES = {
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'TooManyRequestsException',
+    'SlowDown'
+}
+
+# Retry-After value -> shared JSON headers carrying it
+_retry_after_headers = {}
+
+
+def response(status_code, body, headers=JSON_HEADERS, is_base64_encoded=False):
+    result = {
+        'statusCode': status_code,
+        'headers': headers,
+        'body': body
+    }
+    if is_base64_encoded:
+        result['isBase64Encoded'] = True
+    return result
+
+
+def json_response(status_code, payload):
+    return response(status_code, json.dumps(payload))
+
+
+def error_response(status_code, message):
+    return json_response(status_code, {'error': message})
+
+
+def retry_after_headers(seconds):
+    headers = _retry_after_headers.get(seconds)
+    if headers is None:
+        headers = _retry_after_headers[seconds] = dict(JSON_HEADERS, **{'Retry-After': str(seconds)})
+    return headers
+
+
+def overloaded(retry_after=None):
+    return response(503, OVERLOADED_BODY, retry_after_headers(retry_after or OVERLOAD_RETRY_AFTER_SECONDS))
+
+
+def is_throttled(e):
+    # True if e, or an error it was raised from, is an AWS throttling error.
+    # Handlers re-raise ClientErrors as plain Exceptions, so follow the chain.
+    while e is not None:
+        details = getattr(e, 'response', None)
+        if isinstance(details, dict) and details.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+            return True
+        e = e.__cause__ or e.__context__
+    return False
+
+
+def server_error(e):
+    # A throttled dependency is overload, not a server fault: tell the
+    # client when to retry instead of returning a generic 500
+    if is_throttled(e):
+        return overloaded()
+    return error_response(500, f'Internal server error: {str(e)}')
+
+
+def request_body(event):
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+    return body
+
+
+def header(event, name):
+    # API Gateway v2 lowercases header names; v1 events keep the client's case
+    headers = event.get('headers') or {}
+    value = headers.get(name.lower())
+    if value is None:
+        value = next((v for k, v in headers.items() if k.lower() == name.lower()), None)
+    return value
+
+
+def accepted_encodings(event, supported):
+    # The encodings in `supported` (server preference order) that the
+    # request's Accept-Encoding allows, best first. Identity is always
+    # acceptable and is not listed.
+    weights = {}
+    for part in (header(event, 'Accept-Encoding') or '').split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params.split(';'):
+            param = param.strip()
+            if param.startswith('q='):
+                try:
+                    weight = float(param[2:])
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+    
+    wildcard = weights.get('*', 0.0)
+    ranked = sorted(
+        ((weights.get(encoding, wildcard), -i, encoding) for i, encoding in enumerate(supported)),
+        reverse=True
+    )
+    return [encoding for weight, _, encoding in ranked if weight > 0]
+
+
+def etag_matches(if_none_match, etag):
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def clean_user_id(value):
+    # The userId as stored, or None if it is not a usable userId. Every
+    # writer (routes, queue consumer, import tool) validates through this.
+    if not isinstance(value, str):
+        return None
+    return value.strip() or None
+
+
+def user_id_param(query_params):
+    # Returns (userId, None) for a usable userId query parameter, otherwise
+    # (None, the 400 response to send)
+    if not query_params or 'userId' not in query_params:
+        return None, response(400, MISSING_USER_ID_BODY)
+    
+    user_id = clean_user_id(query_params['userId'])
+    if not user_id:
+        return None, response(400, EMPTY_USER_ID_BODY)
+    return user_id, None
+
+
+# Full jitter exponential backoff between retries of unprocessed batch items,
+# shared by the batch paths and the users_transfer import
+BATCH_BACKOFF_BASE_SECONDS = 0.05
+BATCH_BACKOFF_CAP_SECONDS = 2.0
+
+
+def backoff(attempt):
+    time.sleep(random.uniform(0, min(BATCH_BACKOFF_CAP_SECONDS, BATCH_BACKOFF_BASE_SECONDS * 2 ** attempt)))
+
+
+# Registration items, as written by every writer.
+#
+# registeredAt is a UTC timestamp with millisecond precision and a Z suffix,
+# so every value has the same width and string order is time order.
+# registeredDate (its UTC day and a shard, e.g. 2026-03-01#3) partitions the
+# REGISTERED_AT_INDEX global secondary index, which lets GET /users read a
+# time range with a Query per shard and day instead of a Scan. The shard is
+# a stable hash of the userId, so one day's registrations spread over
+# REGISTERED_AT_SHARDS partitions instead of all landing on one; every
+# writer and reader must use the same count. With REGISTRATION_TTL_DAYS
+# set, items also get an expiresAt epoch for DynamoDB TTL; TTL deletes
+# lazily, so readers treat an item past its expiresAt as gone (see
+# is_expired).
+REGISTERED_AT_INDEX = os.environ.get('REGISTERED_AT_INDEX', 'registeredAt-index')
+REGISTERED_AT_SHARDS = int(os.environ.get('REGISTERED_AT_SHARDS', '4'))
+# 0 keeps registrations forever
+REGISTRATION_TTL_DAYS = float(os.environ.get('REGISTRATION_TTL_DAYS', '0'))
+
+
+def utc_timestamp(moment=None):
+    moment = (moment or datetime.now(timezone.utc)).astimezone(timezone.utc)
+    return moment.isoformat(timespec='milliseconds')[:23] + 'Z'
+
+
+def parse_timestamp(value):
+    # An aware UTC datetime for an ISO 8601 date or date-time, or None.
+    # Naive values (registeredAt before it was written in UTC) are taken as
+    # UTC, which is the Lambda runtime's local time.
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if value.endswith(('Z', 'z')):
+        value = value[:-1] + '+00:00'
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+def registration_partition(day, shard):
+    return f'{day}#{shard}'
+
+
+def registration_shard(user_id):
+    return zlib.crc32(user_id.encode('utf-8')) % REGISTERED_AT_SHARDS
+
+
+def registration_item(user_id, registered_at):
+    # Low-level item for a user registered at `registered_at`. Timestamps
+    # that cannot be parsed are stored as given and left out of the index.
+    item = {'userId': {'S': user_id}, 'registeredAt': {'S': registered_at}}
+    moment = parse_timestamp(registered_at)
+    if moment is None:
+        return item
+    registered_at = utc_timestamp(moment)
+    item['registeredAt'] = {'S': registered_at}
+    item['registeredDate'] = {'S': registration_partition(registered_at[:10], registration_shard(user_id))}
+    if REGISTRATION_TTL_DAYS > 0:
+        expires_at = moment + timedelta(days=REGISTRATION_TTL_DAYS)
+        item['expiresAt'] = {'N': str(int(expires_at.timestamp()))}
+    return item
+
+
+def is_expired(item, now=None):
+    # True if a low-level item read back has passed its expiresAt
+    expires_at = item.get('expiresAt')
+    if not expires_at:
+        return False
+    return float(expires_at['N']) <= (now if now is not None else time.time())
@@ -0,0 +1,49 @@
+import time
+
+_import_started = time.perf_counter()
+
+import os
+import logging
+
+import aws_clients
+import bloom_filter
+import metrics
+
+# Scheduled builder for the Bloom filter snapshot of registered users (see
+# bloom_filter.py).
+#
+# verify_user stops trusting a snapshot once it is older than
+# BLOOM_MAX_AGE_SECONDS, so an EventBridge rule (bloom_builder_lambda in
+# infra/main.tf) rebuilds and publishes it well inside that age. deploy.sh
+# still publishes one straight after each deploy. Failures are raised so
+# the invocation is retried and shows up in the function's error metrics.
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+BLOOM_FILTER_KEY = os.environ.get('BLOOM_FILTER_KEY', 'bloom/users.bloom')
+BLOOM_FALSE_POSITIVE_RATE = float(os.environ.get('BLOOM_FALSE_POSITIVE_RATE', '0.01'))
+
+
+@metrics.instrumented('bloom_builder')
+def lambda_handler(event, context):
+    table_name = os.environ.get('DYNAMODB_TABLE')
+    s3_bucket = os.environ.get('S3_BUCKET')
+    if not table_name:
+        raise Exception("DYNAMODB_TABLE environment variable not set")
+    if not s3_bucket:
+        raise Exception("S3_BUCKET environment variable not set")
+
+    with metrics.phase('DynamoDB'):
+        bloom = bloom_filter.build_snapshot(aws_clients.get_client('dynamodb'), table_name, BLOOM_FALSE_POSITIVE_RATE)
+    with metrics.phase('S3'):
+        version = bloom_filter.publish_snapshot(aws_clients.get_client('s3'), s3_bucket, BLOOM_FILTER_KEY, bloom)
+
+    logger.info(f"Published Bloom filter with {bloom.count} users ({len(bloom.bits)} bytes) "
+                f"to s3://{s3_bucket}/{BLOOM_FILTER_KEY} version {version}")
+    metrics.set_metric('BloomUsers', bloom.count)
+    metrics.set_outcome('published')
+    return {'users': bloom.count, 'bytes': len(bloom.bits), 'version': version}
+
+
+aws_clients.record_import('bloom_builder', _import_started)
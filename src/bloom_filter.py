@@ -0,0 +1,263 @@
+import os
+import sys
+import math
+import time
+import struct
+import hashlib
+import logging
+import argparse
+from botocore.exceptions import ClientError
+
+# Bloom-filter snapshot of registered userIds.
+#
+# A builder scans the users table and publishes the filter to S3 as a
+# versioned binary object. verify_user loads it at container start and
+# refreshes it periodically; a userId that is absent from both the filter
+# and the registration delta is definitely not registered and can be
+# answered without a DynamoDB lookup.
+#
+# The delta closes the gap between snapshots. register_user writes a
+# delta entry alongside the user item and reports a new user registered
+# only once both writes succeeded (bulk registration, the registration
+# consumer and imports write the delta entries first), so every user
+# reported registered is either in a snapshot taken after their
+# registration or in the delta. A user whose delta write failed may read
+# as absent until the failed request is retried or the next snapshot. Delta
+# entries are range keys ordered by registration time, which lets verify
+# read only the entries newer than its snapshot, and they expire through
+# DynamoDB TTL once no acceptable snapshot can predate them.
+
+logger = logging.getLogger()
+
+MAGIC = b'UBF1'
+HEADER = struct.Struct('>4sBQQd')
+
+DELTA_PARTITION = 'delta'
+
+# verify_user stops trusting a snapshot older than this; delta entries are
+# kept at least this long (plus margin) so they outlive any trusted snapshot
+BLOOM_MAX_AGE_SECONDS = float(os.environ.get('BLOOM_MAX_AGE_SECONDS', '3600'))
+
+# Upper bound on a register_user invocation (Lambda timeout) plus clock skew:
+# a user whose delta entry is older than this is guaranteed to be in the table
+BLOOM_MARGIN_SECONDS = 60
+
+
+class BloomFilter:
+
+    def __init__(self, num_bits, num_hashes, count=0, snapshot_at=0.0, bits=None):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.count = count
+        self.snapshot_at = snapshot_at
+        self.bits = bits if bits is not None else bytearray((num_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, false_positive_rate=0.01, snapshot_at=0.0):
+        capacity = max(capacity, 1)
+        num_bits = max(8, int(math.ceil(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2))))
+        num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+        return cls(num_bits, num_hashes, snapshot_at=snapshot_at)
+
+    def _positions(self, user_id):
+        # Kirsch-Mitzenmacher double hashing over one 128-bit digest
+        digest = hashlib.blake2b(user_id.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, user_id):
+        for position in self._positions(user_id):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, user_id):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(user_id))
+
+    def to_bytes(self):
+        header = HEADER.pack(MAGIC, self.num_hashes, self.num_bits, self.count, self.snapshot_at)
+        return header + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, num_hashes, num_bits, count, snapshot_at = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a userId Bloom filter snapshot")
+        bits = memoryview(data)[HEADER.size:]
+        if len(bits) != (num_bits + 7) // 8:
+            raise ValueError("Truncated Bloom filter snapshot")
+        return cls(num_bits, num_hashes, count, snapshot_at, bits)
+
+
+def _delta_entry(timestamp, user_id):
+    # Millisecond timestamps zero-padded so entries sort by registration time
+    return f"{int(timestamp * 1000):013d}#{user_id}"
+
+
+def delta_item(user_id):
+    now = time.time()
+    return {
+        'shard': {'S': DELTA_PARTITION},
+        'entry': {'S': _delta_entry(now, user_id)},
+        'expiresAt': {'N': str(int(now + BLOOM_MAX_AGE_SECONDS + 2 * BLOOM_MARGIN_SECONDS))}
+    }
+
+
+def delta_user_id(item):
+    return item['entry']['S'].split('#', 1)[1]
+
+
+def record_registration(dynamodb_client, delta_table_name, user_id):
+    # Called by register_user alongside the user item write
+    dynamodb_client.put_item(TableName=delta_table_name, Item=delta_item(user_id))
+
+
+def read_delta_since(dynamodb_client, delta_table_name, since):
+    # Returns the userIds registered at or after `since` (epoch seconds)
+    user_ids = set()
+    request = {
+        'TableName': delta_table_name,
+        'KeyConditionExpression': '#shard = :shard AND #entry >= :since',
+        'ExpressionAttributeNames': {'#shard': 'shard', '#entry': 'entry'},
+        'ExpressionAttributeValues': {
+            ':shard': {'S': DELTA_PARTITION},
+            ':since': {'S': _delta_entry(max(since, 0), '')}
+        },
+        'ProjectionExpression': '#entry',
+        'ConsistentRead': True
+    }
+    while True:
+        response = dynamodb_client.query(**request)
+        for item in response.get('Items', []):
+            user_ids.add(delta_user_id(item))
+        if 'LastEvaluatedKey' not in response:
+            return user_ids
+        request['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+class BloomMembership:
+    # Per-container view of the published snapshot plus the delta. Only
+    # answers "definitely not registered"; anything else falls through to
+    # the normal lookup.
+
+    def __init__(self, s3, bucket, key, dynamodb_client, delta_table_name, refresh_seconds, delta_refresh_seconds):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.dynamodb = dynamodb_client
+        self.delta_table_name = delta_table_name
+        self.refresh_seconds = refresh_seconds
+        self.delta_refresh_seconds = delta_refresh_seconds
+        self.filter = None
+        self.etag = None
+        self.checked_at = None
+        self.delta = set()
+        self.delta_read_at = None
+        self.short_circuits = 0
+
+    def _refresh_filter(self, now):
+        request = {'Bucket': self.bucket, 'Key': self.key}
+        if self.etag:
+            request['IfNoneMatch'] = self.etag
+        self.checked_at = now
+        try:
+            response = self.s3.get_object(**request)
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code not in ('304', 'NotModified'):
+                logger.warning(f"Could not refresh Bloom filter snapshot: {str(e)}")
+            return
+
+        bloom = BloomFilter.from_bytes(response['Body'].read())
+        # Read the delta from just before the snapshot started; the snapshot
+        # is only swapped in once its delta has been read successfully
+        read_at = time.time()
+        delta = read_delta_since(self.dynamodb, self.delta_table_name, bloom.snapshot_at - BLOOM_MARGIN_SECONDS)
+        self.filter, self.etag, self.delta, self.delta_read_at = bloom, response.get('ETag'), delta, read_at
+        logger.info(f"Loaded Bloom filter snapshot with {bloom.count} users and {len(delta)} delta entries")
+
+    def _refresh_delta(self):
+        # Overlap the previous read so entries committed late are not missed
+        read_at = time.time()
+        self.delta |= read_delta_since(self.dynamodb, self.delta_table_name, self.delta_read_at - BLOOM_MARGIN_SECONDS)
+        self.delta_read_at = read_at
+
+    def definitely_absent(self, user_id):
+        now = time.monotonic()
+        if self.checked_at is None or now - self.checked_at >= self.refresh_seconds:
+            try:
+                self._refresh_filter(now)
+            except Exception as e:
+                # Keep the current snapshot, if any; the age check below
+                # stops it from being trusted once it is too old
+                logger.warning(f"Bloom filter refresh failed: {str(e)}")
+
+        if self.filter is None or user_id in self.filter:
+            return False
+        if time.time() - self.filter.snapshot_at > BLOOM_MAX_AGE_SECONDS:
+            return False
+
+        if user_id not in self.delta and time.time() - self.delta_read_at >= self.delta_refresh_seconds:
+            try:
+                self._refresh_delta()
+            except Exception as e:
+                logger.warning(f"Bloom delta refresh failed, falling back to lookup: {str(e)}")
+                return False
+        if user_id in self.delta:
+            return False
+
+        self.short_circuits += 1
+        return True
+
+
+def build_snapshot(dynamodb_client, table_name, false_positive_rate=0.01):
+    # Scans userIds with a key-only projection and returns a BloomFilter
+    snapshot_at = time.time()
+    user_ids = []
+    paginator = dynamodb_client.get_paginator('scan')
+    # Consistent reads so every item written before snapshot_at is included
+    for page in paginator.paginate(TableName=table_name, ProjectionExpression='userId', ConsistentRead=True):
+        user_ids.extend(item['userId']['S'] for item in page.get('Items', []))
+
+    bloom = BloomFilter.for_capacity(len(user_ids), false_positive_rate, snapshot_at)
+    for user_id in user_ids:
+        bloom.add(user_id)
+    return bloom
+
+
+def publish_snapshot(s3, bucket, key, bloom):
+    # The static bucket is versioned, so each publish keeps the previous
+    # snapshot as a noncurrent version
+    response = s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=bloom.to_bytes(),
+        ContentType='application/octet-stream',
+        Metadata={'snapshot-at': repr(bloom.snapshot_at), 'user-count': str(bloom.count)}
+    )
+    return response.get('VersionId')
+
+
+def main(argv=None):
+    import aws_clients
+
+    parser = argparse.ArgumentParser(description='Build and publish the registered-users Bloom filter snapshot')
+    parser.add_argument('--table', default=os.environ.get('DYNAMODB_TABLE'), help='Users table name')
+    parser.add_argument('--bucket', default=os.environ.get('S3_BUCKET'), help='Bucket to publish the snapshot to')
+    parser.add_argument('--key', default=os.environ.get('BLOOM_FILTER_KEY', 'bloom/users.bloom'), help='Snapshot object key')
+    parser.add_argument('--false-positive-rate', type=float, default=0.01)
+    args = parser.parse_args(argv)
+
+    if not args.table or not args.bucket:
+        parser.error('--table and --bucket (or DYNAMODB_TABLE and S3_BUCKET) are required')
+
+    bloom = build_snapshot(aws_clients.get_client('dynamodb'), args.table, args.false_positive_rate)
+    version = publish_snapshot(aws_clients.get_client('s3'), args.bucket, args.key, bloom)
+    print(f"Published Bloom filter with {bloom.count} users "
+          f"({len(bloom.bits)} bytes, {bloom.num_hashes} hashes) to s3://{args.bucket}/{args.key} version {version}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,351 @@
+import os
+import re
+import ast
+import sys
+import json
+import shutil
+import zipfile
+import argparse
+import tempfile
+import subprocess
+import py_compile
+
+# Builds the Lambda deployment packages.
+#
+# A package holds its entry modules and every module under src/ they import,
+# found by parsing the import statements, so there is no file list to keep
+# in step with the code. Libraries the Lambda Python runtime already
+# provides (boto3 and its dependencies) are left out: a bundled copy only
+# makes the zip bigger and shadows the runtime's copy. With
+# --dependencies layer they go into a separate layer zip instead, for when
+# the pinned versions in requirements.txt are needed.
+#
+# Sources are precompiled to unchecked-hash .pyc files (the function's
+# filesystem is read-only, so Python cannot cache bytecode there itself),
+# installed libraries are stripped of tests and packaging metadata, and
+# every zip entry gets a fixed timestamp and mode in sorted order, so the
+# same tree always builds byte-identical zips and Terraform only redeploys
+# real changes. A report of package sizes and `python -X importtime` for
+# each entry module is written next to the zips.
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT_DIR = os.path.join(SRC_DIR, '..', 'infra', 'modules', 'lambda')
+REQUIREMENTS_FILE = os.path.join(SRC_DIR, 'requirements.txt')
+
+# Package name -> entry modules (the handlers deployed from that zip)
+PACKAGES = {
+    'user_api': ('user_api', 'registration_consumer', 'bloom_builder')
+}
+
+DEFAULT_RUNTIME = 'python3.9'
+
+# Distributions the Lambda Python runtime provides
+RUNTIME_PROVIDED = {'boto3', 'botocore', 's3transfer', 'jmespath', 'python-dateutil', 'six', 'urllib3'}
+
+LAYER_NAME = 'dependencies_layer'
+
+# Where Lambda unpacks the function and layer zips
+TASK_ROOT = '/var/task/'
+LAYER_ROOT = '/opt/python/'
+
+# Removed from installed libraries
+STRIP_DIRS = {'tests', 'test', '__pycache__'}
+STRIP_DIR_SUFFIXES = ('.dist-info', '.egg-info')
+STRIP_FILE_SUFFIXES = ('.pyc', '.pyo', '.pyi')
+
+# 1980-01-01, the earliest timestamp a zip entry can hold
+ZIP_TIMESTAMP = (1980, 1, 1, 0, 0, 0)
+ZIP_FILE_MODE = 0o644 << 16
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)$')
+IMPORTTIME_TOP = 10
+
+
+def local_imports(module_name, src_dir=SRC_DIR):
+    # The modules under src_dir that module_name imports, directly or not,
+    # including itself. Imports inside functions and try blocks count.
+    found = set()
+    pending = [module_name]
+    while pending:
+        name = pending.pop()
+        path = os.path.join(src_dir, f'{name}.py')
+        if name in found or not os.path.isfile(path):
+            continue
+        found.add(name)
+        with open(path, encoding='utf-8') as f:
+            tree = ast.parse(f.read(), filename=path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                pending.extend(alias.name.split('.')[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                pending.append(node.module.split('.')[0])
+    return found
+
+
+def package_modules(entries, src_dir=SRC_DIR):
+    modules = set()
+    for entry in entries:
+        if not os.path.isfile(os.path.join(src_dir, f'{entry}.py')):
+            raise ValueError(f"Entry module {entry} not found in {src_dir}")
+        modules |= local_imports(entry, src_dir)
+    return sorted(modules)
+
+
+def read_requirements(path=REQUIREMENTS_FILE):
+    # Returns (runtime-provided, other) requirement lines
+    provided, other = [], []
+    if not os.path.isfile(path):
+        return provided, other
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            requirement = line.split('#', 1)[0].strip()
+            if not requirement:
+                continue
+            name = re.split(r'[\s<>=!~;\[]', requirement, 1)[0].lower().replace('_', '-')
+            (provided if name in RUNTIME_PROVIDED else other).append(requirement)
+    return provided, other
+
+
+def runtime_version(runtime):
+    match = re.fullmatch(r'python(\d+)\.(\d+)', runtime)
+    if not match:
+        raise ValueError(f"Unsupported runtime {runtime}")
+    return int(match.group(1)), int(match.group(2))
+
+
+def can_precompile(runtime):
+    # Bytecode is only used by the interpreter version that wrote it
+    return sys.version_info[:2] == runtime_version(runtime)
+
+
+def precompile(directory, deployed_path):
+    # Unchecked-hash .pyc files do not embed the source mtime, so they are
+    # reproducible and are never revalidated against the source. Code
+    # objects get the deployed file name (for tracebacks) rather than the
+    # temporary build path.
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith('.py'):
+                path = os.path.join(root, name)
+                py_compile.compile(
+                    path,
+                    dfile=deployed_path + os.path.relpath(path, directory).replace(os.sep, '/'),
+                    doraise=True,
+                    invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH
+                )
+
+
+def strip_tree(directory):
+    # Removes tests, caches and packaging metadata from installed libraries;
+    # returns the number of bytes removed
+    removed = 0
+    for root, dirs, files in os.walk(directory, topdown=True):
+        for name in list(dirs):
+            if name in STRIP_DIRS or name.endswith(STRIP_DIR_SUFFIXES):
+                path = os.path.join(root, name)
+                removed += tree_size(path)
+                shutil.rmtree(path)
+                dirs.remove(name)
+        for name in files:
+            if name.endswith(STRIP_FILE_SUFFIXES):
+                path = os.path.join(root, name)
+                removed += os.path.getsize(path)
+                os.remove(path)
+    return removed
+
+
+def tree_size(directory):
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(directory) for name in files
+    )
+
+
+def write_zip(directory, zip_path, prefix=''):
+    # Sorted entries with a fixed timestamp and mode: same tree, same bytes
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in files)
+    with zipfile.ZipFile(zip_path, 'w') as archive:
+        for path in sorted(paths, key=lambda p: os.path.relpath(p, directory).replace(os.sep, '/')):
+            info = zipfile.ZipInfo(prefix + os.path.relpath(path, directory).replace(os.sep, '/'), ZIP_TIMESTAMP)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = ZIP_FILE_MODE
+            with open(path, 'rb') as f:
+                archive.writestr(info, f.read(), compresslevel=9)
+
+
+def parse_importtime(stderr):
+    # Returns [(module, self_us, cumulative_us, depth)] from -X importtime
+    # output, in the order the imports finished
+    rows = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+def measure_imports(directory, module_name, extra_paths=()):
+    # Imports module_name from the built package in a fresh interpreter
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([directory, *extra_paths]), PYTHONDONTWRITEBYTECODE='1')
+    env.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    result = subprocess.run(
+        [sys.executable, '-s', '-X', 'importtime', '-c', f'import {module_name}'],
+        cwd=directory, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module_name} failed:\n{result.stderr.strip()[-2000:]}")
+    return import_summary(parse_importtime(result.stderr), module_name, directory)
+
+
+def import_summary(rows, module_name, directory):
+    # Total import time of module_name, the part spent in the package's own
+    # modules, and its slowest direct imports. Interpreter start-up imports
+    # (site, encodings) are listed before it at depth 0 and are left out.
+    end = next((i for i, row in enumerate(rows) if row[0] == module_name and row[3] == 0), None)
+    if end is None:
+        raise RuntimeError(f"No import time reported for {module_name}")
+    start = end
+    while start > 0 and rows[start - 1][3] > 0:
+        start -= 1
+    imported = rows[start:end + 1]
+    local = {name[:-len('.py')] for name in os.listdir(directory) if name.endswith('.py')}
+    return {
+        'total_ms': round(rows[end][2] / 1000, 2),
+        'local_ms': round(sum(self_us for name, self_us, _, _ in imported if name in local) / 1000, 2),
+        'slowest': [
+            {'module': name, 'cumulative_ms': round(cumulative / 1000, 2)}
+            for name, _, cumulative, depth in sorted(imported, key=lambda row: -row[2])
+            if depth == 1
+        ][:IMPORTTIME_TOP]
+    }
+
+
+def measure_or_error(directory, module_name, extra_paths=()):
+    # The measurement imports the runtime-provided libraries from this
+    # interpreter; a build host without boto3 still gets its zips
+    try:
+        return measure_imports(directory, module_name, extra_paths)
+    except RuntimeError as e:
+        print(f"Could not measure imports of {module_name}: {str(e)}", file=sys.stderr)
+        return {'error': str(e).splitlines()[-1]}
+
+
+def build_package(name, entries, output_dir, work_dir, src_dir=SRC_DIR, precompiled=True):
+    staging = os.path.join(work_dir, name)
+    os.makedirs(staging)
+    modules = package_modules(entries, src_dir)
+    for module in modules:
+        shutil.copyfile(os.path.join(src_dir, f'{module}.py'), os.path.join(staging, f'{module}.py'))
+    if precompiled:
+        precompile(staging, TASK_ROOT)
+
+    zip_path = os.path.join(output_dir, f'{name}.zip')
+    write_zip(staging, zip_path)
+    return staging, {
+        'zip': os.path.relpath(zip_path),
+        'modules': modules,
+        'zip_bytes': os.path.getsize(zip_path),
+        'unpacked_bytes': tree_size(staging),
+        'precompiled': precompiled
+    }
+
+
+def build_layer(requirements, output_dir, runtime, work_dir):
+    # Lambda adds /opt/python to sys.path, so the layer's libraries go
+    # under python/
+    staging = os.path.join(work_dir, LAYER_NAME)
+    major, minor = runtime_version(runtime)
+    subprocess.run(
+        [sys.executable, '-m', 'pip', 'install', '--quiet', '--no-compile', '--target', staging,
+         '--platform', 'manylinux2014_x86_64', '--implementation', 'cp',
+         '--python-version', f'{major}.{minor}', '--only-binary=:all:', *requirements],
+        check=True
+    )
+    stripped = strip_tree(staging)
+    if can_precompile(runtime):
+        precompile(staging, LAYER_ROOT)
+
+    zip_path = os.path.join(output_dir, f'{LAYER_NAME}.zip')
+    write_zip(staging, zip_path, prefix='python/')
+    return staging, {
+        'zip': os.path.relpath(zip_path),
+        'requirements': requirements,
+        'zip_bytes': os.path.getsize(zip_path),
+        'unpacked_bytes': tree_size(staging),
+        'stripped_bytes': stripped
+    }
+
+
+def build(output_dir, runtime=DEFAULT_RUNTIME, dependencies='runtime', packages=PACKAGES,
+          src_dir=SRC_DIR, requirements_file=REQUIREMENTS_FILE, measure=True):
+    os.makedirs(output_dir, exist_ok=True)
+    precompiled = can_precompile(runtime)
+    if not precompiled:
+        print(f"Skipping bytecode: this is Python {sys.version_info[0]}.{sys.version_info[1]}, "
+              f"the functions run {runtime}", file=sys.stderr)
+
+    provided, other = read_requirements(requirements_file)
+    layer_requirements = other + (provided if dependencies == 'layer' else [])
+    report = {'runtime': runtime, 'packages': {}, 'runtime_provided': [] if dependencies == 'layer' else provided}
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        layer_dir = None
+        if layer_requirements:
+            layer_dir, report['layer'] = build_layer(layer_requirements, output_dir, runtime, work_dir)
+        for name, entries in packages.items():
+            staging, package_report = build_package(name, entries, output_dir, work_dir, src_dir, precompiled)
+            if measure:
+                package_report['imports'] = {
+                    entry: measure_or_error(staging, entry, [layer_dir] if layer_dir else []) for entry in entries
+                }
+            report['packages'][name] = package_report
+
+    with open(os.path.join(output_dir, 'build_report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def format_report(report):
+    lines = []
+    for name, package in report['packages'].items():
+        lines.append(f"{package['zip']}: {package['zip_bytes'] / 1024:.1f} KiB zipped, "
+                     f"{package['unpacked_bytes'] / 1024:.1f} KiB unpacked, {len(package['modules'])} modules")
+        for entry, imports in package.get('imports', {}).items():
+            if 'error' in imports:
+                lines.append(f"  import {entry}: not measured ({imports['error']})")
+                continue
+            slowest = ', '.join(f"{row['module']} {row['cumulative_ms']} ms" for row in imports['slowest'][:3])
+            lines.append(f"  import {entry}: {imports['total_ms']} ms "
+                         f"({imports['local_ms']} ms in our modules; slowest: {slowest})")
+    if 'layer' in report:
+        layer = report['layer']
+        lines.append(f"{layer['zip']}: {layer['zip_bytes'] / 1024:.1f} KiB zipped, "
+                     f"{layer['stripped_bytes'] / 1024:.1f} KiB stripped, {', '.join(layer['requirements'])}")
+    if report['runtime_provided']:
+        lines.append(f"Left to the runtime: {', '.join(report['runtime_provided'])}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build reproducible, minimal Lambda deployment packages')
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR, help='Where the zips and build_report.json go')
+    parser.add_argument('--runtime', default=DEFAULT_RUNTIME, help='Lambda runtime the packages are for')
+    parser.add_argument('--dependencies', choices=('runtime', 'layer'), default='runtime',
+                        help='Use the runtime-provided boto3, or package requirements.txt as a layer')
+    parser.add_argument('--no-report', action='store_true', help='Skip the -X importtime measurements')
+    args = parser.parse_args(argv)
+
+    try:
+        report = build(args.output_dir, args.runtime, args.dependencies, measure=not args.no_report)
+    except (ValueError, subprocess.CalledProcessError) as e:
+        print(f"Build failed: {str(e)}", file=sys.stderr)
+        return 1
+    print(format_report(report))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,259 @@
+import time
+
+_import_started = time.perf_counter()
+
+import json
+import os
+import base64
+import logging
+from datetime import datetime, timedelta, timezone
+from botocore.exceptions import ClientError
+
+import api_common
+import aws_clients
+import metrics
+import resilience
+
+# GET /users?from=...&to=...&limit=...&cursor=...
+#
+# Lists the users registered in a time range, oldest first (order=desc for
+# newest first), from the registration time index (REGISTERED_AT_INDEX in
+# api_common). The index is partitioned by UTC day and shard, so a range is
+# read with one key-condition Query per shard and day, each limited to the
+# rows the page still needs and projected to userId, registeredAt and
+# expiresAt, and the shards of a day are merged by registeredAt; the table
+# is never scanned. A page ends after `limit` users or before a round of
+# shard queries would pass LIST_USERS_MAX_QUERIES, and nextCursor resumes
+# from the day and each shard's index key where it stopped. The cursor is
+# opaque to clients and carries the range and order, so a request with a
+# cursor ignores from, to and order.
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+LIST_USERS_DEFAULT_LIMIT = int(os.environ.get('LIST_USERS_DEFAULT_LIMIT', '50'))
+LIST_USERS_MAX_LIMIT = int(os.environ.get('LIST_USERS_MAX_LIMIT', '500'))
+# Range listed when `from` is omitted, and the longest range accepted
+LIST_USERS_DEFAULT_DAYS = int(os.environ.get('LIST_USERS_DEFAULT_DAYS', '7'))
+LIST_USERS_MAX_DAYS = int(os.environ.get('LIST_USERS_MAX_DAYS', '366'))
+# Bounds the work per request when the range holds many empty days
+LIST_USERS_MAX_QUERIES = int(os.environ.get('LIST_USERS_MAX_QUERIES', '32'))
+
+ORDERS = ('asc', 'desc')
+
+
+def _bound(name, value, end):
+    # A date-only `to` covers the whole day
+    moment = api_common.parse_timestamp(value)
+    if moment is None:
+        raise ValueError(f"{name} must be an ISO 8601 date or date-time")
+    if end and len(value.strip()) == 10:
+        moment += timedelta(days=1, milliseconds=-1)
+    return moment
+
+
+def parse_range(query_params):
+    # Returns (from, to, order) as stored timestamps. Raises ValueError.
+    now = datetime.now(timezone.utc)
+    end = _bound('to', query_params['to'], True) if query_params.get('to') else now
+    if query_params.get('from'):
+        start = _bound('from', query_params['from'], False)
+    else:
+        start = end - timedelta(days=LIST_USERS_DEFAULT_DAYS)
+    if start > end:
+        raise ValueError("from must not be later than to")
+    if end - start > timedelta(days=LIST_USERS_MAX_DAYS):
+        raise ValueError(f"The range must not exceed {LIST_USERS_MAX_DAYS} days")
+    
+    order = query_params.get('order') or 'asc'
+    if order not in ORDERS:
+        raise ValueError("order must be asc or desc")
+    return api_common.utc_timestamp(start), api_common.utc_timestamp(end), order
+
+
+def parse_limit(query_params):
+    value = query_params.get('limit')
+    if not value:
+        return LIST_USERS_DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= LIST_USERS_MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {LIST_USERS_MAX_LIMIT}")
+    return limit
+
+
+def registration_days(start, end, order):
+    first = datetime.strptime(start[:10], '%Y-%m-%d')
+    days = [
+        (first + timedelta(days=i)).strftime('%Y-%m-%d')
+        for i in range((datetime.strptime(end[:10], '%Y-%m-%d') - first).days + 1)
+    ]
+    return days if order == 'asc' else days[::-1]
+
+
+def encode_cursor(state):
+    encoded = base64.urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode('utf-8'))
+    return encoded.decode('ascii').rstrip('=')
+
+
+def _is_position(position):
+    return position is None or (isinstance(position, list) and len(position) in (0, 2)
+                                and all(isinstance(v, str) for v in position))
+
+
+def decode_cursor(value):
+    # The listing state a cursor resumes. Raises ValueError if it was not
+    # produced by encode_cursor for a valid range.
+    try:
+        state = json.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))
+        start, end, order, day, after = (state[k] for k in ('from', 'to', 'order', 'day', 'after'))
+        valid = (
+            api_common.utc_timestamp(api_common.parse_timestamp(start)) == start
+            and api_common.utc_timestamp(api_common.parse_timestamp(end)) == end
+            and start <= end
+            and order in ORDERS
+            and day in registration_days(start, end, order)
+            and (after is None or (isinstance(after, list) and len(after) == api_common.REGISTERED_AT_SHARDS
+                                   and all(_is_position(position) for position in after)))
+        )
+    except Exception:
+        valid = False
+    if not valid:
+        raise ValueError("Invalid cursor")
+    return state
+
+
+def _query_shard(dynamodb, table_name, start, end, order, limit, day, shard, after):
+    # One page of a shard's registrations on `day`, resuming after the
+    # [userId, registeredAt] position `after` if it is not empty
+    request = {
+        'TableName': table_name,
+        'IndexName': api_common.REGISTERED_AT_INDEX,
+        'KeyConditionExpression': 'registeredDate = :day AND registeredAt BETWEEN :from AND :to',
+        'ExpressionAttributeValues': {
+            ':day': {'S': api_common.registration_partition(day, shard)}, ':from': {'S': start}, ':to': {'S': end}
+        },
+        'ProjectionExpression': 'userId, registeredAt, expiresAt',
+        'ScanIndexForward': order == 'asc',
+        'Limit': limit
+    }
+    if after:
+        request['ExclusiveStartKey'] = {
+            'userId': {'S': after[0]},
+            'registeredAt': {'S': after[1]},
+            'registeredDate': {'S': api_common.registration_partition(day, shard)}
+        }
+    return resilience.call('DynamoDB', lambda: dynamodb.query(**request))
+
+
+def list_registrations(table_name, start, end, order, limit, day=None, after=None):
+    # Returns (users, state for the next page or None when the range is
+    # exhausted). `day` and `after` resume a previous page; `after` holds
+    # one position per shard: [] to read the shard from the start,
+    # [userId, registeredAt] of the last user taken from it, or None once
+    # it is exhausted.
+    dynamodb = aws_clients.get_client('dynamodb')
+    shards = api_common.REGISTERED_AT_SHARDS
+    days = registration_days(start, end, order)
+    if day is not None:
+        days = days[days.index(day):]
+    
+    users = []
+    queries = 0
+    now = time.time()
+    for day in days:
+        positions = after or [[] for _ in range(shards)]
+        while True:
+            open_shards = [shard for shard in range(shards) if positions[shard] is not None]
+            if not open_shards:
+                after = None
+                break
+            if len(users) >= limit or (queries and queries + len(open_shards) > LIST_USERS_MAX_QUERIES):
+                return users, {'from': start, 'to': end, 'order': order, 'day': day, 'after': positions}
+            
+            # Each open shard returns up to the rows the page still needs, in
+            # index order; merging them by registeredAt gives the day's rows
+            # in order. The sort is stable, so rows of one shard keep their
+            # relative order and the last one taken is a valid start key.
+            needed = limit - len(users)
+            fetched = []
+            exhausted = set()
+            for shard in open_shards:
+                response = _query_shard(dynamodb, table_name, start, end, order, needed, day, shard, positions[shard])
+                queries += 1
+                metrics.put_metric('ListQueries', 1)
+                fetched.extend((item, shard) for item in response.get('Items', []))
+                if not response.get('LastEvaluatedKey'):
+                    exhausted.add(shard)
+            fetched.sort(key=lambda row: row[0]['registeredAt']['S'], reverse=order == 'desc')
+            
+            for item, shard in fetched[:needed]:
+                positions[shard] = [item['userId']['S'], item['registeredAt']['S']]
+                if not api_common.is_expired(item, now):
+                    users.append({'userId': item['userId']['S'], 'registeredAt': item['registeredAt']['S']})
+            left = {shard for _, shard in fetched[needed:]}
+            for shard in exhausted - left:
+                positions[shard] = None
+    return users, None
+
+
+def handle_list(event, context):
+    # GET /users, behind the user_api router
+    try:
+        metrics.log_event(event)
+        
+        table_name = os.environ.get('DYNAMODB_TABLE')
+        if not table_name:
+            raise Exception("DYNAMODB_TABLE environment variable not set")
+        
+        query_params = event.get('queryStringParameters') or {}
+        logger.info(f"Query parameters: {query_params}")
+        
+        validation_started = time.perf_counter()
+        try:
+            limit = parse_limit(query_params)
+            if query_params.get('cursor'):
+                state = decode_cursor(query_params['cursor'])
+            else:
+                start, end, order = parse_range(query_params)
+                state = {'from': start, 'to': end, 'order': order, 'day': None, 'after': None}
+        except ValueError as e:
+            metrics.set_outcome('bad_request')
+            return api_common.error_response(400, str(e))
+        metrics.add_timing('Validation', time.perf_counter() - validation_started)
+        
+        try:
+            with metrics.phase('DynamoDB'):
+                users, next_state = list_registrations(
+                    table_name, state['from'], state['to'], state['order'], limit, state['day'], state['after']
+                )
+        except ClientError as e:
+            logger.error(f"Error listing users in DynamoDB: {str(e)}")
+            raise Exception("Failed to list users in DynamoDB") from e
+        
+        logger.info(f"Listed {len(users)} users registered between {state['from']} and {state['to']}")
+        metrics.put_metric('ListedUsers', len(users))
+        metrics.set_outcome('listed')
+        
+        with metrics.phase('Serialization'):
+            body = json.dumps({
+                'from': state['from'],
+                'to': state['to'],
+                'users': users,
+                'nextCursor': encode_cursor(next_state) if next_state else None
+            }, separators=(',', ':'))
+        return api_common.response(200, body)
+    
+    except resilience.CircuitOpenError as e:
+        logger.warning(f"Failing fast: {str(e)}")
+        metrics.set_outcome('circuit_open')
+        return api_common.overloaded(e.retry_after)
+    except Exception as e:
+        logger.error(f"Error in lambda_handler: {str(e)}")
+        metrics.set_outcome('error')
+        return api_common.server_error(e)
+
+
+aws_clients.record_import('list_users', _import_started)
@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+
+import aws_clients
+
+# Per-request latency metrics in CloudWatch Embedded Metric Format (EMF).
+#
+# Each invocation writes one JSON record to stdout with the time spent in
+# each phase (validation, DynamoDB, S3, serialization), the total duration
+# and, on cold starts, the import and client-creation times. CloudWatch
+# extracts the metrics from the log line; no PutMetricData calls are made.
+
+logger = logging.getLogger()
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'UserManagement')
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+
+# Fraction of invocations whose full event is logged (0 disables it,
+# 1 logs every event). Full-event logging is expensive and off by default.
+LOG_EVENT_SAMPLE_RATE = float(os.environ.get('LOG_EVENT_SAMPLE_RATE', '0'))
+
+# Added to the response of the first invocation in each container
+COLD_START_HEADER = 'X-Cold-Start'
+
+_local = threading.local()
+
+
+class RequestMetrics:
+
+    def __init__(self, function_name, cold_start):
+        self.function_name = function_name
+        self.cold_start = cold_start
+        self.outcome = None
+        self.started = time.perf_counter()
+        self.values = {}
+        self.units = {}
+        self.properties = {}
+        self.lock = threading.Lock()
+
+    def put_metric(self, name, value, unit='Count'):
+        # Locked: worker threads running part of the request (see bound)
+        # record into the same instance
+        with self.lock:
+            self.values[name] = self.values.get(name, 0) + value
+            self.units[name] = unit
+
+    def set_metric(self, name, value, unit='None'):
+        # For gauges: the last value set wins instead of accumulating
+        with self.lock:
+            self.values[name] = value
+            self.units[name] = unit
+
+    def add_timing(self, phase, elapsed_seconds):
+        self.put_metric(f'{phase}Ms', round(elapsed_seconds * 1000, 3), 'Milliseconds')
+
+    def to_emf(self):
+        dimensions = {
+            'Function': self.function_name,
+            'Outcome': self.outcome or 'unknown',
+            'StartType': 'cold' if self.cold_start else 'warm'
+        }
+        record = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [['Function'], ['Function', 'Outcome'], ['Function', 'StartType']],
+                    'Metrics': [{'Name': name, 'Unit': self.units[name]} for name in self.values]
+                }]
+            }
+        }
+        record.update(self.properties)
+        record.update(self.values)
+        record.update(dimensions)
+        return record
+
+
+def current():
+    # The RequestMetrics of the invocation running on this thread, if any
+    return getattr(_local, 'metrics', None)
+
+
+@contextmanager
+def bound(request_metrics):
+    # Attributes metrics recorded on this thread, a worker running part of
+    # a request, to that request's RequestMetrics
+    previous = current()
+    _local.metrics = request_metrics
+    try:
+        yield
+    finally:
+        _local.metrics = previous
+
+
+@contextmanager
+def phase(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        request_metrics = current()
+        if request_metrics is not None:
+            request_metrics.add_timing(name, time.perf_counter() - started)
+
+
+def set_outcome(outcome):
+    request_metrics = current()
+    if request_metrics is not None:
+        request_metrics.outcome = outcome
+
+
+def put_metric(name, value, unit='Count'):
+    request_metrics = current()
+    if request_metrics is not None:
+        request_metrics.put_metric(name, value, unit)
+
+
+def set_metric(name, value, unit='None'):
+    request_metrics = current()
+    if request_metrics is not None:
+        request_metrics.set_metric(name, value, unit)
+
+
+def add_timing(name, elapsed_seconds):
+    request_metrics = current()
+    if request_metrics is not None:
+        request_metrics.add_timing(name, elapsed_seconds)
+
+
+def log_event(event):
+    if LOG_EVENT_SAMPLE_RATE > 0 and random.random() < LOG_EVENT_SAMPLE_RATE:
+        logger.info(f"Event received: {json.dumps(event)}")
+
+
+def _default_outcome(response):
+    status = response.get('statusCode', 500) if isinstance(response, dict) else 500
+    if status < 400:
+        return 'ok'
+    return 'client_error' if status < 500 else 'server_error'
+
+
+def instrumented(function_name):
+    # Decorator for lambda_handler: records the total duration, cold-start
+    # init timings and the outcome, then writes one EMF record
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            request_metrics = RequestMetrics(function_name, aws_clients.consume_cold_start())
+            _local.metrics = request_metrics
+            response = None
+            try:
+                response = handler(event, context)
+                if request_metrics.cold_start and isinstance(response, dict) and 'statusCode' in response:
+                    # Lets load tests count cold starts from the client side;
+                    # header dicts may be shared, so copy before adding
+                    response['headers'] = dict(response.get('headers') or {}, **{COLD_START_HEADER: 'true'})
+                return response
+            finally:
+                _local.metrics = None
+                if request_metrics.outcome is None:
+                    request_metrics.outcome = _default_outcome(response)
+                request_metrics.add_timing('Duration', time.perf_counter() - request_metrics.started)
+                if request_metrics.cold_start:
+                    for name, elapsed_ms in aws_clients.init_timings.items():
+                        request_metrics.properties[f'init.{name}'] = elapsed_ms
+                    request_metrics.put_metric(
+                        'InitMs', round(sum(aws_clients.init_timings.values()), 3), 'Milliseconds'
+                    )
+                if METRICS_ENABLED:
+                    sys.stdout.write(json.dumps(request_metrics.to_emf(), separators=(',', ':')) + '\n')
+                    sys.stdout.flush()
+        return wrapper
+    return decorator
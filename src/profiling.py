@@ -0,0 +1,329 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import argparse
+import cProfile
+import functools
+import pstats
+import threading
+import tracemalloc
+from datetime import datetime, timezone
+
+import aws_clients
+import metrics
+
+# Sampled per-invocation profiling.
+#
+# With PROFILE_SAMPLE_EVERY=N, about one invocation in N runs under cProfile
+# and tracemalloc. The invocation's CPU profile (the PROFILE_MAX_FUNCTIONS
+# functions with the most cumulative time and the caller/callee edges
+# between them), its peak traced memory and its largest live allocations
+# by traceback are written as one compact JSON record with "type":
+# "profile", either to stdout (CloudWatch Logs) or, with
+# PROFILE_DESTINATION=s3, to PROFILE_BUCKET under PROFILE_PREFIX.
+#
+# Only the invocation's own thread is profiled; work handed to the
+# resilience thread pool (hedged reads) shows up as time spent waiting.
+# Running this module merges any number of records into folded stacks
+# that flamegraph.pl, speedscope or inferno can render:
+#
+#   python3 src/profiling.py profiles.ndjson --cpu-output cpu.folded --memory-output memory.folded
+
+logger = logging.getLogger()
+
+# 0 disables profiling
+PROFILE_SAMPLE_EVERY = int(os.environ.get('PROFILE_SAMPLE_EVERY', '0'))
+PROFILE_DESTINATION = os.environ.get('PROFILE_DESTINATION', 'log')
+PROFILE_BUCKET = os.environ.get('PROFILE_BUCKET')
+PROFILE_PREFIX = os.environ.get('PROFILE_PREFIX', 'profiles/')
+PROFILE_MAX_FUNCTIONS = int(os.environ.get('PROFILE_MAX_FUNCTIONS', '200'))
+PROFILE_TOP_ALLOCATIONS = int(os.environ.get('PROFILE_TOP_ALLOCATIONS', '20'))
+PROFILE_TRACEBACK_DEPTH = int(os.environ.get('PROFILE_TRACEBACK_DEPTH', '8'))
+
+RECORD_TYPE = 'profile'
+
+# Path prefixes dropped from file names in records
+PATH_MARKERS = ('site-packages/', '/var/runtime/', '/var/task/', '/opt/python/')
+
+# tracemalloc is process-wide, so one profile at a time; invocations that
+# would overlap another profile are not sampled
+_lock = threading.Lock()
+
+
+def should_sample():
+    return PROFILE_SAMPLE_EVERY > 0 and random.random() < 1 / PROFILE_SAMPLE_EVERY
+
+
+def short_path(filename):
+    for marker in PATH_MARKERS:
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    directory, name = os.path.split(filename)
+    # logging/__init__.py rather than __init__.py
+    return f'{os.path.basename(directory)}/{name}' if name == '__init__.py' else name
+
+
+def function_label(function):
+    filename, line, name = function
+    if filename == '~':
+        # Built-in, e.g. <method 'read' of '_io.BytesIO' objects>
+        return name
+    return f'{short_path(filename)}:{line}({name})'
+
+
+def cpu_profile(profile):
+    # Functions as [label, calls, own us, cumulative us] and caller ->
+    # callee edges as [caller index, callee index, calls, own us,
+    # cumulative us], both limited to the PROFILE_MAX_FUNCTIONS functions
+    # with the most cumulative time
+    stats = pstats.Stats(profile).stats
+    ranked = sorted(stats, key=lambda function: stats[function][3], reverse=True)[:PROFILE_MAX_FUNCTIONS]
+    index = {function: i for i, function in enumerate(ranked)}
+    return {
+        'functions': [
+            [function_label(function), stats[function][1], round(stats[function][2] * 1e6),
+             round(stats[function][3] * 1e6)]
+            for function in ranked
+        ],
+        'edges': [
+            [index[caller], index[function], calls, round(own * 1e6), round(cumulative * 1e6)]
+            for function in ranked
+            for caller, (_, calls, own, cumulative) in stats[function][4].items()
+            if caller in index
+        ]
+    }
+
+
+def memory_profile(snapshot, peak):
+    # Allocations still live when the handler returns (its response and
+    # whatever it left in the caches), grouped by traceback, oldest frame
+    # first
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__)
+    ])
+    return {
+        'peakBytes': peak,
+        'top': [
+            [statistic.size, statistic.count, _handler_frames(statistic.traceback)]
+            for statistic in snapshot.statistics('traceback')[:PROFILE_TOP_ALLOCATIONS]
+        ]
+    }
+
+
+def _handler_frames(traceback):
+    # Drops the decorator and profiler frames above the profiled handler
+    frames = list(traceback)
+    for i in range(len(frames) - 1, -1, -1):
+        if frames[i].filename == cProfile.__file__:
+            frames = frames[i + 1:]
+            break
+    return [f'{short_path(frame.filename)}:{frame.lineno}' for frame in frames]
+
+
+def emit(record):
+    if PROFILE_DESTINATION == 's3' and PROFILE_BUCKET:
+        now = datetime.now(timezone.utc)
+        aws_clients.get_client('s3').put_object(
+            Bucket=PROFILE_BUCKET,
+            Key=f"{PROFILE_PREFIX}{record['function']}/{now:%Y/%m/%d}/{record['requestId']}.json",
+            Body=json.dumps(record, separators=(',', ':')).encode('utf-8'),
+            ContentType='application/json'
+        )
+    else:
+        sys.stdout.write(json.dumps(record, separators=(',', ':')) + '\n')
+        sys.stdout.flush()
+
+
+def _profile(handler, event, context):
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(PROFILE_TRACEBACK_DEPTH)
+    profile = cProfile.Profile()
+    started = time.perf_counter()
+    try:
+        return profile.runcall(handler, event, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        try:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+            request_metrics = metrics.current()
+            record = {
+                'type': RECORD_TYPE,
+                'function': request_metrics.function_name if request_metrics else handler.__name__,
+                'requestId': getattr(context, 'aws_request_id', None) or str(uuid.uuid4()),
+                'timestamp': int(time.time() * 1000),
+                'durationUs': round(elapsed * 1e6),
+                'cpu': cpu_profile(profile),
+                'memory': memory_profile(snapshot, peak)
+            }
+            emit(record)
+            metrics.put_metric('Profiled', 1)
+        except Exception as e:
+            # Profiling never fails the invocation
+            logger.warning(f"Could not record profile: {str(e)}")
+        finally:
+            if started_tracing and tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+
+def profiled(handler):
+    # Decorator for lambda_handler, inside metrics.instrumented
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        if not should_sample() or not _lock.acquire(blocking=False):
+            return handler(event, context)
+        try:
+            return _profile(handler, event, context)
+        finally:
+            _lock.release()
+    return wrapper
+
+
+# Merging records into flame graph input
+
+
+class MergedProfile:
+
+    def __init__(self):
+        self.samples = 0
+        # label -> [calls, own us, cumulative us]
+        self.functions = {}
+        # (caller label, callee label) -> [calls, own us, cumulative us]
+        self.edges = {}
+        # traceback tuple -> [bytes, allocations]
+        self.allocations = {}
+        self.peak_bytes = []
+
+    def add(self, record):
+        self.samples += 1
+        labels = [function[0] for function in record['cpu']['functions']]
+        for label, calls, own, cumulative in record['cpu']['functions']:
+            totals = self.functions.setdefault(label, [0, 0, 0])
+            totals[0] += calls
+            totals[1] += own
+            totals[2] += cumulative
+        for caller, callee, calls, own, cumulative in record['cpu']['edges']:
+            totals = self.edges.setdefault((labels[caller], labels[callee]), [0, 0, 0])
+            totals[0] += calls
+            totals[1] += own
+            totals[2] += cumulative
+        for size, count, traceback in record['memory']['top']:
+            totals = self.allocations.setdefault(tuple(traceback), [0, 0])
+            totals[0] += size
+            totals[1] += count
+        self.peak_bytes.append(record['memory']['peakBytes'])
+
+    def cpu_folded(self, min_us=1):
+        # cProfile keeps caller -> callee edges, not whole stacks, so each
+        # function's time is split across its callers in proportion to the
+        # time spent through each edge (as gprof2dot and flameprof do)
+        callees = {}
+        for (caller, callee), totals in self.edges.items():
+            callees.setdefault(caller, []).append((callee, totals[2]))
+        called = {callee for _, callee in self.edges}
+        roots = [label for label in self.functions if label not in called]
+        folded = {}
+
+        def descend(label, path, share):
+            path = path + (label,)
+            own = self.functions[label][1] * share
+            if own >= min_us:
+                folded[path] = folded.get(path, 0) + own
+            for callee, edge_us in callees.get(label, []):
+                cumulative = self.functions[callee][2]
+                if callee in path or not cumulative:
+                    continue
+                callee_share = share * edge_us / cumulative
+                if cumulative * callee_share >= min_us:
+                    descend(callee, path, callee_share)
+
+        for root in roots:
+            descend(root, (), 1.0)
+        return fold_lines(folded)
+
+    def memory_folded(self):
+        return fold_lines({traceback: totals[0] for traceback, totals in self.allocations.items()})
+
+    def top_functions(self, n):
+        return sorted(self.functions.items(), key=lambda item: -item[1][1])[:n]
+
+
+def fold_lines(stacks):
+    # "frame;frame;frame value" lines, largest first
+    return [
+        f"{';'.join(frame.replace(';', ':') for frame in stack)} {round(value)}"
+        for stack, value in sorted(stacks.items(), key=lambda item: -item[1])
+        if round(value) > 0
+    ]
+
+
+def read_records(paths, function_name=None):
+    # Profile records from files or directories of NDJSON, JSON records or
+    # exported log lines (anything before the first '{' is ignored); '-'
+    # reads stdin
+    def lines():
+        for path in paths:
+            if path == '-':
+                yield from sys.stdin
+            elif os.path.isdir(path):
+                for root, dirs, files in os.walk(path):
+                    dirs.sort()
+                    for name in sorted(files):
+                        with open(os.path.join(root, name), encoding='utf-8') as f:
+                            yield from f
+            else:
+                with open(path, encoding='utf-8') as f:
+                    yield from f
+
+    for line in lines():
+        start = line.find('{')
+        if start < 0:
+            continue
+        try:
+            record = json.loads(line[start:])
+        except ValueError:
+            continue
+        if isinstance(record, dict) and record.get('type') == RECORD_TYPE:
+            if function_name is None or record.get('function') == function_name:
+                yield record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Merge sampled handler profiles into flame graph input')
+    parser.add_argument('inputs', nargs='+', help="Files or directories of profile records, or - for stdin")
+    parser.add_argument('--function', help='Only merge profiles of this function')
+    parser.add_argument('--cpu-output', help='Write folded CPU stacks (microseconds) here')
+    parser.add_argument('--memory-output', help='Write folded live-allocation stacks (bytes) here')
+    parser.add_argument('--top', type=int, default=15, help='Functions to list by own time')
+    args = parser.parse_args(argv)
+
+    merged = MergedProfile()
+    for record in read_records(args.inputs, args.function):
+        merged.add(record)
+    if not merged.samples:
+        print("No profile records found", file=sys.stderr)
+        return 1
+
+    for path, lines in ((args.cpu_output, merged.cpu_folded), (args.memory_output, merged.memory_folded)):
+        if path:
+            with open(path, 'w') as f:
+                f.writelines(line + '\n' for line in lines())
+
+    peaks = sorted(merged.peak_bytes)
+    print(f"{merged.samples} profiles, median peak memory {peaks[len(peaks) // 2] / 1024:.1f} KiB")
+    print(f"{'own ms':>10} {'cum ms':>10} {'calls':>8}  function")
+    for label, (calls, own, cumulative) in merged.top_functions(args.top):
+        print(f"{own / 1000:>10.2f} {cumulative / 1000:>10.2f} {calls:>8}  {label}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,205 @@
+import time
+
+_import_started = time.perf_counter()
+
 import json
-import boto3
 import os
 import logging
-from datetime import datetime
+from botocore.exceptions import BotoCoreError, ClientError
+
+import admission
+import api_common
+import aws_clients
+import bloom_filter
+import metrics
+import profiling
+import resilience
+import warmup
 
 # Set up logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-dynamodb = boto3.resource('dynamodb')
+# New registrations are recorded in the Bloom filter delta before they are
+# reported, so verify_user never treats them as definitely unregistered
+BLOOM_DELTA_TABLE = os.environ.get('BLOOM_DELTA_TABLE')
+
+
+# Write-behind mode: single registrations are validated, enqueued and
+# answered with 202; registration_consumer writes them in batches. If the
+# queue cannot be reached the user is written directly as usual.
+ASYNC_REGISTRATION = os.environ.get('ASYNC_REGISTRATION', 'false').lower() == 'true'
+REGISTRATION_QUEUE_URL = os.environ.get('REGISTRATION_QUEUE_URL')
+
+
+def _attribute_value(attribute):
+    # Unwraps a low-level attribute value such as {'S': '...'}
+    if isinstance(attribute, dict):
+        return next(iter(attribute.values()), None)
+    return attribute
+
+
+# Bulk registration: POST /register with a JSON array or NDJSON body of userIds
+BULK_REGISTER_MAX_USERS = int(os.environ.get('BULK_REGISTER_MAX_USERS', '1000'))
+BATCH_GET_SIZE = 100
+BATCH_WRITE_SIZE = 25
+BATCH_MAX_ATTEMPTS = 8
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def parse_bulk_user_ids(body):
+    # Accepts a JSON array or NDJSON; entries may be plain strings or
+    # objects with a userId field. Raises ValueError on malformed input.
+    body = body.strip()
+    if body.startswith('['):
+        entries = json.loads(body)
+    else:
+        entries = [json.loads(line) for line in body.splitlines() if line.strip()]
+    
+    user_ids = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            entry = entry.get('userId')
+        if not isinstance(entry, str):
+            raise ValueError(f"Invalid userId entry: {json.dumps(entry)}")
+        user_ids.append(entry.strip())
+    return user_ids
+
+
+def _find_existing_users(table_name, user_ids):
+    # BatchWriteItem cannot take a condition, so existing users are found
+    # up front with a BatchGetItem of the key and expiry. Expired users that
+    # TTL has not deleted yet are registered again.
+    dynamodb = aws_clients.get_client('dynamodb')
+    existing = set()
+    now = time.time()
+    for chunk in _chunks(user_ids, BATCH_GET_SIZE):
+        request = {table_name: {
+            'Keys': [{'userId': {'S': user_id}} for user_id in chunk],
+            'ProjectionExpression': 'userId, expiresAt'
+        }}
+        for attempt in range(BATCH_MAX_ATTEMPTS):
+            response = resilience.call('DynamoDB', lambda: dynamodb.batch_get_item(RequestItems=request))
+            for item in response.get('Responses', {}).get(table_name, []):
+                if not api_common.is_expired(item, now):
+                    existing.add(item['userId']['S'])
+            request = response.get('UnprocessedKeys')
+            if not request:
+                break
+            api_common.backoff(attempt)
+        else:
+            raise Exception("Failed to read existing users: unprocessed keys remain after retries")
+    return existing
+
+
+def _batch_put(table_name, items):
+    # Returns the items that were still unprocessed after all retries. Like
+    # the single write, each call fails fast while DynamoDB's circuit is open.
+    dynamodb = aws_clients.get_client('dynamodb')
+    failed = []
+    for chunk in _chunks(items, BATCH_WRITE_SIZE):
+        request = {table_name: [{'PutRequest': {'Item': item}} for item in chunk]}
+        for attempt in range(BATCH_MAX_ATTEMPTS):
+            response = resilience.call('DynamoDB', lambda: dynamodb.batch_write_item(RequestItems=request))
+            request = response.get('UnprocessedItems')
+            if not request:
+                break
+            api_common.backoff(attempt)
+        else:
+            failed.extend(write['PutRequest']['Item'] for write in request.get(table_name, []))
+    return failed
+
+
+def _write_new_users(table_name, user_ids, timestamp, registered_at):
+    # Returns the userIds that were still unprocessed after all retries.
+    # Bloom delta entries go first; a user whose entry failed is not written.
+    # Users without an entry in `registered_at` are registered at `timestamp`.
+    failed = []
+    if BLOOM_DELTA_TABLE:
+        unprocessed = _batch_put(BLOOM_DELTA_TABLE, [bloom_filter.delta_item(user_id) for user_id in user_ids])
+        failed = [bloom_filter.delta_user_id(item) for item in unprocessed]
+        skipped = set(failed)
+        user_ids = [user_id for user_id in user_ids if user_id not in skipped]
+    
+    items = [api_common.registration_item(user_id, registered_at.get(user_id, timestamp)) for user_id in user_ids]
+    failed.extend(item['userId']['S'] for item in _batch_put(table_name, items))
+    return failed
+
+
+def register_users_bulk(table_name, user_ids, registered_at=None):
+    # Returns a map of userId to 'registered', 'already_registered',
+    # 'invalid' or 'failed'. Duplicates in the input are collapsed.
+    # `registered_at` optionally maps userIds to the time they were
+    # requested; the others are registered now.
+    results = {}
+    candidates = []
+    for user_id in user_ids:
+        if user_id in results:
+            continue
+        if not user_id:
+            results[user_id] = 'invalid'
+            continue
+        results[user_id] = None
+        candidates.append(user_id)
+    
+    existing = _find_existing_users(table_name, candidates)
+    new_users = [user_id for user_id in candidates if user_id not in existing]
+    failed = set(_write_new_users(table_name, new_users, api_common.utc_timestamp(), registered_at or {}))
+    
+    for user_id in candidates:
+        if user_id in existing:
+            results[user_id] = 'already_registered'
+        elif user_id in failed:
+            results[user_id] = 'failed'
+        else:
+            results[user_id] = 'registered'
+    return results
+
+
+def handle_bulk_registration(event, table_name):
+    try:
+        user_ids = parse_bulk_user_ids(api_common.request_body(event))
+    except ValueError as e:
+        return api_common.error_response(400, f'Invalid bulk registration body: {str(e)}')
+    
+    if not user_ids or len(user_ids) > BULK_REGISTER_MAX_USERS:
+        return api_common.error_response(
+            400, f'Bulk registration requires between 1 and {BULK_REGISTER_MAX_USERS} userIds'
+        )
+    
+    with metrics.phase('DynamoDB'):
+        results = register_users_bulk(table_name, user_ids)
+    summary = {}
+    for status in results.values():
+        summary[status] = summary.get(status, 0) + 1
+    
+    logger.info(f"Bulk registration of {len(results)} users: {summary}")
+    metrics.put_metric('BulkUsers', len(results))
+    
+    with metrics.phase('Serialization'):
+        body = json.dumps({
+            'summary': summary,
+            'results': results
+        })
+    return api_common.response(200, body)
+
+
+def enqueue_registration(user_id, timestamp):
+    aws_clients.get_client('sqs').send_message(
+        QueueUrl=REGISTRATION_QUEUE_URL,
+        MessageBody=json.dumps({'userId': user_id, 'requestedAt': timestamp})
+    )
+
 
-def lambda_handler(event, context):
+def handle_register(event, context):
+    # POST /register; deployed behind the user_api router, or on its own
+    # through lambda_handler below
     try:
-        logger.info(f"Event received: {json.dumps(event)}")
+        metrics.log_event(event)
         
         # Check if environment variable is set
         table_name = os.environ.get('DYNAMODB_TABLE')
@@ -21,84 +208,139 @@ def lambda_handler(event, context):
         if not table_name:
             raise Exception("DYNAMODB_TABLE environment variable not set")
         
-        table = dynamodb.Table(table_name)
-        
         # Extract userId from query parameters
         query_params = event.get('queryStringParameters', {})
         logger.info(f"Query parameters: {query_params}")
         
-        if not query_params or 'userId' not in query_params:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Missing userId parameter'})
-            }
+        # A body without a userId parameter is a bulk registration request
+        if (not query_params or 'userId' not in query_params) and event.get('body'):
+            metrics.set_outcome('bulk')
+            return handle_bulk_registration(event, table_name)
         
-        user_id = query_params['userId'].strip()
+        validation_started = time.perf_counter()
+        user_id, bad_request = api_common.user_id_param(query_params)
+        if bad_request:
+            metrics.set_outcome('bad_request')
+            return bad_request
         
-        if not user_id:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Empty userId value'})
-            }
+        # Register the user with a single conditional write. An existing item
+        # fails the condition and comes back with the original registeredAt,
+        # so there is no separate read and no race between concurrent requests.
+        # An item past its expiresAt passes and is replaced.
+        metrics.add_timing('Validation', time.perf_counter() - validation_started)
         
-        # Check if user already exists
-        try:
-            response = table.get_item(Key={'userId': user_id})
-            if 'Item' in response:
-                logger.info(f"User {user_id} already exists")
-                return {
-                    'statusCode': 200,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'message': f'User {user_id} already registered',
+        timestamp = api_common.utc_timestamp()
+        if ASYNC_REGISTRATION and REGISTRATION_QUEUE_URL:
+            try:
+                with metrics.phase('SQS'):
+                    enqueue_registration(user_id, timestamp)
+            except (BotoCoreError, ClientError) as e:
+                logger.warning(f"Could not enqueue registration of {user_id}, writing directly: {str(e)}")
+            else:
+                logger.info(f"Registration of {user_id} accepted")
+                metrics.set_outcome('accepted')
+                with metrics.phase('Serialization'):
+                    body = json.dumps({
+                        'message': f'Registration of user {user_id} accepted',
                         'userId': user_id,
-                        'timestamp': datetime.now().isoformat()
+                        'timestamp': timestamp
                     })
-                }
-        except Exception as e:
-            logger.error(f"Error checking existing user: {str(e)}")
-            raise
-        
-        # Register new user
-        timestamp = datetime.now().isoformat()
-        table.put_item(Item={
-            'userId': user_id,
-            'registeredAt': timestamp
-        })
+                return api_common.response(202, body)
+        
+        dynamodb = aws_clients.get_client('dynamodb')
+        
+        def write():
+            dynamodb.put_item(
+                TableName=table_name,
+                Item=api_common.registration_item(user_id, timestamp),
+                ConditionExpression='attribute_not_exists(userId) OR expiresAt <= :now',
+                ExpressionAttributeValues={':now': {'N': str(int(time.time()))}},
+                ReturnValuesOnConditionCheckFailure='ALL_OLD'
+            )
+        
+        # The Bloom delta entry is written alongside the user item rather than
+        # before it, and the response waits for both. A new user is reported
+        # registered only once its delta entry is in, so no caller is told a
+        # user is registered while verify_user could still call them
+        # definitely absent; if the delta write fails the request fails and
+        # its retry writes the entry again. An existing user was recorded
+        # when first registered, so a failed delta write never hides the
+        # "already registered" answer.
+        delta = None
+        if BLOOM_DELTA_TABLE:
+            delta = resilience.submit(lambda: resilience.call(
+                'DynamoDB', lambda: bloom_filter.record_registration(dynamodb, BLOOM_DELTA_TABLE, user_id)
+            ))
+        
+        existing = None
+        delta_error = None
+        # Writes are not hedged, but fail fast while DynamoDB's circuit is open
+        with metrics.phase('DynamoDB'):
+            try:
+                resilience.call('DynamoDB', write)
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    logger.error(f"Error registering user: {str(e)}")
+                    raise
+                existing = e
+            finally:
+                if delta is not None:
+                    delta_error = delta.exception()
+        
+        if existing is not None:
+            if delta_error is not None:
+                logger.warning(f"Error recording {user_id} in the Bloom delta: {str(delta_error)}")
+            logger.info(f"User {user_id} already exists")
+            metrics.set_outcome('already_registered')
+            body = {
+                'message': f'User {user_id} already registered',
+                'userId': user_id,
+                'timestamp': timestamp
+            }
+            registered_at = _attribute_value(existing.response.get('Item', {}).get('registeredAt'))
+            if registered_at:
+                body['registeredAt'] = registered_at
+            with metrics.phase('Serialization'):
+                body = json.dumps(body)
+            return api_common.response(200, body)
+        
+        if delta_error is not None:
+            logger.error(f"Error recording {user_id} in the Bloom delta: {str(delta_error)}")
+            raise delta_error
         
         logger.info(f"User {user_id} registered successfully")
+        metrics.set_outcome('registered')
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
+        with metrics.phase('Serialization'):
+            body = json.dumps({
                 'message': f'User {user_id} registered successfully',
                 'userId': user_id,
                 'timestamp': timestamp
             })
-        }
+        return api_common.response(200, body)
         
+    except resilience.CircuitOpenError as e:
+        logger.warning(f"Failing fast: {str(e)}")
+        metrics.set_outcome('circuit_open')
+        return api_common.overloaded(e.retry_after)
     except Exception as e:
         logger.error(f"Error in lambda_handler: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': f'Internal server error: {str(e)}'})
-        } 
\ No newline at end of file
+        metrics.set_outcome('error')
+        return api_common.server_error(e)
+
+
+def prime_clients(event):
+    # Warm-up primer: creates the clients a registration uses
+    aws_clients.get_client('dynamodb')
+    if ASYNC_REGISTRATION and REGISTRATION_QUEUE_URL:
+        aws_clients.get_client('sqs')
+
+
+warmup.register_primer('register_user', prime_clients)
+
+lambda_handler = metrics.instrumented('register_user')(
+    warmup.intercept(profiling.profiled(admission.controlled(handle_register)))
+)
+
+
+aws_clients.record_import('register_user', _import_started)
@@ -0,0 +1,94 @@
+import time
+
+_import_started = time.perf_counter()
+
+import json
+import os
+import logging
+
+import api_common
+import aws_clients
+import metrics
+import profiling
+import register_user
+
+# SQS consumer for write-behind registrations (ASYNC_REGISTRATION in
+# register_user).
+#
+# Each batch is deduplicated by userId and written through the same
+# BatchGetItem/BatchWriteItem path as bulk registration, so users that
+# already exist keep their original registeredAt and Bloom delta entries
+# are written first. New users are registered at the requestedAt the
+# producer stamped and returned in its 202, not when the message happens
+# to be consumed; a userId queued more than once keeps its earliest
+# request. Messages whose userId could not be written are
+# reported as batch item failures and redelivered; malformed messages are
+# logged and dropped rather than retried.
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def message_registration(record):
+    # Returns (userId, requestedAt) carried by an SQS record. The userId is
+    # None if the message is malformed; requestedAt is None if it is missing
+    # or not a timestamp, and the user is then registered when consumed.
+    try:
+        payload = json.loads(record.get('body') or '')
+    except ValueError:
+        return None, None
+    if not isinstance(payload, dict):
+        return None, None
+    requested_at = api_common.parse_timestamp(payload.get('requestedAt'))
+    if requested_at is not None:
+        requested_at = api_common.utc_timestamp(requested_at)
+    return api_common.clean_user_id(payload.get('userId')), requested_at
+
+
+@metrics.instrumented('registration_consumer')
+@profiling.profiled
+def lambda_handler(event, context):
+    table_name = os.environ.get('DYNAMODB_TABLE')
+    if not table_name:
+        raise Exception("DYNAMODB_TABLE environment variable not set")
+    
+    records = event.get('Records', [])
+    message_ids = {}
+    requested_at = {}
+    for record in records:
+        user_id, timestamp = message_registration(record)
+        if user_id is None:
+            logger.warning(f"Dropping malformed registration message {record.get('messageId')}")
+            continue
+        message_ids.setdefault(user_id, []).append(record['messageId'])
+        if timestamp is not None and (user_id not in requested_at or timestamp < requested_at[user_id]):
+            requested_at[user_id] = timestamp
+    
+    metrics.put_metric('QueueMessages', len(records))
+    metrics.put_metric('QueueDuplicates', sum(len(ids) - 1 for ids in message_ids.values()))
+    if not message_ids:
+        metrics.set_outcome('drained')
+        return {'batchItemFailures': []}
+    
+    try:
+        with metrics.phase('DynamoDB'):
+            results = register_user.register_users_bulk(table_name, list(message_ids), requested_at)
+        failed = [user_id for user_id, status in results.items() if status == 'failed']
+    except Exception as e:
+        logger.error(f"Error writing registration batch: {str(e)}")
+        results = {}
+        failed = list(message_ids)
+    
+    failures = [{'itemIdentifier': message_id} for user_id in failed for message_id in message_ids[user_id]]
+    summary = {}
+    for status in results.values():
+        summary[status] = summary.get(status, 0) + 1
+    logger.info(f"Registration batch of {len(records)} messages, {len(message_ids)} users: {summary}, "
+                f"{len(failures)} messages to retry")
+    
+    metrics.put_metric('QueueFailures', len(failures))
+    metrics.set_outcome('partial_failure' if failures else 'drained')
+    return {'batchItemFailures': failures}
+
+
+aws_clients.record_import('registration_consumer', _import_started)
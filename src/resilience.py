@@ -0,0 +1,268 @@
+import os
+import math
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from botocore.exceptions import BotoCoreError, ClientError
+
+import api_common
+import metrics
+
+# Hedged reads and per-dependency circuit breakers for DynamoDB and S3.
+#
+# A hedged read starts the call on the shared worker pool and, if it has
+# not finished after the dependency's recent HEDGE_PERCENTILE latency,
+# starts an identical second call and takes whichever succeeds first. Only
+# idempotent reads are hedged.
+#
+# Each dependency has a circuit breaker. CIRCUIT_FAILURE_THRESHOLD
+# consecutive failures (throttling, 5xx, timeouts; not 4xx such as a failed
+# condition or a 304) open it; calls then fail immediately with
+# CircuitOpenError for CIRCUIT_RESET_SECONDS, after which one trial call is
+# let through to decide whether it closes again.
+
+logger = logging.getLogger()
+
+HEDGE_ENABLED = os.environ.get('HEDGE_ENABLED', 'true').lower() == 'true'
+HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', '95'))
+HEDGE_MIN_DELAY_MS = float(os.environ.get('HEDGE_MIN_DELAY_MS', '5'))
+HEDGE_MAX_DELAY_MS = float(os.environ.get('HEDGE_MAX_DELAY_MS', '500'))
+# Used until HEDGE_MIN_SAMPLES latencies have been seen
+HEDGE_DEFAULT_DELAY_MS = float(os.environ.get('HEDGE_DEFAULT_DELAY_MS', '50'))
+HEDGE_MIN_SAMPLES = int(os.environ.get('HEDGE_MIN_SAMPLES', '20'))
+HEDGE_SAMPLES = 200
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_SECONDS = float(os.environ.get('CIRCUIT_RESET_SECONDS', '10'))
+
+# Shared by hedged reads and any other concurrent dependency calls
+WORKER_THREADS = int(os.environ.get('DEPENDENCY_WORKER_THREADS', '8'))
+_executor = None
+_executor_lock = threading.Lock()
+# Set on a worker thread while it runs a task from submit()
+_task = threading.local()
+# Tasks submitted with hedge=True hedge their reads while fewer than this
+# many tasks are already doing so, and otherwise read once. A hedging task
+# holds its worker while it waits on the attempts it queued, so the cap
+# keeps the rest of the pool free to run them.
+TASK_HEDGE_SLOTS = WORKER_THREADS // 2
+_task_hedges = threading.Semaphore(TASK_HEDGE_SLOTS)
+
+# Metric holding the time a request spent in dependency calls that actually
+# ran, summed over its calls (concurrent ones included). Cache hits and
+# calls rejected by an open circuit add nothing.
+DEPENDENCY_TIMING = 'DependencyMs'
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+
+    def __init__(self, dependency, retry_after):
+        super().__init__(f"{dependency} circuit is open")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix='dependency')
+    return _executor
+
+
+def submit(operation, hedge=False):
+    # Runs operation() on the shared pool, for dependency calls a request
+    # overlaps with other work, and returns its Future. Metrics it records
+    # go to the submitting request. Reads inside it are hedged only with
+    # hedge=True and while the pool has headroom (TASK_HEDGE_SLOTS): tasks
+    # waiting on hedges queued behind them could starve a saturated pool.
+    request_metrics = metrics.current()
+
+    def run():
+        _task.active = True
+        _task.hedge = hedge
+        try:
+            with metrics.bound(request_metrics):
+                return operation()
+        finally:
+            _task.active = False
+            _task.hedge = False
+
+    return get_executor().submit(run)
+
+
+def is_failure(error):
+    # Whether an error says the dependency is unhealthy, as opposed to a
+    # healthy dependency rejecting this particular request
+    if isinstance(error, BotoCoreError):
+        return True
+    if isinstance(error, ClientError):
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+        return status >= 500 or api_common.is_throttled(error)
+    return False
+
+
+def is_unavailable(error):
+    # True when a caller should fall back (e.g. to a cached answer)
+    return isinstance(error, CircuitOpenError) or is_failure(error)
+
+
+class LatencyTracker:
+
+    def __init__(self):
+        self.samples = deque(maxlen=HEDGE_SAMPLES)
+        self.delay = HEDGE_DEFAULT_DELAY_MS / 1000
+        self.lock = threading.Lock()
+
+    def record(self, elapsed_seconds):
+        with self.lock:
+            self.samples.append(elapsed_seconds)
+            count = len(self.samples)
+            # Re-sort every tenth sample rather than on every call
+            if count >= HEDGE_MIN_SAMPLES and count % 10 == 0:
+                values = sorted(self.samples)
+                percentile = values[min(count - 1, math.ceil(count * HEDGE_PERCENTILE / 100) - 1)]
+                self.delay = min(max(percentile, HEDGE_MIN_DELAY_MS / 1000), HEDGE_MAX_DELAY_MS / 1000)
+
+
+class CircuitBreaker:
+
+    def __init__(self, name, failure_threshold, reset_seconds):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        # Raises CircuitOpenError if the call must not be made
+        with self.lock:
+            if self.state == OPEN:
+                remaining = self.reset_seconds - (time.monotonic() - self.opened_at)
+                if remaining > 0:
+                    raise CircuitOpenError(self.name, math.ceil(remaining))
+                self.state = HALF_OPEN
+                logger.info(f"{self.name} circuit half-open, sending a trial call")
+            if self.state == HALF_OPEN:
+                if self.trial_in_flight:
+                    raise CircuitOpenError(self.name, 1)
+                self.trial_in_flight = True
+
+    def on_success(self):
+        with self.lock:
+            if self.state != CLOSED:
+                logger.info(f"{self.name} circuit closed")
+            self.state = CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def on_failure(self):
+        # Returns True if this failure opened the circuit
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                opened = self.state != OPEN
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                if opened:
+                    logger.warning(f"{self.name} circuit opened after {self.failures} consecutive failures")
+                return opened
+            return False
+
+
+# Keyed by the same names as the metrics phases
+breakers = {
+    name: CircuitBreaker(name, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+    for name in ('DynamoDB', 'S3')
+}
+trackers = {name: LatencyTracker() for name in breakers}
+
+
+def _timed(operation):
+    started = time.perf_counter()
+    result = operation()
+    return result, time.perf_counter() - started
+
+
+def _hedged(dependency, operation):
+    tracker = trackers[dependency]
+    primary = get_executor().submit(_timed, operation)
+
+    def record_primary(future):
+        # Every primary latency is recorded, including ones that lose to a
+        # hedge, so the delay tracks the real distribution
+        if future.exception() is None:
+            tracker.record(future.result()[1])
+
+    primary.add_done_callback(record_primary)
+
+    done, _ = wait([primary], timeout=tracker.delay)
+    if done:
+        return primary.result()[0]
+
+    metrics.put_metric(f'{dependency}Hedged', 1)
+    hedge = get_executor().submit(_timed, operation)
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is not None:
+                error = error or future.exception()
+                continue
+            if future is hedge:
+                metrics.put_metric(f'{dependency}HedgeWins', 1)
+            return future.result()[0]
+    raise error
+
+
+def _run(dependency, operation, hedge):
+    if not hedge:
+        return operation()
+    if not getattr(_task, 'active', False):
+        return _hedged(dependency, operation)
+    if not getattr(_task, 'hedge', False) or not _task_hedges.acquire(blocking=False):
+        return operation()
+    try:
+        return _hedged(dependency, operation)
+    finally:
+        _task_hedges.release()
+
+
+def call(dependency, operation, hedge=False):
+    # Runs operation() (a call to `dependency`) through its circuit breaker,
+    # hedged if requested
+    breaker = breakers[dependency]
+    try:
+        breaker.before_call()
+    except CircuitOpenError:
+        metrics.put_metric(f'{dependency}CircuitRejected', 1)
+        metrics.set_metric(f'{dependency}CircuitState', STATE_VALUES[OPEN])
+        raise
+
+    started = time.perf_counter()
+    try:
+        result = _run(dependency, operation, hedge and HEDGE_ENABLED)
+    except Exception as e:
+        metrics.put_metric(DEPENDENCY_TIMING, (time.perf_counter() - started) * 1000, 'Milliseconds')
+        if is_failure(e):
+            if breaker.on_failure():
+                metrics.put_metric(f'{dependency}CircuitOpened', 1)
+        else:
+            breaker.on_success()
+        metrics.set_metric(f'{dependency}CircuitState', STATE_VALUES[breaker.state])
+        raise
+    metrics.put_metric(DEPENDENCY_TIMING, (time.perf_counter() - started) * 1000, 'Milliseconds')
+    breaker.on_success()
+    metrics.set_metric(f'{dependency}CircuitState', STATE_VALUES[breaker.state])
+    return result
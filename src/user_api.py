@@ -0,0 +1,50 @@
+import time
+
+_import_started = time.perf_counter()
+
+import logging
+
+import admission
+import api_common
+import aws_clients
+import metrics
+import profiling
+import list_users
+import register_user
+import verify_user
+import warmup
+
+# Single Lambda entry point for the whole API.
+#
+# API Gateway v2 puts the matched route in event['routeKey'], so dispatch is
+# one dict lookup. All routes run in the same container and share its AWS
+# clients, caches and precomputed responses, so mixed register/verify
+# traffic keeps one warm pool hot instead of two. Each route goes through
+# admission control (load shedding and per-caller rate limits) first.
+# Warm-up events from the scheduled warmer are answered by warmup.py before
+# routing and never count against admission control.
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+ROUTES = {
+    'POST /register': admission.controlled(register_user.handle_register),
+    'GET /': admission.controlled(verify_user.handle_verify),
+    'POST /verify': admission.controlled(verify_user.handle_verify),
+    'GET /users': admission.controlled(list_users.handle_list)
+}
+
+
+@metrics.instrumented('user_api')
+@warmup.intercept
+@profiling.profiled
+def lambda_handler(event, context):
+    route = ROUTES.get(event.get('routeKey'))
+    if route is None:
+        logger.warning(f"No route for {event.get('routeKey')}")
+        metrics.set_outcome('not_found')
+        return api_common.response(404, api_common.ROUTE_NOT_FOUND_BODY)
+    return route(event, context)
+
+
+aws_clients.record_import('user_api', _import_started)
@@ -0,0 +1,415 @@
+import os
+import sys
+import json
+import time
+import queue
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import api_common
+import bloom_filter
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:
+    pyarrow = None
+
+# Bulk export and import of the users table.
+#
+# Export runs one parallel Scan per segment (Segment/TotalSegments) and
+# streams the pages through a bounded queue to a single writer, so memory
+# stays flat however large the table is. Output is NDJSON, one user per
+# line, or Parquet when pyarrow is installed.
+#
+# Import reads the same formats, validates every userId exactly as the
+# register route does, and writes 25-item BatchWriteItem requests from a
+# worker pool. Progress is checkpointed as the number of input rows whose
+# batches have all been written, so an interrupted import resumes from the
+# checkpoint instead of starting over. Imported items overwrite existing
+# users with the same userId and are written in the same shape as new
+# registrations (UTC registeredAt, registeredDate, optional expiresAt), so
+# exporting and re-importing the table backfills the registration time
+# index for users registered before it existed.
+
+logger = logging.getLogger()
+
+COLUMNS = ('userId', 'registeredAt')
+
+BATCH_WRITE_SIZE = 25
+BATCH_MAX_ATTEMPTS = 8
+
+# Parquet rows buffered per row group
+PARQUET_ROW_GROUP_SIZE = 50000
+
+# Read capacity charged for a Scan page when the response does not report it
+DEFAULT_PAGE_CAPACITY = 0.5
+
+
+class RateLimiter:
+    # Token bucket shared by all workers. A rate of 0 disables it. The
+    # balance may go negative (a Scan page's capacity is only known once it
+    # has been read); the caller then sleeps until the debt is repaid.
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+def format_for(path, requested=None):
+    if requested:
+        return requested
+    return 'parquet' if path.endswith('.parquet') else 'ndjson'
+
+
+def user_row(item):
+    return {column: item[column]['S'] for column in COLUMNS if column in item}
+
+
+class NdjsonWriter:
+
+    def __init__(self, stream, close_stream=False):
+        self.stream = stream
+        self.close_stream = close_stream
+
+    def write_rows(self, rows):
+        self.stream.write(''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in rows))
+
+    def close(self):
+        if self.close_stream:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+
+class ParquetWriter:
+
+    def __init__(self, path):
+        self.schema = pyarrow.schema([(column, pyarrow.string()) for column in COLUMNS])
+        self.writer = parquet.ParquetWriter(path, self.schema)
+        self.buffer = []
+
+    def write_rows(self, rows):
+        self.buffer.extend(rows)
+        if len(self.buffer) >= PARQUET_ROW_GROUP_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self.buffer:
+            self.writer.write_table(pyarrow.Table.from_pylist(self.buffer, schema=self.schema))
+            self.buffer = []
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+def read_rows(path, fmt):
+    # Yields (rows read so far, record) where record is a dict, a plain
+    # userId string, or None for an unparseable line
+    if fmt == 'parquet':
+        count = 0
+        for batch in parquet.ParquetFile(path).iter_batches():
+            for record in batch.to_pylist():
+                count += 1
+                yield count, record
+        return
+
+    with open(path, encoding='utf-8') as f:
+        for count, line in enumerate(f, 1):
+            if not line.strip():
+                yield count, None
+                continue
+            try:
+                yield count, json.loads(line)
+            except ValueError:
+                yield count, None
+
+
+def scan_segment(dynamodb_client, table_name, segment, total_segments, emit, limiter, stop, page_size=None):
+    request = {
+        'TableName': table_name,
+        'Segment': segment,
+        'TotalSegments': total_segments,
+        'ProjectionExpression': ', '.join(f'#c{i}' for i in range(len(COLUMNS))),
+        'ExpressionAttributeNames': {f'#c{i}': column for i, column in enumerate(COLUMNS)},
+        'ReturnConsumedCapacity': 'TOTAL'
+    }
+    if page_size:
+        request['Limit'] = page_size
+    while not stop.is_set():
+        response = dynamodb_client.scan(**request)
+        limiter.acquire(response.get('ConsumedCapacity', {}).get('CapacityUnits', DEFAULT_PAGE_CAPACITY))
+        emit([user_row(item) for item in response.get('Items', [])])
+        if 'LastEvaluatedKey' not in response:
+            return
+        request['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def export_users(dynamodb_client, table_name, writer, total_segments=8, limiter=None, page_size=None):
+    # Returns the number of users written
+    limiter = limiter or RateLimiter(0)
+    pages = queue.Queue(maxsize=total_segments * 2)
+    stop = threading.Event()
+    done = object()
+
+    def run(segment):
+        try:
+            scan_segment(dynamodb_client, table_name, segment, total_segments, pages.put, limiter, stop, page_size)
+        except BaseException:
+            # No point scanning the other segments once the export has failed
+            stop.set()
+            raise
+        finally:
+            pages.put(done)
+
+    exported = 0
+    # The writer is closed even if the export fails, so no file handle
+    # leaks; the failure is still raised
+    try:
+        with ThreadPoolExecutor(max_workers=total_segments) as pool:
+            futures = [pool.submit(run, segment) for segment in range(total_segments)]
+            remaining = total_segments
+            try:
+                while remaining:
+                    rows = pages.get()
+                    if rows is done:
+                        remaining -= 1
+                        continue
+                    writer.write_rows(rows)
+                    exported += len(rows)
+            except BaseException:
+                # Unblock the scanners before the pool waits for them
+                stop.set()
+                while remaining:
+                    if pages.get() is done:
+                        remaining -= 1
+                raise
+            for future in futures:
+                future.result()
+    finally:
+        writer.close()
+    return exported
+
+
+class Checkpoint:
+    # Import progress: every row before `offset` has been written or
+    # rejected. Saved atomically so an interrupted save never corrupts it.
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = source
+        self.offset = 0
+        self.counts = {'imported': 0, 'invalid': 0}
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return False
+        with open(self.path, encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('source') != self.source:
+            raise ValueError(f"Checkpoint {self.path} is for {state.get('source')}, not {self.source}")
+        self.offset = state['offset']
+        self.counts.update(state['counts'])
+        return True
+
+    def save(self):
+        if not self.path:
+            return
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump({'source': self.source, 'offset': self.offset, 'counts': self.counts}, f)
+        os.replace(temporary, self.path)
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def import_batches(rows, start, registered_at):
+    # Groups validated rows into (rows read so far, items, invalid count)
+    # batches. Duplicate userIds within a batch are collapsed, since
+    # BatchWriteItem rejects a request that writes the same key twice.
+    items = {}
+    invalid = 0
+    end = start
+    for end, record in rows:
+        if end <= start:
+            continue
+        if isinstance(record, str):
+            record = {'userId': record}
+        user_id = api_common.clean_user_id(record.get('userId')) if isinstance(record, dict) else None
+        if user_id is None:
+            invalid += 1
+            continue
+        timestamp = record.get('registeredAt')
+        items[user_id] = api_common.registration_item(
+            user_id, timestamp if isinstance(timestamp, str) else registered_at
+        )
+        if len(items) == BATCH_WRITE_SIZE:
+            yield end, list(items.values()), invalid
+            items = {}
+            invalid = 0
+    if items or invalid:
+        yield end, list(items.values()), invalid
+
+
+def write_batch(dynamodb_client, table_name, items, limiter, backoff):
+    request = {table_name: [{'PutRequest': {'Item': item}} for item in items]}
+    for attempt in range(BATCH_MAX_ATTEMPTS):
+        limiter.acquire(len(request[table_name]))
+        response = dynamodb_client.batch_write_item(RequestItems=request)
+        request = response.get('UnprocessedItems')
+        if not request:
+            return
+        backoff(attempt)
+    raise Exception(f"{len(request[table_name])} items still unprocessed after {BATCH_MAX_ATTEMPTS} attempts")
+
+
+def import_users(dynamodb_client, table_name, rows, checkpoint, workers=8, limiter=None,
+                 delta_table_name=None, checkpoint_seconds=5.0, backoff=None):
+    # Returns the checkpoint counts. Stops at the first batch that cannot be
+    # written, leaving the checkpoint at the last fully written row.
+    limiter = limiter or RateLimiter(0)
+    backoff = backoff or api_common.backoff
+
+    def write(items):
+        if not items:
+            return
+        if delta_table_name:
+            # As in register_user, delta entries go first so verify_user's
+            # Bloom filter never rules an imported user out
+            user_ids = [item['userId']['S'] for item in items]
+            write_batch(dynamodb_client, delta_table_name,
+                        [bloom_filter.delta_item(user_id) for user_id in user_ids], limiter, backoff)
+        write_batch(dynamodb_client, table_name, items, limiter, backoff)
+
+    batches = import_batches(rows, checkpoint.offset, api_common.utc_timestamp())
+    # future -> (sequence, rows read, items, invalid rows)
+    in_flight = {}
+    finished = {}
+    next_sequence = 0
+    saved_at = time.monotonic()
+
+    def collect():
+        nonlocal next_sequence, saved_at
+        completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in completed:
+            sequence, end, imported, invalid = in_flight.pop(future)
+            finished[sequence] = (future, end, imported, invalid)
+        # Batches finish out of order; the checkpoint only moves over the
+        # ones whose predecessors have all been written
+        while next_sequence in finished:
+            future, end, imported, invalid = finished[next_sequence]
+            if future.exception() is not None:
+                raise future.exception()
+            del finished[next_sequence]
+            checkpoint.offset = end
+            checkpoint.counts['imported'] += imported
+            checkpoint.counts['invalid'] += invalid
+            next_sequence += 1
+        if time.monotonic() - saved_at >= checkpoint_seconds:
+            checkpoint.save()
+            saved_at = time.monotonic()
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for sequence, (end, items, invalid) in enumerate(batches):
+                in_flight[pool.submit(write, items)] = (sequence, end, len(items), invalid)
+                if len(in_flight) >= workers * 2:
+                    collect()
+            while in_flight:
+                collect()
+    finally:
+        checkpoint.save()
+    return checkpoint.counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk export and import of the users table')
+    parser.add_argument('--table', default=os.environ.get('DYNAMODB_TABLE'), help='Users table name')
+    parser.add_argument('--format', choices=('ndjson', 'parquet'),
+                        help='File format (default: parquet for *.parquet, otherwise ndjson)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = commands.add_parser('export', help='Parallel segmented scan to a file')
+    export_parser.add_argument('--output', required=True, help="Output file, or - for NDJSON on stdout")
+    export_parser.add_argument('--segments', type=int, default=8, help='Parallel scan segments (one thread each)')
+    export_parser.add_argument('--max-read-units', type=float, default=0,
+                               help='Read capacity units per second across all segments (0 = unlimited)')
+    export_parser.add_argument('--page-size', type=int, help='Items per Scan page (default: 1 MB pages)')
+
+    import_parser = commands.add_parser('import', help='Parallel BatchWriteItem load from a file')
+    import_parser.add_argument('--input', required=True, help='NDJSON or Parquet file of users')
+    import_parser.add_argument('--workers', type=int, default=8, help='Concurrent BatchWriteItem writers')
+    import_parser.add_argument('--max-write-units', type=float, default=0,
+                               help='Items written per second across all workers (0 = unlimited)')
+    import_parser.add_argument('--checkpoint', help='Checkpoint file (default: <input>.checkpoint)')
+    import_parser.add_argument('--delta-table', default=os.environ.get('BLOOM_DELTA_TABLE'),
+                               help='Bloom filter delta table to record imported users in')
+    args = parser.parse_args(argv)
+
+    if not args.table:
+        parser.error('--table (or DYNAMODB_TABLE) is required')
+    path = args.output if args.command == 'export' else args.input
+    fmt = format_for(path, args.format)
+    if fmt == 'parquet' and pyarrow is None:
+        parser.error('Parquet needs pyarrow (pip install pyarrow)')
+    if fmt == 'parquet' and path == '-':
+        parser.error('Parquet output needs a file path')
+
+    # One pooled connection per thread; read before aws_clients is imported
+    threads = args.segments if args.command == 'export' else args.workers
+    os.environ.setdefault('AWS_MAX_POOL_CONNECTIONS', str(max(threads, 10)))
+    import aws_clients
+    dynamodb = aws_clients.get_client('dynamodb')
+
+    started = time.perf_counter()
+    if args.command == 'export':
+        if fmt == 'parquet':
+            writer = ParquetWriter(path)
+        elif path == '-':
+            writer = NdjsonWriter(sys.stdout)
+        else:
+            writer = NdjsonWriter(open(path, 'w', encoding='utf-8'), close_stream=True)
+        exported = export_users(dynamodb, args.table, writer, args.segments,
+                                RateLimiter(args.max_read_units), args.page_size)
+        print(f"Exported {exported} users from {args.table} in {time.perf_counter() - started:.1f}s",
+              file=sys.stderr)
+        return 0
+
+    checkpoint = Checkpoint(args.checkpoint or f'{path}.checkpoint', os.path.abspath(path))
+    if checkpoint.load():
+        print(f"Resuming import of {path} after row {checkpoint.offset}", file=sys.stderr)
+    try:
+        counts = import_users(dynamodb, args.table, read_rows(path, fmt), checkpoint, args.workers,
+                              RateLimiter(args.max_write_units), args.delta_table)
+    except Exception as e:
+        print(f"Import stopped after row {checkpoint.offset}: {str(e)}; "
+              f"rerun the same command to resume from {checkpoint.path}", file=sys.stderr)
+        return 1
+    checkpoint.remove()
+    print(f"Imported {counts['imported']} users into {args.table} ({counts['invalid']} invalid rows skipped) "
+          f"in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,19 +1,493 @@
+import time
+
+_import_started = time.perf_counter()
+
+import gzip
 import json
-import boto3
 import os
+import base64
+import hashlib
 import logging
-from botocore.exceptions import ClientError
+import threading
+from collections import OrderedDict
+from botocore.exceptions import BotoCoreError, ClientError
+
+import admission
+import api_common
+import aws_clients
+import bloom_filter
+import metrics
+import profiling
+import resilience
+import warmup
+
+try:
+    import brotli
+except ImportError:
+    # Not in the Lambda runtime; br is then only served from precompressed objects
+    brotli = None
 
 # Set up logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-dynamodb = boto3.resource('dynamodb')
-s3 = boto3.client('s3')
+# Per-container cache of decoded HTML pages, keyed by (bucket, key).
+# Entries are served without touching S3 until they are older than the TTL,
+# then revalidated with a conditional GET on the stored ETag. If S3 fails,
+# or its circuit breaker is open, while we hold a copy, the stale copy is
+# served instead of an error.
+HTML_CACHE_TTL_SECONDS = float(os.environ.get('HTML_CACHE_TTL_SECONDS', '300'))
+_html_cache = {}
+
+
+def _is_not_modified(error):
+    if not isinstance(error, ClientError):
+        return False
+    code = error.response.get('Error', {}).get('Code')
+    status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return code in ('304', 'NotModified') or status == 304
+
+
+def _get_page_object(request):
+    # Reads the body in the same call so a losing hedged request still
+    # drains its connection back to the pool
+    s3_response = aws_clients.get_client('s3').get_object(**request)
+    return s3_response, s3_response['Body'].read()
+
+
+def get_html_entry(bucket, key):
+    # Returns the cache entry for the page: its body, ETag and any encoded
+    # variants built for this version
+    now = time.monotonic()
+    cached = _html_cache.get((bucket, key))
+    
+    if cached and now - cached['fetched_at'] < HTML_CACHE_TTL_SECONDS:
+        return cached
+    
+    request = {'Bucket': bucket, 'Key': key}
+    if cached and cached['etag']:
+        request['IfNoneMatch'] = cached['etag']
+    
+    try:
+        s3_response, raw = resilience.call('S3', lambda: _get_page_object(request), hedge=True)
+    except (ClientError, BotoCoreError, resilience.CircuitOpenError) as e:
+        if not cached:
+            raise
+        if _is_not_modified(e):
+            logger.info(f"{key} not modified, revalidated cached copy")
+        else:
+            logger.warning(f"Error refreshing {key} from S3, serving stale copy: {str(e)}")
+        cached['fetched_at'] = now
+        return cached
+    
+    entry = {
+        'body': raw.decode('utf-8'),
+        'raw': raw,
+        'etag': s3_response.get('ETag'),
+        'fetched_at': now,
+        # encoding -> (base64 body, compressed size), or None if unavailable
+        'encoded': {},
+        # encoding (None for identity) -> response parts with validators
+        'representations': {}
+    }
+    _html_cache[(bucket, key)] = entry
+    return entry
+
+
+def get_html_page(bucket, key):
+    return get_html_entry(bucket, key)['body']
+
+
+# Which page a verification serves is only known once the membership lookup
+# returns, but both pages are known up front. Pages that must come from S3
+# (not cached yet, or older than HTML_CACHE_TTL_SECONDS) are fetched on the
+# shared pool while the lookup runs, so an uncached request costs about one
+# round trip instead of two. The fetches stay hedged while the pool has
+# headroom (resilience.submit). The page not served stays cached for later
+# requests.
+PAGES = ('index.html', 'error.html')
+
+
+def _is_fresh(bucket, key):
+    cached = _html_cache.get((bucket, key))
+    return cached is not None and time.monotonic() - cached['fetched_at'] < HTML_CACHE_TTL_SECONDS
+
+
+def prefetch_pages(bucket):
+    # Returns a Future of the cache entry for each page being fetched
+    return {
+        key: resilience.submit(lambda key=key: get_html_entry(bucket, key), hedge=True)
+        for key in PAGES
+        if not _is_fresh(bucket, key)
+    }
+
+
+# Compressed responses. Encoded variants live on the page's cache entry, so
+# they are built once per page version and dropped with it when S3 has a new
+# version. With HTML_PRECOMPRESSED, the <key>.br / <key>.gz objects uploaded
+# by deploy.sh are used when their source-md5 metadata matches the page's
+# ETag; otherwise the container compresses the page itself.
+HTML_COMPRESSION = os.environ.get('HTML_COMPRESSION', 'true').lower() == 'true'
+HTML_PRECOMPRESSED = os.environ.get('HTML_PRECOMPRESSED', 'false').lower() == 'true'
+HTML_COMPRESSION_MIN_BYTES = int(os.environ.get('HTML_COMPRESSION_MIN_BYTES', '256'))
+PRECOMPRESSED_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# In server preference order
+SUPPORTED_ENCODINGS = ('br', 'gzip') if brotli or HTML_PRECOMPRESSED else ('gzip',)
+
+# HTTP caching of verification pages. Each representation (page version,
+# outcome and content encoding) gets a strong ETag, and a matching
+# If-None-Match is answered with a bodyless 304. Verified pages can be
+# cached by browsers and the CDN; not-registered pages default to no-cache
+# so a user who registers is seen on the next check, which still only
+# costs a 304 while nothing has changed.
+VERIFY_CACHE_CONTROL = os.environ.get('VERIFY_CACHE_CONTROL', 'public, max-age=60')
+VERIFY_NEGATIVE_CACHE_CONTROL = os.environ.get('VERIFY_NEGATIVE_CACHE_CONTROL', 'no-cache')
+VERIFY_VARY = os.environ.get('VERIFY_VARY', 'Accept-Encoding')
+
+
+def _compress(raw, encoding):
+    if encoding == 'gzip':
+        # Fixed mtime so every container produces identical bytes
+        return gzip.compress(raw, compresslevel=9, mtime=0)
+    if encoding == 'br' and brotli:
+        return brotli.compress(raw, quality=11)
+    return None
+
+
+def _precompressed(bucket, key, entry, encoding):
+    # Returns the precompressed object's bytes, or None to compress locally.
+    # Errors and an open S3 circuit fall back too; the result is cached with
+    # the page version either way.
+    def fetch():
+        s3_response = aws_clients.get_client('s3').get_object(Bucket=bucket, Key=key + PRECOMPRESSED_SUFFIXES[encoding])
+        return s3_response, s3_response['Body'].read()
+    
+    try:
+        s3_response, compressed = resilience.call('S3', fetch)
+    except (ClientError, BotoCoreError, resilience.CircuitOpenError) as e:
+        logger.info(f"No precompressed {encoding} copy of {key}: {str(e)}")
+        return None
+    if s3_response.get('Metadata', {}).get('source-md5') != (entry['etag'] or '').strip('"'):
+        logger.info(f"Precompressed {encoding} copy of {key} is for another version, ignoring it")
+        return None
+    return compressed
+
+
+def encoded_page(bucket, key, entry, encoding):
+    # Returns (base64 body, compressed size) for the page in `encoding`, or
+    # None if it cannot be produced
+    if encoding not in entry['encoded']:
+        compressed = _precompressed(bucket, key, entry, encoding) if HTML_PRECOMPRESSED else None
+        if compressed is None:
+            compressed = _compress(entry['raw'], encoding)
+        entry['encoded'][encoding] = (
+            (base64.b64encode(compressed).decode('ascii'), len(compressed)) if compressed is not None else None
+        )
+    return entry['encoded'][encoding]
+
+
+def _etag(entry, key, encoding):
+    # Strong validator for one representation: page version, page (which
+    # is the verification outcome) and content encoding
+    version = entry['etag'] or hashlib.md5(entry['raw']).hexdigest()
+    digest = hashlib.blake2b(f"{version}|{key}|{encoding or 'identity'}".encode('utf-8'), digest_size=12)
+    return f'"{digest.hexdigest()}"'
+
+
+def _representation(bucket, key, entry, encoding, cache_control):
+    # Body and header dicts for the page in `encoding` (None for identity),
+    # built once per page version; None if the encoding is unavailable
+    representations = entry['representations']
+    if encoding not in representations:
+        if encoding is None:
+            body, size = entry['body'], len(entry['raw'])
+        else:
+            encoded = encoded_page(bucket, key, entry, encoding)
+            if encoded is None:
+                representations[encoding] = None
+                return None
+            body, size = encoded
+        
+        validators = {'ETag': _etag(entry, key, encoding), 'Cache-Control': cache_control}
+        if VERIFY_VARY:
+            validators['Vary'] = VERIFY_VARY
+        headers = dict(api_common.HTML_HEADERS, **validators)
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        representations[encoding] = {
+            'body': body,
+            'size': size,
+            'etag': validators['ETag'],
+            'headers': headers,
+            'not_modified_headers': dict(validators, **{'Access-Control-Allow-Origin': '*'})
+        }
+    return representations[encoding]
+
+
+def html_response(event, bucket, key, entry, cache_control):
+    representation = None
+    if HTML_COMPRESSION and len(entry['raw']) >= HTML_COMPRESSION_MIN_BYTES:
+        for encoding in api_common.accepted_encodings(event, SUPPORTED_ENCODINGS):
+            representation = _representation(bucket, key, entry, encoding, cache_control)
+            if representation is not None:
+                break
+    if representation is None:
+        representation = _representation(bucket, key, entry, None, cache_control)
+    
+    if api_common.etag_matches(api_common.header(event, 'If-None-Match'), representation['etag']):
+        metrics.put_metric('NotModified', 1)
+        metrics.put_metric('ResponseBytes', 0, 'Bytes')
+        return api_common.response(304, '', representation['not_modified_headers'])
+    
+    metrics.put_metric('ResponseBytes', representation['size'], 'Bytes')
+    return api_common.response(
+        200, representation['body'], representation['headers'], is_base64_encoded='Content-Encoding' in representation['headers']
+    )
+
+
+class MembershipCache:
+    # Bounded LRU of userId -> registered status with separate TTLs for
+    # positive and negative results. Lives for the life of the container.
+    # Expired entries stay until evicted as the last known status, which is
+    # served when DynamoDB is unavailable. Shared by the threads of a batch
+    # verification, so every access holds the lock.
+    
+    def __init__(self, max_entries, positive_ttl, negative_ttl):
+        self.max_entries = max_entries
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_hits = 0
+    
+    def get(self, user_id):
+        # Returns True/False for a fresh entry, or None on a miss
+        with self.lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                registered, expires_at = entry
+                if time.monotonic() < expires_at:
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    return registered
+            self.misses += 1
+            return None
+    
+    def last_known(self, user_id):
+        # The cached status regardless of age, or None
+        with self.lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            self.stale_hits += 1
+            return entry[0]
+    
+    def put(self, user_id, registered):
+        if self.max_entries <= 0:
+            return
+        ttl = self.positive_ttl if registered else self.negative_ttl
+        with self.lock:
+            self._entries[user_id] = (registered, time.monotonic() + ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'stale_hits': self.stale_hits
+            }
+
+
+membership_cache = MembershipCache(
+    max_entries=int(os.environ.get('MEMBERSHIP_CACHE_MAX_ENTRIES', '10000')),
+    positive_ttl=float(os.environ.get('MEMBERSHIP_CACHE_POSITIVE_TTL_SECONDS', '60')),
+    negative_ttl=float(os.environ.get('MEMBERSHIP_CACHE_NEGATIVE_TTL_SECONDS', '5'))
+)
+
+# Read through to DynamoDB with a strongly consistent read on a cache miss,
+# so a user registered moments ago is never cached as unknown
+MEMBERSHIP_CONSISTENT_READ = os.environ.get('MEMBERSHIP_CONSISTENT_READ', 'false').lower() == 'true'
+
+
+# Bloom filter snapshot of registered users (see bloom_filter.py). Enabled
+# when BLOOM_DELTA_TABLE is set; a definite miss skips the DynamoDB lookup.
+BLOOM_DELTA_TABLE = os.environ.get('BLOOM_DELTA_TABLE')
+BLOOM_FILTER_KEY = os.environ.get('BLOOM_FILTER_KEY', 'bloom/users.bloom')
+BLOOM_REFRESH_SECONDS = float(os.environ.get('BLOOM_REFRESH_SECONDS', '300'))
+BLOOM_DELTA_REFRESH_SECONDS = float(os.environ.get('BLOOM_DELTA_REFRESH_SECONDS', '1'))
+_bloom_membership = None
+
+
+def get_bloom_membership():
+    global _bloom_membership
+    if _bloom_membership is None and BLOOM_DELTA_TABLE and os.environ.get('S3_BUCKET'):
+        _bloom_membership = bloom_filter.BloomMembership(
+            aws_clients.get_client('s3'),
+            os.environ['S3_BUCKET'],
+            BLOOM_FILTER_KEY,
+            aws_clients.get_client('dynamodb'),
+            BLOOM_DELTA_TABLE,
+            BLOOM_REFRESH_SECONDS,
+            BLOOM_DELTA_REFRESH_SECONDS
+        )
+    return _bloom_membership
+
+
+def user_is_registered(table_name, user_id):
+    registered = membership_cache.get(user_id)
+    if registered is not None:
+        metrics.put_metric('MembershipCacheHit', 1)
+        return registered
+    metrics.put_metric('MembershipCacheMiss', 1)
+    
+    bloom = get_bloom_membership()
+    if bloom and bloom.definitely_absent(user_id):
+        metrics.put_metric('BloomShortCircuit', 1)
+        return False
+    
+    dynamodb = aws_clients.get_client('dynamodb')
+    try:
+        response = resilience.call('DynamoDB', lambda: dynamodb.get_item(
+            TableName=table_name,
+            Key={'userId': {'S': user_id}},
+            ProjectionExpression='userId, expiresAt',
+            ConsistentRead=MEMBERSHIP_CONSISTENT_READ
+        ), hedge=True)
+    except Exception as e:
+        registered = membership_cache.last_known(user_id) if resilience.is_unavailable(e) else None
+        if registered is None:
+            raise
+        logger.warning(f"DynamoDB unavailable, using last known status of {user_id}: {str(e)}")
+        metrics.put_metric('StaleMembership', 1)
+        return registered
+    registered = 'Item' in response and not api_common.is_expired(response['Item'])
+    membership_cache.put(user_id, registered)
+    return registered
+
+
+# Batch verification: GET /?userIds=a,b,c, or POST /verify with a JSON body
+# of userIds, answered with a JSON map of userId to registered status. GET
+# requests never read a body.
+BATCH_VERIFY_MAX_USERS = int(os.environ.get('BATCH_VERIFY_MAX_USERS', '100'))
+BATCH_GET_SIZE = 100
+BATCH_MAX_ATTEMPTS = 8
+
+
+def _batch_user_ids(event, query_params):
+    # Returns the requested userIds, or None if this is not a batch request.
+    # Raises ValueError on a malformed body.
+    if query_params and 'userIds' in query_params:
+        return [user_id.strip() for user_id in query_params['userIds'].split(',')]
+    
+    if not event.get('body') or (query_params and 'userId' in query_params):
+        return None
+    if (event.get('routeKey') or '').startswith('GET '):
+        return None
+    
+    payload = json.loads(api_common.request_body(event))
+    if isinstance(payload, dict):
+        payload = payload.get('userIds')
+    if not isinstance(payload, list) or not all(isinstance(user_id, str) for user_id in payload):
+        raise ValueError("expected a list of userId strings or an object with a userIds list")
+    return [user_id.strip() for user_id in payload]
+
+
+def _batch_get_registered(table_name, user_ids):
+    # The registered users among user_ids, from BatchGetItem calls for the
+    # key and expiry. Each call goes through DynamoDB's breaker; batches are
+    # not hedged, as their latency says little about a single GetItem's.
+    dynamodb = aws_clients.get_client('dynamodb')
+    registered = set()
+    request = {table_name: {
+        'Keys': [{'userId': {'S': user_id}} for user_id in user_ids],
+        'ProjectionExpression': 'userId, expiresAt',
+        'ConsistentRead': MEMBERSHIP_CONSISTENT_READ
+    }}
+    for attempt in range(BATCH_MAX_ATTEMPTS):
+        response = resilience.call('DynamoDB', lambda: dynamodb.batch_get_item(RequestItems=request))
+        for item in response.get('Responses', {}).get(table_name, []):
+            if not api_common.is_expired(item):
+                registered.add(item['userId']['S'])
+        request = response.get('UnprocessedKeys')
+        if not request:
+            return registered
+        api_common.backoff(attempt)
+    raise Exception("Failed to verify users: unprocessed keys remain after retries")
+
+
+def verify_users_batch(table_name, user_ids):
+    # Resolves membership from the cache and Bloom filter where possible,
+    # then with BatchGetItem calls, following UnprocessedKeys with jittered
+    # backoff until every key is answered. While DynamoDB is unavailable the
+    # remaining users get their last known status, or the batch fails if any
+    # of them has none.
+    results = {}
+    for user_id in user_ids:
+        cached = membership_cache.get(user_id)
+        if cached is not None:
+            results[user_id] = cached
+    
+    bloom = get_bloom_membership()
+    if bloom:
+        for user_id in user_ids:
+            if user_id not in results and bloom.definitely_absent(user_id):
+                results[user_id] = False
+    misses = [user_id for user_id in user_ids if user_id not in results]
+    
+    try:
+        for i in range(0, len(misses), BATCH_GET_SIZE):
+            chunk = misses[i:i + BATCH_GET_SIZE]
+            registered = _batch_get_registered(table_name, chunk)
+            for user_id in chunk:
+                results[user_id] = user_id in registered
+                membership_cache.put(user_id, results[user_id])
+    except Exception as e:
+        if not resilience.is_unavailable(e):
+            raise
+        stale = [user_id for user_id in misses if user_id not in results]
+        for user_id in stale:
+            registered = membership_cache.last_known(user_id)
+            if registered is None:
+                raise
+            results[user_id] = registered
+        logger.warning(f"DynamoDB unavailable, using last known status of {len(stale)} users: {str(e)}")
+        metrics.put_metric('StaleMembership', len(stale))
+    return {user_id: results[user_id] for user_id in user_ids}
+
+
+def handle_batch_verification(table_name, user_ids):
+    user_ids = list(dict.fromkeys(user_id for user_id in user_ids if user_id))
+    
+    if not user_ids or len(user_ids) > BATCH_VERIFY_MAX_USERS:
+        return api_common.error_response(
+            400, f'Batch verification requires between 1 and {BATCH_VERIFY_MAX_USERS} userIds'
+        )
+    
+    with metrics.phase('DynamoDB'):
+        results = verify_users_batch(table_name, user_ids)
+    logger.info(f"Batch verification of {len(results)} users, {sum(results.values())} registered")
+    metrics.put_metric('BatchUsers', len(results))
+    
+    with metrics.phase('Serialization'):
+        body = json.dumps({'results': results}, separators=(',', ':'))
+    return api_common.response(200, body)
+
 
-def lambda_handler(event, context):
+def handle_verify(event, context):
+    # GET /; deployed behind the user_api router, or on its own through
+    # lambda_handler below
     try:
-        logger.info(f"Event received: {json.dumps(event)}")
+        metrics.log_event(event)
         
         # Check if environment variables are set
         table_name = os.environ.get('DYNAMODB_TABLE')
@@ -28,64 +502,60 @@ def lambda_handler(event, context):
         if not s3_bucket:
             raise Exception("S3_BUCKET environment variable not set")
         
-        table = dynamodb.Table(table_name)
-        
         # Extract userId from query parameters
         query_params = event.get('queryStringParameters', {})
         logger.info(f"Query parameters: {query_params}")
         
-        if not query_params or 'userId' not in query_params:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Missing userId parameter'})
-            }
+        validation_started = time.perf_counter()
+        try:
+            batch_user_ids = _batch_user_ids(event, query_params)
+        except ValueError as e:
+            metrics.set_outcome('bad_request')
+            return api_common.error_response(400, f'Invalid batch verification body: {str(e)}')
         
-        user_id = query_params['userId'].strip()
+        if batch_user_ids is not None:
+            metrics.set_outcome('batch')
+            return handle_batch_verification(table_name, batch_user_ids)
         
-        if not user_id:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Empty userId value'})
-            }
+        user_id, bad_request = api_common.user_id_param(query_params)
+        if bad_request:
+            metrics.set_outcome('bad_request')
+            return bad_request
+        
+        metrics.add_timing('Validation', time.perf_counter() - validation_started)
+        
+        pages = prefetch_pages(s3_bucket)
         
         # Check if user exists in DynamoDB
         try:
-            response = table.get_item(Key={'userId': user_id})
-            user_exists = 'Item' in response
+            with metrics.phase('DynamoDB'):
+                user_exists = user_is_registered(table_name, user_id)
             
-            logger.info(f"User {user_id} exists: {user_exists}")
+            logger.info(f"User {user_id} exists: {user_exists}, membership cache: {membership_cache.stats()}")
             
             # Determine which HTML file to serve
+            metrics.set_outcome('verified' if user_exists else 'not_registered')
             if user_exists:
-                html_file = 'index.html'
+                html_file, cache_control = 'index.html', VERIFY_CACHE_CONTROL
                 logger.info(f"User {user_id} verified successfully, serving index.html")
             else:
-                html_file = 'error.html'
+                html_file, cache_control = 'error.html', VERIFY_NEGATIVE_CACHE_CONTROL
                 logger.info(f"User {user_id} not found, serving error.html")
             
-            # Get HTML content from S3
+            # Get HTML content from S3, compressed if the client accepts it.
+            # A prefetched page was fetched during the lookup, so the S3
+            # phase is only the time left waiting for it.
             try:
-                s3_response = s3.get_object(Bucket=s3_bucket, Key=html_file)
-                html_content = s3_response['Body'].read().decode('utf-8')
+                with metrics.phase('S3'):
+                    if html_file in pages:
+                        page = pages[html_file].result()
+                    else:
+                        page = get_html_entry(s3_bucket, html_file)
                 
-                logger.info(f"Successfully retrieved {html_file} from S3")
+                logger.info(f"Serving {html_file}")
                 
-                return {
-                    'statusCode': 200,
-                    'headers': {
-                        'Content-Type': 'text/html',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': html_content
-                }
+                with metrics.phase('Compression'):
+                    return html_response(event, s3_bucket, html_file, page, cache_control)
                 
             except ClientError as e:
                 logger.error(f"Error retrieving {html_file} from S3: {str(e)}")
@@ -95,13 +565,44 @@ def lambda_handler(event, context):
             logger.error(f"Error checking user in DynamoDB: {str(e)}")
             raise Exception("Failed to check user in DynamoDB")
         
+    except resilience.CircuitOpenError as e:
+        logger.warning(f"Failing fast: {str(e)}")
+        metrics.set_outcome('circuit_open')
+        return api_common.overloaded(e.retry_after)
     except Exception as e:
         logger.error(f"Error in lambda_handler: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': f'Internal server error: {str(e)}'})
-        } 
\ No newline at end of file
+        metrics.set_outcome('error')
+        return api_common.server_error(e)
+
+
+def prime_caches(event):
+    # Warm-up primer: creates the clients, loads both pages with every
+    # representation a request could ask for, loads the Bloom filter and,
+    # if the warm-up event lists userIds, fills the membership cache
+    table_name = os.environ.get('DYNAMODB_TABLE')
+    s3_bucket = os.environ.get('S3_BUCKET')
+    aws_clients.get_client('dynamodb')
+    aws_clients.get_client('s3')
+    resilience.get_executor()
+    if s3_bucket:
+        for html_file, cache_control in (('index.html', VERIFY_CACHE_CONTROL),
+                                         ('error.html', VERIFY_NEGATIVE_CACHE_CONTROL)):
+            entry = get_html_entry(s3_bucket, html_file)
+            _representation(s3_bucket, html_file, entry, None, cache_control)
+            if HTML_COMPRESSION and len(entry['raw']) >= HTML_COMPRESSION_MIN_BYTES:
+                for encoding in SUPPORTED_ENCODINGS:
+                    _representation(s3_bucket, html_file, entry, encoding, cache_control)
+    get_bloom_membership()
+    user_ids = [user_id for user_id in event.get('userIds') or [] if isinstance(user_id, str) and user_id]
+    if table_name and user_ids:
+        verify_users_batch(table_name, list(dict.fromkeys(user_ids))[:BATCH_VERIFY_MAX_USERS])
+
+
+warmup.register_primer('verify_user', prime_caches)
+
+lambda_handler = metrics.instrumented('verify_user')(
+    warmup.intercept(profiling.profiled(admission.controlled(handle_verify)))
+)
+
+
+aws_clients.record_import('verify_user', _import_started)
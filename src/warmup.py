@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import aws_clients
+import metrics
+
+# Warm-up invocations.
+#
+# The scheduled warmer (the `warmer` variable of infra/modules/lambda) and
+# deploy.sh invoke the function with {"warmup": true, "concurrency": N}.
+# That invocation calls the function N-1 more times in parallel with
+# concurrency 1. Every warm-up invocation keeps its container busy for at
+# least WARMUP_HOLD_MS, so Lambda cannot serve two of the parallel calls
+# from one container and N containers end up warm.
+#
+# A warm-up runs the primers the handler modules register here (client
+# creation, page and Bloom filter loading, cache filling) and returns
+# without running any route or touching user data.
+
+logger = logging.getLogger()
+
+WARMUP_KEY = 'warmup'
+WARMUP_HOLD_MS = float(os.environ.get('WARMUP_HOLD_MS', '150'))
+WARMUP_MAX_CONCURRENCY = int(os.environ.get('WARMUP_MAX_CONCURRENCY', '20'))
+
+# (name, primer(event)) in registration order
+_primers = []
+
+
+def register_primer(name, primer):
+    _primers.append((name, primer))
+
+
+def is_warmup(event):
+    return isinstance(event, dict) and event.get(WARMUP_KEY) is True
+
+
+def prime(event):
+    # Returns the milliseconds each primer took, or 'failed'; a failing
+    # primer never fails the warm-up
+    timings = {}
+    for name, primer in _primers:
+        started = time.perf_counter()
+        try:
+            primer(event)
+            timings[name] = round((time.perf_counter() - started) * 1000, 2)
+        except Exception as e:
+            logger.warning(f"Warm-up primer {name} failed: {str(e)}")
+            timings[name] = 'failed'
+    return timings
+
+
+def fan_out(context, concurrency):
+    # Invokes this function concurrency - 1 more times in parallel and
+    # returns how many of those invocations succeeded
+    if concurrency <= 1 or context is None:
+        return 0
+    lambda_client = aws_clients.get_client('lambda')
+    payload = json.dumps({WARMUP_KEY: True, 'concurrency': 1}).encode('utf-8')
+
+    def invoke(_):
+        try:
+            response = lambda_client.invoke(
+                FunctionName=context.invoked_function_arn,
+                InvocationType='RequestResponse',
+                Payload=payload
+            )
+            return 'FunctionError' not in response
+        except Exception as e:
+            logger.warning(f"Warm-up invocation failed: {str(e)}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=concurrency - 1) as pool:
+        return sum(pool.map(invoke, range(concurrency - 1)))
+
+
+def handle(event, context):
+    started = time.perf_counter()
+    request_metrics = metrics.current()
+    metrics.set_outcome('warmup')
+
+    concurrency = event.get('concurrency', 1)
+    if not isinstance(concurrency, int) or concurrency < 1:
+        concurrency = 1
+    concurrency = min(concurrency, WARMUP_MAX_CONCURRENCY)
+
+    timings = prime(event)
+    invoked = fan_out(context, concurrency)
+
+    held_ms = (time.perf_counter() - started) * 1000
+    if held_ms < WARMUP_HOLD_MS:
+        time.sleep((WARMUP_HOLD_MS - held_ms) / 1000)
+
+    result = {
+        'warmup': True,
+        'coldStart': bool(request_metrics and request_metrics.cold_start),
+        'primed': timings,
+        'invoked': invoked
+    }
+    logger.info(f"Warm-up: {json.dumps(result)}")
+    return result
+
+
+def intercept(handler):
+    # Decorator for lambda_handler, inside metrics.instrumented: warm-up
+    # events are answered here and never reach the handler
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        if is_warmup(event):
+            return handle(event, context)
+        return handler(event, context)
+    return wrapper
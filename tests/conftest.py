@@ -4,6 +4,70 @@ import time
 from typing import Optional
 import subprocess
 import json
+import sys
+
+# Make the Lambda sources importable for the offline handler tests
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../src'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import admission
+import aws_clients
+import resilience
+import verify_user
+from local_aws import users_stack
+
+# Options for the offline `stack` fixture, set per module with
+# `pytestmark = pytest.mark.stack(...)` or per test with the same marker
+STACK_DEFAULTS = {
+    'table': 'users-test',
+    'bucket': 'static-test',
+    'latency': 0.0,
+    # userIds registered before the test runs
+    'users': (),
+    # (positive, negative) membership cache TTLs in seconds
+    'membership_ttls': (60, 0),
+    'membership_entries': 100,
+    # (failure threshold, reset seconds) for every circuit breaker
+    'circuit': (resilience.CIRCUIT_FAILURE_THRESHOLD, resilience.CIRCUIT_RESET_SECONDS)
+}
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'stack(**options): configure the offline stack fixture (see STACK_DEFAULTS)')
+
+def stack_options(request):
+    marker = request.node.get_closest_marker('stack')
+    return dict(STACK_DEFAULTS, **(marker.kwargs if marker else {}))
+
+@pytest.fixture
+def fresh_dependencies(request, monkeypatch):
+    """Closed circuit breakers, empty latency trackers and fresh admission state"""
+    threshold, reset_seconds = stack_options(request)['circuit']
+    monkeypatch.setattr(resilience, 'breakers', {
+        name: resilience.CircuitBreaker(name, threshold, reset_seconds) for name in resilience.breakers
+    })
+    monkeypatch.setattr(resilience, 'trackers', {name: resilience.LatencyTracker() for name in resilience.breakers})
+    monkeypatch.setattr(admission, 'caller_limiter', admission.CallerLimiter(
+        admission.CALLER_RATE_PER_SECOND, admission.CALLER_BURST, admission.CALLER_BUCKETS_MAX
+    ) if admission.caller_limiter else None)
+    monkeypatch.setattr(admission, 'shedder', admission.LatencyShedder(
+        admission.SHED_P99_THRESHOLD_MS, admission.SHED_WINDOW_SECONDS, admission.SHED_MIN_SAMPLES, admission.SHED_PROBE_RATE
+    ) if admission.shedder else None)
+
+@pytest.fixture
+def stack(request, monkeypatch, fresh_dependencies):
+    """In-memory users table and static bucket injected as the AWS clients, with empty verify_user caches"""
+    options = stack_options(request)
+    dynamodb, s3 = users_stack(options['table'], options['bucket'], latency=options['latency'])
+    for user_id in options['users']:
+        dynamodb.put_item(TableName=options['table'], Item={'userId': {'S': user_id}})
+    monkeypatch.setenv('DYNAMODB_TABLE', options['table'])
+    monkeypatch.setenv('S3_BUCKET', options['bucket'])
+    monkeypatch.setitem(aws_clients._clients, 'dynamodb', dynamodb)
+    monkeypatch.setitem(aws_clients._clients, 's3', s3)
+    monkeypatch.setattr(verify_user, '_html_cache', {})
+    monkeypatch.setattr(verify_user, 'membership_cache', verify_user.MembershipCache(options['membership_entries'], *options['membership_ttls']))
+    monkeypatch.setattr(verify_user, '_bloom_membership', None)
+    return dynamodb, s3
 
 def load_infra_output(key):
     try:
@@ -0,0 +1,255 @@
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+from bisect import bisect_left
+from itertools import accumulate
+
+import aiohttp
+
+# Open-loop load generator for the register/verify API.
+#
+# Requests are issued on a fixed schedule (rate requests per second)
+# whether or not earlier requests have completed, so a slow backend shows
+# up as queueing instead of silently lowering the offered load. Latency is
+# measured from each request's *intended* start time, which corrects for
+# coordinated omission; the time from sending the request on a connection
+# is reported alongside as service time.
+#
+#   python load_generator.py --rate 50 --duration 60 --verify-ratio 0.9
+#   python load_generator.py --url http://127.0.0.1:3000 --rate 200
+
+COLD_START_HEADER = 'X-Cold-Start'
+# API Gateway and the handlers' load shedding answer with these when throttling
+THROTTLE_STATUSES = (429, 503)
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram:
+    # Log-bucketed histogram with ~1% relative precision, in the spirit of
+    # HdrHistogram: memory stays constant however many samples are recorded
+
+    PRECISION = 0.01
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _bucket(self, seconds):
+        micros = max(seconds * 1e6, 1.0)
+        return int(math.log(micros) / math.log1p(self.PRECISION))
+
+    def record(self, seconds):
+        bucket = self._bucket(seconds)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        for bucket, n in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        # Upper edge of the bucket holding the requested rank, in seconds
+        if not self.count:
+            return 0.0
+        rank = max(1, int(math.ceil(percent / 100 * self.count)))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min((1 + self.PRECISION) ** (bucket + 1) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        summary = {f'p{percent:g}_ms': round(self.percentile(percent) * 1000, 2) for percent in PERCENTILES}
+        summary['mean_ms'] = round(self.total / self.count * 1000, 2) if self.count else 0.0
+        summary['max_ms'] = round(self.max * 1000, 2)
+        return summary
+
+
+class ZipfUserIds:
+    # userIds drawn from a fixed population with Zipf-distributed popularity:
+    # user rank k is chosen with probability proportional to 1 / k**exponent
+
+    def __init__(self, population, exponent=1.1, prefix='load', rng=None):
+        self.population = population
+        self.prefix = prefix
+        self.rng = rng or random.Random()
+        self.cumulative = list(accumulate(1.0 / (rank ** exponent) for rank in range(1, population + 1)))
+
+    def user_id(self, rank):
+        return f"{self.prefix}_{rank:07d}"
+
+    def sample(self):
+        rank = bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1]) + 1
+        return self.user_id(min(rank, self.population))
+
+
+class OperationStats:
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.service_time = LatencyHistogram()
+        self.statuses = {}
+        self.ok = 0
+        self.throttled = 0
+        self.errors = 0
+        self.cold_starts = 0
+
+    def record(self, status, intended, sent, finished, cold_start=False):
+        self.latency.record(finished - intended)
+        self.service_time.record(finished - sent)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if isinstance(status, int) and status < 400:
+            self.ok += 1
+        elif status in THROTTLE_STATUSES:
+            self.throttled += 1
+        else:
+            self.errors += 1
+        if cold_start:
+            self.cold_starts += 1
+
+    def merge(self, other):
+        self.latency.merge(other.latency)
+        self.service_time.merge(other.service_time)
+        for status, n in other.statuses.items():
+            self.statuses[status] = self.statuses.get(status, 0) + n
+        self.ok += other.ok
+        self.throttled += other.throttled
+        self.errors += other.errors
+        self.cold_starts += other.cold_starts
+
+    def summary(self, elapsed):
+        count = self.latency.count
+        return {
+            'requests': count,
+            'throughput_rps': round(self.ok / elapsed, 2) if elapsed else 0.0,
+            'error_rate': round(self.errors / count, 4) if count else 0.0,
+            'throttle_rate': round(self.throttled / count, 4) if count else 0.0,
+            'cold_starts': self.cold_starts,
+            'statuses': {str(status): n for status, n in sorted(self.statuses.items(), key=lambda s: str(s[0]))},
+            'latency': self.latency.summary(),
+            'service_time': self.service_time.summary()
+        }
+
+
+async def _on_request_headers_sent(session, trace_context, params):
+    # Service time starts once a pooled connection has been obtained
+    trace_context.trace_request_ctx['sent'] = time.perf_counter()
+
+
+async def _send(session, method, url, user_id, intended, stats, timeout):
+    timing = {'sent': time.perf_counter()}
+    try:
+        async with session.request(method, url, params={'userId': user_id}, trace_request_ctx=timing,
+                                   timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            await response.read()
+            stats.record(response.status, intended, timing['sent'], time.perf_counter(),
+                         response.headers.get(COLD_START_HEADER) == 'true')
+    except asyncio.TimeoutError:
+        stats.record('timeout', intended, timing['sent'], time.perf_counter())
+    except aiohttp.ClientError as e:
+        stats.record(type(e).__name__, intended, timing['sent'], time.perf_counter())
+
+
+async def run_load(url, rate, duration, verify_ratio=0.9, population=10000, zipf_exponent=1.1,
+                   max_connections=100, timeout=10.0, seed=None):
+    rng = random.Random(seed)
+    user_ids = ZipfUserIds(population, zipf_exponent, rng=rng)
+    stats = {'register': OperationStats(), 'verify': OperationStats()}
+    base_url = url.rstrip('/')
+    total = int(rate * duration)
+    tasks = []
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_headers_sent.append(_on_request_headers_sent)
+    connector = aiohttp.TCPConnector(limit=max_connections)
+    async with aiohttp.ClientSession(connector=connector, trace_configs=[trace_config]) as session:
+        started = time.perf_counter()
+        for i in range(total):
+            intended = started + i / rate
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if rng.random() < verify_ratio:
+                method, target, operation_stats = 'GET', f'{base_url}/', stats['verify']
+            else:
+                method, target, operation_stats = 'POST', f'{base_url}/register', stats['register']
+            tasks.append(asyncio.ensure_future(
+                _send(session, method, target, user_ids.sample(), intended, operation_stats, timeout)
+            ))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    overall = OperationStats()
+    for operation_stats in stats.values():
+        overall.merge(operation_stats)
+
+    return {
+        'target': base_url,
+        'offered_rps': rate,
+        'duration_s': round(elapsed, 2),
+        'overall': overall.summary(elapsed),
+        'operations': {name: operation_stats.summary(elapsed) for name, operation_stats in stats.items()}
+    }
+
+
+def format_report(report):
+    lines = [
+        f"Target {report['target']}: offered {report['offered_rps']} req/s for {report['duration_s']} s",
+        f"{'operation':<10}{'requests':>9}{'ok/s':>9}{'errors':>8}{'throttled':>10}{'cold':>6}"
+        + ''.join(f"{'p' + format(p, 'g'):>9}" for p in PERCENTILES) + f"{'max':>9}"
+    ]
+    for name, summary in [('overall', report['overall'])] + list(report['operations'].items()):
+        latency = summary['latency']
+        lines.append(
+            f"{name:<10}{summary['requests']:>9}{summary['throughput_rps']:>9}"
+            f"{summary['error_rate']:>8.2%}{summary['throttle_rate']:>10.2%}{summary['cold_starts']:>6}"
+            + ''.join(f"{latency[f'p{p:g}_ms']:>9}" for p in PERCENTILES) + f"{latency['max_ms']:>9}"
+        )
+    lines.append('Latencies in ms from intended start (coordinated-omission corrected); '
+                 'see --json for service times and status counts')
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Open-loop load generator for the user management API')
+    parser.add_argument('--url', help='API base URL (default: deployed API Gateway URL from infra outputs)')
+    parser.add_argument('--rate', type=float, default=20.0, help='Requests per second')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds to generate load for')
+    parser.add_argument('--verify-ratio', type=float, default=0.9, help='Fraction of requests that are verifies')
+    parser.add_argument('--users', type=int, default=10000, help='Size of the userId population')
+    parser.add_argument('--zipf-exponent', type=float, default=1.1, help='Skew of userId popularity')
+    parser.add_argument('--max-connections', type=int, default=100)
+    parser.add_argument('--timeout', type=float, default=10.0, help='Per-request timeout in seconds')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', action='store_true', help='Print the full report as JSON')
+    args = parser.parse_args(argv)
+
+    url = args.url
+    if not url:
+        from conftest import get_api_gateway_url
+        url = get_api_gateway_url()
+    if not url:
+        parser.error('No API URL found; pass --url or export the infra outputs')
+
+    report = asyncio.run(run_load(
+        url, args.rate, args.duration, args.verify_ratio, args.users, args.zipf_exponent,
+        args.max_connections, args.timeout, args.seed
+    ))
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,371 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import base64
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from local_aws import InMemorySQS, users_stack
+
+# Local stand-in for the deployed HTTP API.
+#
+# Each HTTP request becomes an API Gateway v2 (payload format 2.0) event,
+# is matched against the route_key values the api-gateway module is given
+# in infra/main.tf, and is passed to user_api.lambda_handler with a Lambda
+# context, just as in the deployed stack. The handler's result is turned
+# back into an HTTP response the way API Gateway does it. DynamoDB, S3 and
+# (with --async-registration) SQS are the stand-ins from local_aws.py, held
+# in memory or saved to --data-dir; no AWS account or credentials are used.
+#
+# Requests are served concurrently, one thread each, by a single process,
+# so all of them share one "container": its caches, circuit breakers and
+# admission limits. Deployed, each concurrent request gets its own.
+#
+#   python local_api.py --port 3000
+#   python local_api.py --port 3000 --data-dir .local-api --latency 0.005
+#   python load_generator.py --url http://127.0.0.1:3000 --rate 200
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+INFRA_MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'infra', 'main.tf')
+ROUTE_KEY = re.compile(r'route_key\s*=\s*"([^"]+)"')
+
+TABLE_NAME = 'users-local'
+BUCKET_NAME = 'static-local'
+QUEUE_NAME = 'registrations-local'
+FUNCTION_NAME = 'user_api'
+ACCOUNT_ID = '000000000000'
+API_ID = 'local'
+
+# What API Gateway answers itself, without invoking the function
+NOT_FOUND_BODY = json.dumps({'message': 'Not Found'}).encode('utf-8')
+INTERNAL_ERROR_BODY = json.dumps({'message': 'Internal Server Error'}).encode('utf-8')
+# As configured by cors_configuration in the api-gateway module
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET,POST,OPTIONS',
+    'Access-Control-Allow-Headers': '*'
+}
+
+
+def load_route_keys(path=INFRA_MAIN):
+    with open(path) as f:
+        route_keys = ROUTE_KEY.findall(f.read())
+    if not route_keys:
+        raise ValueError(f"No route_key values found in {path}")
+    return route_keys
+
+
+def match_route(route_keys, method, path):
+    # Exact "METHOD /path" first, then "ANY /path", then $default
+    for route_key in (f'{method} {path}', f'ANY {path}', '$default'):
+        if route_key in route_keys:
+            return route_key
+    return None
+
+
+def to_event(method, target, headers, body, route_key, source_ip):
+    # API Gateway v2 payload format 2.0. headers is a list of (name, value)
+    # pairs; repeated headers and query parameters are joined with commas.
+    url = urlsplit(target)
+    now = datetime.now(timezone.utc)
+    joined = {}
+    for name, value in headers:
+        name = name.lower()
+        joined[name] = f'{joined[name]},{value}' if name in joined else value
+    cookies = [cookie.strip() for cookie in joined.pop('cookie', '').split(';') if cookie.strip()]
+
+    event = {
+        'version': '2.0',
+        'routeKey': route_key,
+        'rawPath': url.path,
+        'rawQueryString': url.query,
+        'headers': joined,
+        'requestContext': {
+            'accountId': ACCOUNT_ID,
+            'apiId': API_ID,
+            'domainName': joined.get('host', 'localhost'),
+            'domainPrefix': API_ID,
+            'http': {
+                'method': method,
+                'path': url.path,
+                'protocol': 'HTTP/1.1',
+                'sourceIp': source_ip,
+                'userAgent': joined.get('user-agent', '')
+            },
+            'requestId': uuid.uuid4().hex,
+            'routeKey': route_key,
+            'stage': '$default',
+            'time': now.strftime('%d/%b/%Y:%H:%M:%S +0000'),
+            'timeEpoch': int(now.timestamp() * 1000)
+        },
+        'isBase64Encoded': False
+    }
+    if cookies:
+        event['cookies'] = cookies
+    query = {}
+    for name, value in parse_qsl(url.query, keep_blank_values=True):
+        query[name] = f'{query[name]},{value}' if name in query else value
+    if query:
+        event['queryStringParameters'] = query
+    if body:
+        try:
+            event['body'] = body.decode('utf-8')
+        except UnicodeDecodeError:
+            event['body'] = base64.b64encode(body).decode('ascii')
+            event['isBase64Encoded'] = True
+    return event
+
+
+def to_http(result):
+    # Returns (status, [(header, value)], body bytes) for a handler result.
+    # A result without statusCode is sent as a 200 JSON body, as API Gateway
+    # does for payload format 2.0.
+    if not isinstance(result, dict) or 'statusCode' not in result:
+        body = result if isinstance(result, str) else json.dumps(result)
+        return 200, [('Content-Type', 'application/json')], body.encode('utf-8')
+
+    headers = [(name, str(value)) for name, value in (result.get('headers') or {}).items()]
+    headers.extend(('Set-Cookie', cookie) for cookie in result.get('cookies') or [])
+    body = result.get('body') or ''
+    if result.get('isBase64Encoded'):
+        body = base64.b64decode(body)
+    elif isinstance(body, str):
+        body = body.encode('utf-8')
+    return int(result['statusCode']), headers, body
+
+
+class LambdaContext:
+
+    def __init__(self, function_name, timeout_seconds):
+        self.function_name = function_name
+        self.function_version = '$LATEST'
+        self.invoked_function_arn = f'arn:aws:lambda:us-east-1:{ACCOUNT_ID}:function:{function_name}'
+        self.memory_limit_in_mb = 128
+        self.aws_request_id = str(uuid.uuid4())
+        self.log_group_name = f'/aws/lambda/{function_name}'
+        self.log_stream_name = 'local'
+        self.deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+
+class LocalApi(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler, route_keys, function_name=FUNCTION_NAME, timeout_seconds=10, quiet=True):
+        self.handler = handler
+        self.route_keys = set(route_keys)
+        self.function_name = function_name
+        self.timeout_seconds = timeout_seconds
+        self.quiet = quiet
+        super().__init__(address, _RequestHandler)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def invoke(self, event):
+        return self.handler(event, LambdaContext(self.function_name, self.timeout_seconds))
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keep-alive, so load tests reuse their connections. Headers
+    # and body are separate writes; without TCP_NODELAY the body waits for
+    # the client's delayed ACK (~40 ms) on every kept-alive request.
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def _send(self, status, headers, body):
+        self.send_response(status)
+        for name, value in headers:
+            if name.lower() not in ('content-length', 'connection'):
+                self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _serve(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        route_key = match_route(self.server.route_keys, self.command, urlsplit(self.path).path)
+        if route_key is None:
+            self._send(404, [('Content-Type', 'application/json')], NOT_FOUND_BODY)
+            return
+
+        event = to_event(self.command, self.path, self.headers.items(), body, route_key, self.client_address[0])
+        try:
+            result = self.server.invoke(event)
+        except Exception as e:
+            # An unhandled exception in the function
+            sys.stderr.write(f"{self.server.function_name} raised {type(e).__name__}: {str(e)}\n")
+            self._send(500, [('Content-Type', 'application/json')], INTERNAL_ERROR_BODY)
+            return
+        self._send(*to_http(result))
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _serve
+
+    def do_OPTIONS(self):
+        # CORS preflight, answered by API Gateway itself
+        if self.headers.get('Origin') and self.headers.get('Access-Control-Request-Method'):
+            self._send(204, list(CORS_HEADERS.items()), b'')
+        else:
+            self._serve()
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class Persister:
+    # Saves the stand-ins to data_dir every interval seconds once they have
+    # been written to, and on stop()
+
+    WRITES = ('PutItem', 'BatchWriteItem', 'DeleteItem', 'PutObject')
+
+    def __init__(self, data_dir, dynamodb, s3, interval):
+        self.data_dir = data_dir
+        self.dynamodb = dynamodb
+        self.s3 = s3
+        self.interval = interval
+        self.saved_writes = self._writes()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _writes(self):
+        return sum(self.dynamodb.calls[name] + self.s3.calls[name] for name in self.WRITES)
+
+    def save(self):
+        writes = self._writes()
+        self.dynamodb.save(os.path.join(self.data_dir, 'dynamodb.json'))
+        self.s3.save(os.path.join(self.data_dir, 's3.json'))
+        self.saved_writes = writes
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            if self._writes() != self.saved_writes:
+                self.save()
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.save()
+
+
+class QueueConsumer:
+    # Stands in for the SQS event source mapping of registration_consumer:
+    # polls the queue and invokes the handler with batches of records
+
+    def __init__(self, sqs, queue_url, handler, batch_size=10, idle_seconds=0.05):
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.handler = handler
+        self.batch_size = batch_size
+        self.idle_seconds = idle_seconds
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def drain_once(self):
+        event = self.sqs.lambda_event(self.queue_url, self.batch_size)
+        if not event['Records']:
+            return 0
+        try:
+            response = self.handler(event, LambdaContext('registration_consumer', 60))
+        except Exception as e:
+            # The whole batch becomes visible again
+            sys.stderr.write(f"registration_consumer raised {type(e).__name__}: {str(e)}\n")
+            response = {'batchItemFailures': [{'itemIdentifier': r['messageId']} for r in event['Records']]}
+        self.sqs.complete(self.queue_url, event, response)
+        return len(event['Records'])
+
+    def _run(self):
+        while not self.stopped.is_set():
+            if not self.drain_once():
+                self.stopped.wait(self.idle_seconds)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+def build_stack(data_dir=None, latency=0.0):
+    # Returns (dynamodb, s3): loaded from data_dir when it holds a saved
+    # stack, otherwise an empty users table and the pages from html/
+    dynamodb, s3 = users_stack(TABLE_NAME, BUCKET_NAME, latency=latency)
+    if data_dir:
+        os.makedirs(data_dir, exist_ok=True)
+        if os.path.isfile(os.path.join(data_dir, 'dynamodb.json')):
+            dynamodb.load(os.path.join(data_dir, 'dynamodb.json'))
+        if os.path.isfile(os.path.join(data_dir, 's3.json')):
+            s3.load(os.path.join(data_dir, 's3.json'))
+    return dynamodb, s3
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the user management API locally, without AWS')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3000)
+    parser.add_argument('--data-dir', help='Keep the users table and bucket in this directory between runs')
+    parser.add_argument('--save-interval', type=float, default=5.0, help='Seconds between saves to --data-dir')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every DynamoDB/S3 call')
+    parser.add_argument('--async-registration', action='store_true',
+                        help='Queue registrations and write them from a local registration_consumer')
+    parser.add_argument('--metrics', action='store_true', help='Print the EMF metrics record of every request')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    args = parser.parse_args(argv)
+
+    dynamodb, s3 = build_stack(args.data_dir, args.latency)
+    sqs = InMemorySQS(args.latency)
+    queue_url = sqs.create_queue(QueueName=QUEUE_NAME)['QueueUrl']
+
+    # The handlers read their configuration when imported
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ['DYNAMODB_TABLE'] = TABLE_NAME
+    os.environ['S3_BUCKET'] = BUCKET_NAME
+    os.environ['METRICS_ENABLED'] = 'true' if args.metrics else 'false'
+    if args.async_registration:
+        os.environ['ASYNC_REGISTRATION'] = 'true'
+        os.environ['REGISTRATION_QUEUE_URL'] = queue_url
+    sys.path.insert(0, SRC_DIR)
+    import aws_clients
+    aws_clients._clients.update({'dynamodb': dynamodb, 's3': s3, 'sqs': sqs})
+    import user_api
+    import registration_consumer
+
+    server = LocalApi((args.host, args.port), user_api.lambda_handler, load_route_keys(), quiet=not args.verbose)
+    background = []
+    if args.data_dir:
+        background.append(Persister(args.data_dir, dynamodb, s3, args.save_interval).start())
+    if args.async_registration:
+        background.append(QueueConsumer(sqs, queue_url, registration_consumer.lambda_handler).start())
+
+    print(f"Serving {', '.join(sorted(server.route_keys))} on {server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for task in reversed(background):
+            task.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,540 @@
+import io
+import os
+import re
+import json
+import base64
+import time
+import hashlib
+import threading
+from collections import Counter
+from botocore.exceptions import ClientError
+
+# In-memory stand-ins for the low-level DynamoDB, S3 and SQS clients.
+#
+# They implement the subset of each API the handlers and tools use, store
+# items in the low-level wire format ({'S': '...'}) and can inject latency
+# into every call, so handlers can be exercised and benchmarked offline by
+# placing them in aws_clients._clients. DynamoDB and S3 contents can be
+# saved to and loaded from a JSON file, for stand-ins that outlive a process.
+
+
+def _error(code, operation, message=''):
+    return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+
+def _save_json(path, state):
+    # Atomic, so an interrupted save leaves the previous file intact
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(state, f)
+    os.replace(temporary, path)
+
+
+def _value(attribute):
+    # Sortable Python value of a low-level attribute
+    kind, value = next(iter(attribute.items()))
+    return float(value) if kind == 'N' else value
+
+
+class _Latency:
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def wait(self):
+        delay = self.latency() if callable(self.latency) else self.latency
+        if delay:
+            time.sleep(delay)
+
+
+class _Table:
+
+    def __init__(self, hash_key, range_key=None, indexes=None):
+        self.hash_key = hash_key
+        self.range_key = range_key
+        # index name -> (hash_key, range_key)
+        self.indexes = indexes or {}
+        self.items = {}
+
+    def key_of(self, item):
+        key = (_value(item[self.hash_key]),)
+        if self.range_key:
+            key += (_value(item[self.range_key]),)
+        return key
+
+
+class _Paginator:
+
+    def __init__(self, operation):
+        self.operation = operation
+
+    def paginate(self, **kwargs):
+        while True:
+            page = self.operation(**kwargs)
+            yield page
+            if 'LastEvaluatedKey' not in page:
+                return
+            kwargs = dict(kwargs, ExclusiveStartKey=page['LastEvaluatedKey'])
+
+
+_CONDITION = re.compile(
+    r'^\s*(?:begins_with\(\s*(?P<bw_name>[#\w]+)\s*,\s*(?P<bw_value>:\w+)\s*\)'
+    r'|(?P<name>[#\w]+)\s*(?:(?P<op>=|<=|>=|<|>)\s*(?P<value>:\w+)'
+    r'|BETWEEN\s+(?P<low>:\w+)\s+AND\s+(?P<high>:\w+)))\s*$',
+    re.IGNORECASE
+)
+
+
+def _split_conditions(expression):
+    # Splits on top-level AND, leaving BETWEEN ... AND ... intact
+    parts, current = [], []
+    tokens = expression.split()
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token.upper() == 'BETWEEN':
+            current.extend(tokens[i:i + 4])
+            i += 4
+            continue
+        if token.upper() == 'AND':
+            parts.append(' '.join(current))
+            current = []
+        else:
+            current.append(token)
+        i += 1
+    parts.append(' '.join(current))
+    return parts
+
+
+def _key_predicate(expression, names, values):
+    checks = []
+    for part in _split_conditions(expression):
+        match = _CONDITION.match(part)
+        if not match:
+            raise _error('ValidationException', 'Query', f'Unsupported key condition: {part}')
+        if match.group('bw_name'):
+            name = names.get(match.group('bw_name'), match.group('bw_name'))
+            prefix = _value(values[match.group('bw_value')])
+            checks.append((name, lambda v, p=prefix: isinstance(v, str) and v.startswith(p)))
+            continue
+        name = names.get(match.group('name'), match.group('name'))
+        if match.group('low'):
+            low, high = _value(values[match.group('low')]), _value(values[match.group('high')])
+            checks.append((name, lambda v, lo=low, hi=high: lo <= v <= hi))
+            continue
+        operand = _value(values[match.group('value')])
+        op = match.group('op')
+        compare = {
+            '=': lambda v, o=operand: v == o,
+            '<': lambda v, o=operand: v < o,
+            '<=': lambda v, o=operand: v <= o,
+            '>': lambda v, o=operand: v > o,
+            '>=': lambda v, o=operand: v >= o,
+        }[op]
+        checks.append((name, compare))
+
+    def predicate(item):
+        return all(name in item and check(_value(item[name])) for name, check in checks)
+    return predicate
+
+
+# (expression, names, values) -> predicate, so benchmarks measure the
+# handlers rather than condition parsing
+_condition_predicates = {}
+
+
+def _condition_predicate(expression, names, values):
+    cache_key = (
+        expression,
+        tuple(sorted(names.items())),
+        tuple(sorted((name, tuple(value.items())) for name, value in values.items()))
+    )
+    predicate = _condition_predicates.get(cache_key)
+    if predicate is None:
+        if len(_condition_predicates) > 1000:
+            _condition_predicates.clear()
+        predicate = _condition_predicates[cache_key] = _parse_condition(expression, names, values)
+    return predicate
+
+
+def _parse_condition(expression, names, values):
+    # attribute_not_exists(name) or key-condition comparisons, joined by OR
+    checks = []
+    for part in re.split(r'\s+OR\s+', expression.strip(), flags=re.IGNORECASE):
+        match = re.match(r'^attribute_not_exists\(\s*([#\w]+)\s*\)$', part.strip())
+        if match:
+            name = names.get(match.group(1), match.group(1))
+            checks.append(lambda item, n=name: n not in item)
+            continue
+        try:
+            checks.append(_key_predicate(part, names, values))
+        except ClientError:
+            raise _error('ValidationException', 'PutItem', f'Unsupported condition: {expression}')
+
+    def predicate(item):
+        return any(check(item) for check in checks)
+    return predicate
+
+
+def _project(item, projection, names):
+    if not projection:
+        return dict(item)
+    attributes = [names.get(name.strip(), name.strip()) for name in projection.split(',')]
+    return {name: item[name] for name in attributes if name in item}
+
+
+class InMemoryDynamoDB:
+
+    def __init__(self, latency=0.0):
+        self._latency = _Latency(latency)
+        self._tables = {}
+        self._lock = threading.Lock()
+        # Operation name -> number of calls
+        self.calls = Counter()
+        # (operation, started, finished) perf_counter times of each call's latency
+        self.spans = []
+
+    def create_table(self, name, hash_key, range_key=None, indexes=None):
+        self._tables[name] = _Table(hash_key, range_key, indexes)
+        return self
+
+    def _table(self, name, operation):
+        if name not in self._tables:
+            raise _error('ResourceNotFoundException', operation, f'Table {name} not found')
+        return self._tables[name]
+
+    def _call(self, operation):
+        self.calls[operation] += 1
+        started = time.perf_counter()
+        self._latency.wait()
+        self.spans.append((operation, started, time.perf_counter()))
+
+    def put_item(self, TableName, Item, ConditionExpression=None, ReturnValuesOnConditionCheckFailure=None,
+                 ExpressionAttributeNames=None, ExpressionAttributeValues=None, **kwargs):
+        self._call('PutItem')
+        table = self._table(TableName, 'PutItem')
+        key = table.key_of(Item)
+        with self._lock:
+            existing = table.items.get(key)
+            if ConditionExpression:
+                passes = _condition_predicate(
+                    ConditionExpression, ExpressionAttributeNames or {}, ExpressionAttributeValues or {}
+                )
+                if existing is not None and not passes(existing):
+                    error = _error('ConditionalCheckFailedException', 'PutItem', 'The conditional request failed')
+                    if ReturnValuesOnConditionCheckFailure == 'ALL_OLD':
+                        error.response['Item'] = dict(existing)
+                    raise error
+            table.items[key] = dict(Item)
+        return {}
+
+    def get_item(self, TableName, Key, ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        self._call('GetItem')
+        table = self._table(TableName, 'GetItem')
+        item = table.items.get(table.key_of(Key))
+        if item is None:
+            return {}
+        return {'Item': _project(item, ProjectionExpression, ExpressionAttributeNames or {})}
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        self._call('BatchGetItem')
+        responses = {}
+        for name, request in RequestItems.items():
+            table = self._table(name, 'BatchGetItem')
+            names = request.get('ExpressionAttributeNames', {})
+            responses[name] = [
+                _project(table.items[table.key_of(key)], request.get('ProjectionExpression'), names)
+                for key in request['Keys']
+                if table.key_of(key) in table.items
+            ]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        self._call('BatchWriteItem')
+        with self._lock:
+            for name, writes in RequestItems.items():
+                table = self._table(name, 'BatchWriteItem')
+                if len(writes) > 25:
+                    raise _error('ValidationException', 'BatchWriteItem', 'Too many items in batch')
+                for write in writes:
+                    if 'PutRequest' in write:
+                        item = write['PutRequest']['Item']
+                        table.items[table.key_of(item)] = dict(item)
+                    else:
+                        table.items.pop(table.key_of(write['DeleteRequest']['Key']), None)
+        return {'UnprocessedItems': {}}
+
+    def delete_item(self, TableName, Key, **kwargs):
+        self._call('DeleteItem')
+        table = self._table(TableName, 'DeleteItem')
+        with self._lock:
+            table.items.pop(table.key_of(Key), None)
+        return {}
+
+    def query(self, TableName, KeyConditionExpression, ExpressionAttributeValues,
+              ExpressionAttributeNames=None, IndexName=None, ProjectionExpression=None,
+              ScanIndexForward=True, Limit=None, ExclusiveStartKey=None, **kwargs):
+        self._call('Query')
+        table = self._table(TableName, 'Query')
+        names = ExpressionAttributeNames or {}
+        predicate = _key_predicate(KeyConditionExpression, names, ExpressionAttributeValues)
+        hash_key, range_key = table.indexes.get(IndexName, (table.hash_key, table.range_key))
+
+        def sort_key(item):
+            return (_value(item[range_key]) if range_key else 0, table.key_of(item))
+
+        items = sorted(
+            (item for item in table.items.values() if hash_key in item and predicate(item)),
+            key=sort_key,
+            reverse=not ScanIndexForward
+        )
+        if ExclusiveStartKey:
+            start = (_value(ExclusiveStartKey[range_key]) if range_key else 0, table.key_of(ExclusiveStartKey))
+            items = [item for item in items if (sort_key(item) > start if ScanIndexForward else sort_key(item) < start)]
+
+        response = {}
+        if Limit is not None and len(items) > Limit:
+            items = items[:Limit]
+            last = items[-1]
+            key_names = {table.hash_key, table.range_key, hash_key, range_key} - {None}
+            response['LastEvaluatedKey'] = {name: last[name] for name in key_names}
+        response['Items'] = [_project(item, ProjectionExpression, names) for item in items]
+        response['Count'] = len(items)
+        return response
+
+    def scan(self, TableName, ProjectionExpression=None, ExpressionAttributeNames=None,
+             Segment=0, TotalSegments=1, Limit=None, ExclusiveStartKey=None, **kwargs):
+        self._call('Scan')
+        table = self._table(TableName, 'Scan')
+        keys = sorted(
+            key for key in table.items
+            if int(hashlib.md5(repr(key).encode('utf-8')).hexdigest(), 16) % TotalSegments == Segment
+        )
+        if ExclusiveStartKey:
+            start = table.key_of(ExclusiveStartKey)
+            keys = [key for key in keys if key > start]
+
+        response = {}
+        if Limit is not None and len(keys) > Limit:
+            keys = keys[:Limit]
+            last = table.items[keys[-1]]
+            response['LastEvaluatedKey'] = {
+                name: last[name] for name in (table.hash_key, table.range_key) if name
+            }
+        names = ExpressionAttributeNames or {}
+        response['Items'] = [_project(table.items[key], ProjectionExpression, names) for key in keys]
+        response['Count'] = len(keys)
+        return response
+
+    def get_paginator(self, operation_name):
+        return _Paginator({'scan': self.scan, 'query': self.query}[operation_name])
+
+    def save(self, path):
+        with self._lock:
+            state = {
+                name: {
+                    'hash_key': table.hash_key,
+                    'range_key': table.range_key,
+                    'indexes': table.indexes,
+                    'items': list(table.items.values())
+                }
+                for name, table in self._tables.items()
+            }
+        _save_json(path, state)
+
+    def load(self, path):
+        # Replaces the tables named in the file
+        with open(path) as f:
+            state = json.load(f)
+        for name, saved in state.items():
+            indexes = {index: tuple(keys) for index, keys in saved['indexes'].items()}
+            table = _Table(saved['hash_key'], saved['range_key'], indexes)
+            table.items = {table.key_of(item): item for item in saved['items']}
+            self._tables[name] = table
+        return self
+
+
+class InMemoryS3:
+
+    def __init__(self, latency=0.0):
+        self._latency = _Latency(latency)
+        self._objects = {}
+        # Operation name -> number of calls
+        self.calls = Counter()
+        # (operation, started, finished) perf_counter times of each call's latency
+        self.spans = []
+
+    def _call(self, operation):
+        self.calls[operation] += 1
+        started = time.perf_counter()
+        self._latency.wait()
+        self.spans.append((operation, started, time.perf_counter()))
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, Metadata=None, **kwargs):
+        self._call('PutObject')
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        elif hasattr(Body, 'read'):
+            Body = Body.read()
+        etag = f'"{hashlib.md5(Body).hexdigest()}"'
+        self._objects[(Bucket, Key)] = {
+            'Body': Body,
+            'ETag': etag,
+            'ContentType': ContentType or 'binary/octet-stream',
+            'ContentEncoding': kwargs.get('ContentEncoding'),
+            'Metadata': Metadata or {}
+        }
+        return {'ETag': etag, 'VersionId': str(time.time_ns())}
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None, **kwargs):
+        self._call('GetObject')
+        stored = self._objects.get((Bucket, Key))
+        if stored is None:
+            raise _error('NoSuchKey', 'GetObject', 'The specified key does not exist.')
+        if IfNoneMatch and IfNoneMatch == stored['ETag']:
+            error = _error('304', 'GetObject', 'Not Modified')
+            error.response['ResponseMetadata'] = {'HTTPStatusCode': 304}
+            raise error
+        response = {
+            'Body': io.BytesIO(stored['Body']),
+            'ETag': stored['ETag'],
+            'ContentType': stored['ContentType'],
+            'ContentLength': len(stored['Body']),
+            'Metadata': dict(stored['Metadata'])
+        }
+        if stored['ContentEncoding']:
+            response['ContentEncoding'] = stored['ContentEncoding']
+        return response
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._call('HeadObject')
+        stored = self._objects.get((Bucket, Key))
+        if stored is None:
+            raise _error('404', 'HeadObject', 'Not Found')
+        return {'ETag': stored['ETag'], 'ContentLength': len(stored['Body']), 'Metadata': dict(stored['Metadata'])}
+
+    def save(self, path):
+        _save_json(path, [
+            dict(stored, Bucket=bucket, Key=key, Body=base64.b64encode(stored['Body']).decode('ascii'))
+            for (bucket, key), stored in list(self._objects.items())
+        ])
+
+    def load(self, path):
+        # Replaces the objects named in the file
+        with open(path) as f:
+            for stored in json.load(f):
+                bucket, key = stored.pop('Bucket'), stored.pop('Key')
+                self._objects[(bucket, key)] = dict(stored, Body=base64.b64decode(stored['Body']))
+        return self
+
+
+class InMemorySQS:
+    # Standard-queue semantics are reduced to what the registration consumer
+    # needs: received messages are invisible until deleted or released, and
+    # lambda_event()/complete() mimic the Lambda SQS event source including
+    # ReportBatchItemFailures.
+
+    def __init__(self, latency=0.0):
+        self._latency = _Latency(latency)
+        self._queues = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+        # Operation name -> number of calls
+        self.calls = Counter()
+        # (operation, started, finished) perf_counter times of each call's latency
+        self.spans = []
+
+    def _call(self, operation):
+        self.calls[operation] += 1
+        started = time.perf_counter()
+        self._latency.wait()
+        self.spans.append((operation, started, time.perf_counter()))
+
+    def create_queue(self, QueueName, **kwargs):
+        url = f'https://sqs.local/000000000000/{QueueName}'
+        self._queues.setdefault(url, {'visible': [], 'in_flight': {}})
+        return {'QueueUrl': url}
+
+    def _queue(self, url, operation):
+        if url not in self._queues:
+            raise _error('AWS.SimpleQueueService.NonExistentQueue', operation, f'Queue {url} not found')
+        return self._queues[url]
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        self._call('SendMessage')
+        queue = self._queue(QueueUrl, 'SendMessage')
+        with self._lock:
+            self._next_id += 1
+            message_id = f'message-{self._next_id}'
+            queue['visible'].append({'MessageId': message_id, 'Body': MessageBody, 'ReceiveCount': 0})
+        return {'MessageId': message_id}
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages=1, **kwargs):
+        self._call('ReceiveMessage')
+        queue = self._queue(QueueUrl, 'ReceiveMessage')
+        with self._lock:
+            batch, queue['visible'] = queue['visible'][:MaxNumberOfMessages], queue['visible'][MaxNumberOfMessages:]
+            messages = []
+            for message in batch:
+                message['ReceiveCount'] += 1
+                receipt = f"{message['MessageId']}:{message['ReceiveCount']}"
+                queue['in_flight'][receipt] = message
+                messages.append({'MessageId': message['MessageId'], 'ReceiptHandle': receipt, 'Body': message['Body']})
+        return {'Messages': messages} if messages else {}
+
+    def delete_message(self, QueueUrl, ReceiptHandle, **kwargs):
+        self._call('DeleteMessage')
+        with self._lock:
+            self._queue(QueueUrl, 'DeleteMessage')['in_flight'].pop(ReceiptHandle, None)
+        return {}
+
+    def release(self, QueueUrl, ReceiptHandle):
+        # Visibility timeout expiry: the message becomes receivable again
+        queue = self._queue(QueueUrl, 'ChangeMessageVisibility')
+        with self._lock:
+            message = queue['in_flight'].pop(ReceiptHandle, None)
+            if message is not None:
+                queue['visible'].append(message)
+
+    def depth(self, QueueUrl):
+        queue = self._queue(QueueUrl, 'GetQueueAttributes')
+        return len(queue['visible']) + len(queue['in_flight'])
+
+    def lambda_event(self, QueueUrl, batch_size=10):
+        # Receives up to batch_size messages as a Lambda SQS event
+        messages = self.receive_message(QueueUrl=QueueUrl, MaxNumberOfMessages=batch_size).get('Messages', [])
+        return {'Records': [
+            {
+                'messageId': message['MessageId'],
+                'receiptHandle': message['ReceiptHandle'],
+                'body': message['Body'],
+                'eventSource': 'aws:sqs'
+            }
+            for message in messages
+        ]}
+
+    def complete(self, QueueUrl, event, response):
+        # Deletes the records the handler processed and releases the ones it
+        # reported in batchItemFailures, as the event source mapping does
+        failed = {failure['itemIdentifier'] for failure in (response or {}).get('batchItemFailures', [])}
+        for record in event['Records']:
+            if record['messageId'] in failed:
+                self.release(QueueUrl, record['receiptHandle'])
+            else:
+                self.delete_message(QueueUrl=QueueUrl, ReceiptHandle=record['receiptHandle'])
+        return len(failed)
+
+
+def users_stack(table_name='users-local', bucket='static-local', html_dir=None, latency=0.0):
+    # Builds the stand-ins for a users table (with the registration time
+    # index) and a static bucket holding index.html and error.html (from
+    # html/ unless another dir is given)
+    html_dir = html_dir or os.path.join(os.path.dirname(__file__), '..', 'html')
+    dynamodb = InMemoryDynamoDB(latency).create_table(
+        table_name, 'userId', indexes={'registeredAt-index': ('registeredDate', 'registeredAt')}
+    )
+    s3 = InMemoryS3(latency)
+    for page in ('index.html', 'error.html'):
+        with open(os.path.join(html_dir, page), 'rb') as f:
+            s3.put_object(Bucket=bucket, Key=page, Body=f.read(), ContentType='text/html')
+    return dynamodb, s3
@@ -0,0 +1,116 @@
+import json
+import pytest
+from botocore.exceptions import ClientError
+
+import admission
+import aws_clients
+import user_api
+from local_aws import InMemoryDynamoDB
+
+pytestmark = pytest.mark.stack(latency=0.02)
+
+
+def route_event(route_key, user_id, source_ip='203.0.113.10'):
+    return {
+        'routeKey': route_key,
+        'queryStringParameters': {'userId': user_id},
+        'requestContext': {'http': {'sourceIp': source_ip}}
+    }
+
+
+class ThrottledDynamoDB(InMemoryDynamoDB):
+    """In-memory DynamoDB whose PutItem is always throttled"""
+
+    def put_item(self, **kwargs):
+        raise ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException'}}, 'PutItem')
+
+
+class TestAdmissionControl:
+    """Offline tests for per-caller rate limiting and latency-aware load shedding"""
+    
+    def test_caller_over_its_rate_gets_429_with_retry_after(self, stack, monkeypatch):
+        monkeypatch.setattr(admission, 'caller_limiter', admission.CallerLimiter(rate=1, burst=2, max_callers=100))
+        
+        statuses = [user_api.lambda_handler(route_event('GET /', f'user{i}'), None)['statusCode'] for i in range(3)]
+        limited = user_api.lambda_handler(route_event('POST /register', 'alice'), None)
+        other_caller = user_api.lambda_handler(route_event('GET /', 'alice', source_ip='198.51.100.7'), None)
+        
+        assert statuses == [200, 200, 429]
+        assert limited['statusCode'] == 429
+        assert int(limited['headers']['Retry-After']) >= 1
+        assert other_caller['statusCode'] == 200
+    
+    def test_caller_buckets_are_bounded(self):
+        limiter = admission.CallerLimiter(rate=1, burst=1, max_callers=2)
+        for caller in ('a', 'b', 'c'):
+            limiter.check(caller, now=0.0)
+        
+        assert list(limiter.buckets) == ['b', 'c']
+        assert limiter.check('a', now=0.0) == 0
+    
+    def test_bucket_refills_at_its_rate(self):
+        bucket = admission.TokenBucket(rate=10, burst=1, now=0.0)
+        
+        assert bucket.take(0.0) == 0
+        assert bucket.take(0.05) == pytest.approx(0.05)
+        assert bucket.take(0.1) == 0
+    
+    def test_slow_downstream_sheds_with_503(self, stack, monkeypatch):
+        shedder = admission.LatencyShedder(threshold_ms=10, window_seconds=60, min_samples=3, probe_rate=0)
+        monkeypatch.setattr(admission, 'shedder', shedder)
+        monkeypatch.setattr(admission, 'P99_REFRESH_SECONDS', 0)
+        
+        statuses = [user_api.lambda_handler(route_event('GET /', f'user{i}'), None)['statusCode'] for i in range(4)]
+        response = user_api.lambda_handler(route_event('POST /register', 'alice'), None)
+        
+        assert statuses == [200, 200, 200, 503]
+        assert response['statusCode'] == 503
+        assert response['headers']['Retry-After'] == '1'
+        assert json.loads(response['body'])['error'] == 'Service temporarily overloaded'
+        assert shedder.p99 > 10
+    
+    def test_cache_hits_leave_the_shedder_empty(self, stack, monkeypatch):
+        dynamodb, _ = stack
+        dynamodb.put_item(TableName='users-test', Item={'userId': {'S': 'alice'}})
+        user_api.lambda_handler(route_event('GET /', 'alice'), None)
+        shedder = admission.LatencyShedder(threshold_ms=10, window_seconds=60, min_samples=1, probe_rate=0)
+        monkeypatch.setattr(admission, 'shedder', shedder)
+        
+        for _ in range(5):
+            assert user_api.lambda_handler(route_event('GET /', 'alice'), None)['statusCode'] == 200
+        
+        assert len(shedder.samples) == 0
+        user_api.lambda_handler(route_event('GET /', 'bob'), None)
+        assert len(shedder.samples) == 1
+        assert shedder.samples[0][1] >= 20
+    
+    def test_shedding_stops_once_slow_samples_leave_the_window(self):
+        shedder = admission.LatencyShedder(threshold_ms=100, window_seconds=10, min_samples=2, probe_rate=0)
+        for now in (0.0, 1.0, 2.0):
+            shedder.record(500, now)
+        
+        assert shedder.should_shed(now=3.0)
+        for now in (12.5, 13.0):
+            shedder.record(20, now)
+        assert not shedder.should_shed(now=13.5)
+    
+    def test_probes_are_admitted_while_shedding(self, monkeypatch):
+        shedder = admission.LatencyShedder(threshold_ms=100, window_seconds=10, min_samples=1, probe_rate=0.5)
+        shedder.record(500, 0.0)
+        monkeypatch.setattr(admission.random, 'random', lambda: 0.25)
+        
+        assert shedder.overloaded(now=1.0)
+        assert not shedder.should_shed(now=1.0)
+    
+    def test_throttled_dependency_returns_503_instead_of_500(self, monkeypatch):
+        dynamodb = ThrottledDynamoDB().create_table('users-test', 'userId')
+        monkeypatch.setitem(aws_clients._clients, 'dynamodb', dynamodb)
+        monkeypatch.setenv('DYNAMODB_TABLE', 'users-test')
+        shedder = admission.LatencyShedder(threshold_ms=1000, window_seconds=60, min_samples=1, probe_rate=0)
+        monkeypatch.setattr(admission, 'shedder', shedder)
+        
+        response = user_api.lambda_handler(route_event('POST /register', 'alice'), None)
+        
+        assert response['statusCode'] == 503
+        assert 'Retry-After' in response['headers']
+        assert shedder.samples[-1][1] == float('inf')
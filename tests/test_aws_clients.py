@@ -0,0 +1,26 @@
+import aws_clients
+
+
+class TestClientFactory:
+    """Offline tests for the shared AWS client factory"""
+    
+    def test_client_is_created_once_and_reused(self, monkeypatch):
+        monkeypatch.setattr(aws_clients, '_clients', {})
+        
+        first = aws_clients.get_client('dynamodb')
+        assert aws_clients.get_client('dynamodb') is first
+        assert 'client.dynamodb' in aws_clients.init_timings
+    
+    def test_client_uses_tuned_config(self, monkeypatch):
+        monkeypatch.setattr(aws_clients, '_clients', {})
+        
+        config = aws_clients.get_client('s3').meta.config
+        assert config.retries['mode'] == 'adaptive'
+        assert config.tcp_keepalive is True
+        assert config.connect_timeout == aws_clients.CLIENT_CONFIG.connect_timeout
+    
+    def test_cold_start_is_reported_once(self, monkeypatch):
+        monkeypatch.setattr(aws_clients, '_cold_start', True)
+        
+        assert aws_clients.consume_cold_start() is True
+        assert aws_clients.consume_cold_start() is False
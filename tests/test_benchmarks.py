@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import logging
+import tracemalloc
+import subprocess
+import pytest
+
+import metrics
+import register_user
+import verify_user
+
+# Offline microbenchmarks for the Lambda handlers.
+#
+# The handlers are imported directly and run against the in-memory DynamoDB
+# and S3 stand-ins from local_aws.py. Each scenario reports per-invocation
+# p50/p99 latency and the peak traced allocation per request; cold import
+# time is measured in a fresh interpreter. Results are compared with
+# benchmark_baselines.json and a regression beyond the tolerance fails.
+#
+#   RUN_BENCHMARKS=1 python -m pytest -s test_benchmarks.py
+#   RUN_BENCHMARKS=1 UPDATE_BENCHMARK_BASELINES=1 python -m pytest -s test_benchmarks.py
+
+RUN_BENCHMARKS = os.environ.get('RUN_BENCHMARKS') == '1'
+UPDATE_BASELINES = os.environ.get('UPDATE_BENCHMARK_BASELINES') == '1'
+TOLERANCE = float(os.environ.get('BENCHMARK_TOLERANCE', '1.5'))
+ITERATIONS = int(os.environ.get('BENCHMARK_ITERATIONS', '2000'))
+ALLOCATION_SAMPLES = 200
+# Latency injected into every stand-in call, in seconds
+INJECTED_LATENCY = float(os.environ.get('BENCHMARK_INJECTED_LATENCY', '0'))
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), 'benchmark_baselines.json')
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', 'src')
+
+# Absolute slack added to each limit so sub-millisecond numbers do not flap
+SLACK = {'p50_ms': 0.05, 'p99_ms': 0.2, 'peak_kib': 4.0, 'import_ms': 25.0}
+
+TABLE = 'users-bench'
+BUCKET = 'static-bench'
+
+pytestmark = [
+    pytest.mark.skipif(not RUN_BENCHMARKS, reason='set RUN_BENCHMARKS=1 to run the handler benchmarks'),
+    pytest.mark.stack(table=TABLE, bucket=BUCKET, latency=INJECTED_LATENCY, membership_ttls=(60, 5),
+                      membership_entries=10000)
+]
+_results = {}
+
+
+@pytest.fixture(autouse=True)
+def quiet(monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_ENABLED', False)
+    logging.getLogger().setLevel(logging.WARNING)
+    yield
+    logging.getLogger().setLevel(logging.INFO)
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_scenario(name, handler, make_event):
+    # Warm up, then time ITERATIONS invocations and trace allocations for a sample
+    for i in range(50):
+        handler(make_event(-i - 1), None)
+
+    samples = []
+    for i in range(ITERATIONS):
+        event = make_event(i)
+        started = time.perf_counter()
+        handler(event, None)
+        samples.append((time.perf_counter() - started) * 1000)
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for i in range(ALLOCATION_SAMPLES):
+            event = make_event(ITERATIONS + i)
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            handler(event, None)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append((peak - baseline) / 1024)
+    finally:
+        tracemalloc.stop()
+
+    _results[name] = {
+        'p50_ms': round(_percentile(samples, 0.50), 4),
+        'p99_ms': round(_percentile(samples, 0.99), 4),
+        'peak_kib': round(_percentile(peaks, 0.50), 2)
+    }
+    check_against_baseline(name, _results[name])
+
+
+def check_against_baseline(name, result):
+    print(f"\n{name}: " + ', '.join(f"{key}={value}" for key, value in result.items()))
+    if UPDATE_BASELINES:
+        return
+    baselines = load_baselines()
+    if name not in baselines:
+        pytest.skip(f'No baseline recorded for {name}')
+    regressions = [
+        f"{key} {value} > {baselines[name][key]} x {TOLERANCE}"
+        for key, value in result.items()
+        if key in baselines[name] and value > baselines[name][key] * TOLERANCE + SLACK[key]
+    ]
+    assert not regressions, f"{name} regressed: {'; '.join(regressions)}"
+
+
+def load_baselines():
+    if not os.path.exists(BASELINES_PATH):
+        return {}
+    with open(BASELINES_PATH) as f:
+        return json.load(f)
+
+
+def teardown_module(module):
+    if UPDATE_BASELINES and _results:
+        baselines = load_baselines()
+        baselines.update(_results)
+        with open(BASELINES_PATH, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+class TestHandlerBenchmarks:
+    """Offline latency and allocation benchmarks for both handlers"""
+    
+    @pytest.mark.parametrize('module_name', ['register_user', 'verify_user'])
+    def test_cold_import(self, module_name):
+        code = (
+            'import time; started = time.perf_counter(); '
+            f'import {module_name}; print((time.perf_counter() - started) * 1000)'
+        )
+        env = dict(os.environ, AWS_DEFAULT_REGION='us-east-1', PYTHONPATH=SRC_DIR)
+        timings = [
+            float(subprocess.run([sys.executable, '-c', code], env=env, capture_output=True,
+                                 text=True, check=True).stdout.strip())
+            for _ in range(5)
+        ]
+        result = {'import_ms': round(min(timings), 2)}
+        _results[f'import_{module_name}'] = result
+        check_against_baseline(f'import_{module_name}', result)
+    
+    def test_register_new_user(self, stack):
+        run_scenario(
+            'register_new_user',
+            register_user.lambda_handler,
+            lambda i: {'queryStringParameters': {'userId': f'new_{i}'}}
+        )
+    
+    def test_register_existing_user(self, stack):
+        register_user.lambda_handler({'queryStringParameters': {'userId': 'existing'}}, None)
+        run_scenario(
+            'register_existing_user',
+            register_user.lambda_handler,
+            lambda i: {'queryStringParameters': {'userId': 'existing'}}
+        )
+    
+    def test_verify_registered_user(self, stack):
+        register_user.lambda_handler({'queryStringParameters': {'userId': 'alice'}}, None)
+        run_scenario(
+            'verify_registered_user',
+            verify_user.lambda_handler,
+            lambda i: {'queryStringParameters': {'userId': 'alice'}}
+        )
+    
+    def test_verify_unknown_users(self, stack):
+        run_scenario(
+            'verify_unknown_users',
+            verify_user.lambda_handler,
+            lambda i: {'queryStringParameters': {'userId': f'unknown_{i}'}}
+        )
+    
+    def test_verify_batch_of_100(self, stack):
+        register_user.lambda_handler(
+            {'queryStringParameters': None, 'body': json.dumps([f'user_{i}' for i in range(50)])}, None
+        )
+        run_scenario(
+            'verify_batch_of_100',
+            verify_user.lambda_handler,
+            lambda i: {'queryStringParameters': {'userIds': ','.join(f'user_{i + j}' for j in range(100))}}
+        )
@@ -0,0 +1,113 @@
+import io
+import time
+import pytest
+from botocore.exceptions import ClientError
+
+import bloom_builder
+import bloom_filter
+
+
+class FakeDeltaTable:
+    """In-memory stand-in for the DynamoDB client's put_item and query on the delta table"""
+    
+    def __init__(self):
+        self.items = []
+        self.queries = 0
+    
+    def put_item(self, TableName, Item):
+        self.items.append(Item)
+    
+    def query(self, **kwargs):
+        self.queries += 1
+        since = kwargs['ExpressionAttributeValues'][':since']['S']
+        return {'Items': [item for item in self.items if item['entry']['S'] >= since]}
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+    
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = (Body, f'"{hash(Body)}"')
+        return {'VersionId': '1'}
+    
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        body, etag = self.objects[Key]
+        if IfNoneMatch == etag:
+            raise ClientError({'Error': {'Code': '304'}}, 'GetObject')
+        return {'Body': io.BytesIO(body), 'ETag': etag}
+
+
+def make_membership(s3, delta):
+    return bloom_filter.BloomMembership(s3, 'bucket', 'bloom/users.bloom', delta, 'users-test-bloom-delta', 300, 0)
+
+
+class TestBloomFilter:
+    """Offline tests for the registered-users Bloom filter snapshot"""
+    
+    def test_added_users_are_always_found(self):
+        bloom = bloom_filter.BloomFilter.for_capacity(1000)
+        for i in range(1000):
+            bloom.add(f'user{i}')
+        
+        assert all(f'user{i}' in bloom for i in range(1000))
+    
+    def test_false_positive_rate_is_near_target(self):
+        bloom = bloom_filter.BloomFilter.for_capacity(2000, 0.01)
+        for i in range(2000):
+            bloom.add(f'user{i}')
+        
+        false_positives = sum(f'other{i}' in bloom for i in range(10000))
+        assert false_positives < 300
+    
+    def test_snapshot_round_trips_through_bytes(self):
+        bloom = bloom_filter.BloomFilter.for_capacity(10, snapshot_at=123.5)
+        bloom.add('alice')
+        restored = bloom_filter.BloomFilter.from_bytes(bloom.to_bytes())
+        
+        assert 'alice' in restored
+        assert restored.snapshot_at == 123.5
+        assert restored.count == 1
+    
+    def test_unknown_user_is_definitely_absent(self):
+        s3, delta = FakeS3(), FakeDeltaTable()
+        bloom = bloom_filter.BloomFilter.for_capacity(10, snapshot_at=time.time())
+        bloom.add('alice')
+        bloom_filter.publish_snapshot(s3, 'bucket', 'bloom/users.bloom', bloom)
+        membership = make_membership(s3, delta)
+        
+        assert membership.definitely_absent('alice') is False
+        assert membership.definitely_absent('mallory') is True
+    
+    def test_user_registered_after_snapshot_is_not_absent(self):
+        s3, delta = FakeS3(), FakeDeltaTable()
+        bloom = bloom_filter.BloomFilter.for_capacity(10, snapshot_at=time.time())
+        bloom_filter.publish_snapshot(s3, 'bucket', 'bloom/users.bloom', bloom)
+        membership = make_membership(s3, delta)
+        membership.definitely_absent('bob')
+        
+        bloom_filter.record_registration(delta, 'users-test-bloom-delta', 'bob')
+        assert membership.definitely_absent('bob') is False
+    
+    def test_stale_snapshot_is_not_trusted(self):
+        s3, delta = FakeS3(), FakeDeltaTable()
+        old = time.time() - bloom_filter.BLOOM_MAX_AGE_SECONDS - 1
+        bloom_filter.publish_snapshot(s3, 'bucket', 'bloom/users.bloom', bloom_filter.BloomFilter.for_capacity(10, snapshot_at=old))
+        
+        assert make_membership(s3, delta).definitely_absent('mallory') is False
+    
+    def test_missing_snapshot_falls_back_to_lookups(self):
+        assert make_membership(FakeS3(), FakeDeltaTable()).definitely_absent('mallory') is False
+    
+    @pytest.mark.stack(users=['alice', 'bob'])
+    def test_scheduled_builder_publishes_every_registered_user(self, stack):
+        _, s3 = stack
+        
+        result = bloom_builder.lambda_handler({}, None)
+        
+        assert result['users'] == 2
+        membership = bloom_filter.BloomMembership(s3, 'static-test', 'bloom/users.bloom', FakeDeltaTable(), 'delta', 300, 0)
+        assert membership.definitely_absent('alice') is False
+        assert membership.definitely_absent('mallory') is True
@@ -0,0 +1,124 @@
+import os
+import sys
+import zipfile
+import pytest
+
+import build_lambdas
+
+CURRENT_RUNTIME = f'python{sys.version_info[0]}.{sys.version_info[1]}'
+
+IMPORTTIME_OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       900 |        900 | site
+import time:       100 |        100 |     _json
+import time:       300 |        400 |   json
+import time:      2000 |       2000 |     boto3
+import time:       500 |       2500 |   aws_clients
+import time:       200 |       3100 | user_api
+"""
+
+
+@pytest.fixture
+def src_tree(tmp_path):
+    src = tmp_path / 'src'
+    src.mkdir()
+    (src / 'handler.py').write_text('import json\nimport shared\n\n\ndef lambda_handler(event, context):\n    return {}\n')
+    (src / 'shared.py').write_text('try:\n    from helper import value\nexcept ImportError:\n    value = None\n')
+    (src / 'helper.py').write_text('value = 1\n')
+    (src / 'tool.py').write_text('import shared\n')
+    (src / 'requirements.txt').write_text('boto3==1.34.0\nbotocore==1.34.0  # pinned\n\n')
+    return src
+
+
+class TestBuildLambdas:
+    """Offline tests for the Lambda package builder"""
+    
+    def test_package_holds_only_the_modules_its_entries_import(self, src_tree):
+        assert build_lambdas.package_modules(['handler'], str(src_tree)) == ['handler', 'helper', 'shared']
+    
+    def test_handlers_package_includes_every_local_import(self):
+        modules = build_lambdas.package_modules(build_lambdas.PACKAGES['user_api'])
+        
+        assert {'user_api', 'registration_consumer', 'bloom_builder', 'verify_user', 'warmup', 'resilience'} <= set(modules)
+        assert 'users_transfer' not in modules
+        assert 'build_lambdas' not in modules
+    
+    def test_runtime_provided_requirements_are_left_out(self, src_tree):
+        provided, other = build_lambdas.read_requirements(str(src_tree / 'requirements.txt'))
+        
+        assert provided == ['boto3==1.34.0', 'botocore==1.34.0']
+        assert other == []
+    
+    def test_builds_are_byte_identical(self, src_tree, tmp_path):
+        reports = []
+        for name in ('first', 'second'):
+            reports.append(build_lambdas.build(
+                str(tmp_path / name), CURRENT_RUNTIME, packages={'handler': ('handler',)}, src_dir=str(src_tree),
+                requirements_file=str(src_tree / 'requirements.txt'), measure=False
+            ))
+        
+        first = (tmp_path / 'first' / 'handler.zip').read_bytes()
+        assert first == (tmp_path / 'second' / 'handler.zip').read_bytes()
+        assert reports[0]['runtime_provided'] == ['boto3==1.34.0', 'botocore==1.34.0']
+        assert 'layer' not in reports[0]
+    
+    def test_zip_holds_sources_and_bytecode_only(self, src_tree, tmp_path):
+        build_lambdas.build(
+            str(tmp_path), CURRENT_RUNTIME, packages={'handler': ('handler',)}, src_dir=str(src_tree),
+            requirements_file=str(src_tree / 'requirements.txt'), measure=False
+        )
+        
+        with zipfile.ZipFile(tmp_path / 'handler.zip') as archive:
+            names = archive.namelist()
+            info = archive.getinfo('handler.py')
+        assert names == sorted(names)
+        assert {'handler.py', 'shared.py', 'helper.py'} <= set(names)
+        assert 'tool.py' not in names
+        assert any(name.startswith('__pycache__/handler.') for name in names)
+        assert not any(name.startswith(('boto3', 'botocore')) for name in names)
+        assert info.date_time == build_lambdas.ZIP_TIMESTAMP
+    
+    def test_bytecode_is_skipped_for_another_python_version(self, src_tree, tmp_path):
+        report = build_lambdas.build(
+            str(tmp_path), 'python2.7', packages={'handler': ('handler',)}, src_dir=str(src_tree),
+            requirements_file=str(src_tree / 'requirements.txt'), measure=False
+        )
+        
+        with zipfile.ZipFile(tmp_path / 'handler.zip') as archive:
+            assert not any(name.startswith('__pycache__') for name in archive.namelist())
+        assert report['packages']['handler']['precompiled'] is False
+    
+    def test_import_report_covers_the_entry_module_only(self, tmp_path):
+        (tmp_path / 'user_api.py').write_text('')
+        (tmp_path / 'aws_clients.py').write_text('')
+        rows = build_lambdas.parse_importtime(IMPORTTIME_OUTPUT)
+        
+        summary = build_lambdas.import_summary(rows, 'user_api', str(tmp_path))
+        
+        assert summary['total_ms'] == 3.1
+        assert summary['local_ms'] == 0.7
+        assert [row['module'] for row in summary['slowest']] == ['aws_clients', 'json']
+    
+    def test_import_times_are_measured_in_a_fresh_interpreter(self, src_tree, tmp_path):
+        report = build_lambdas.build(
+            str(tmp_path), CURRENT_RUNTIME, packages={'handler': ('handler',)}, src_dir=str(src_tree),
+            requirements_file=str(src_tree / 'requirements.txt')
+        )
+        
+        imports = report['packages']['handler']['imports']['handler']
+        assert imports['total_ms'] > 0
+        assert os.path.isfile(tmp_path / 'build_report.json')
+    
+    def test_strip_removes_tests_and_metadata(self, tmp_path):
+        library = tmp_path / 'library'
+        (library / 'tests').mkdir(parents=True)
+        (library / 'tests' / 'test_library.py').write_text('x = 1\n')
+        (library / '__init__.py').write_text('x = 1\n')
+        (library / '__init__.pyi').write_text('x: int\n')
+        (tmp_path / 'library-1.0.dist-info').mkdir()
+        (tmp_path / 'library-1.0.dist-info' / 'METADATA').write_text('Name: library\n')
+        
+        removed = build_lambdas.strip_tree(str(tmp_path))
+        
+        assert removed > 0
+        assert sorted(os.listdir(tmp_path)) == ['library']
+        assert os.listdir(library) == ['__init__.py']
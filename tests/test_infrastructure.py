@@ -63,7 +63,7 @@ class TestInfrastructure:
 
     def test_lambda_functions_exist(self):
         """Test that Lambda functions exist and are accessible."""
-        lambda_functions = ['register_user', 'verify_user']
+        lambda_functions = ['user_api']
         for function_name in lambda_functions:
             try:
                 response = self.lambda_client.get_function(FunctionName=function_name)
@@ -129,7 +129,7 @@ class TestInfrastructure:
 
     def test_lambda_function_permissions(self):
         """Test that Lambda functions have necessary permissions."""
-        lambda_functions = ['register_user', 'verify_user']
+        lambda_functions = ['user_api']
         iam_client = boto3.client('iam', region_name=AWS_REGION)
         for function_name in lambda_functions:
             try:
@@ -172,7 +172,7 @@ class TestInfrastructure:
     def test_cloudwatch_log_groups_exist(self):
         """Test that CloudWatch log groups exist for Lambda functions."""
         log_client = boto3.client('logs', region_name=AWS_REGION)
-        lambda_functions = ['register_user', 'verify_user']
+        lambda_functions = ['user_api']
         for function_name in lambda_functions:
             log_group_name = f"/aws/lambda/{function_name}"
             max_retries = 3
@@ -216,7 +216,7 @@ class TestInfrastructure:
                 assert billing_mode == 'PAY_PER_REQUEST', "DynamoDB should use PAY_PER_REQUEST billing mode"
             except ClientError:
                 pass
-        lambda_functions = ['register_user', 'verify_user']
+        lambda_functions = ['user_api']
         for function_name in lambda_functions:
             try:
                 response = self.lambda_client.get_function(FunctionName=function_name)
@@ -0,0 +1,161 @@
+import json
+import time
+import pytest
+
+import api_common
+import list_users
+import register_user
+import user_api
+
+pytestmark = pytest.mark.stack(membership_ttls=(0, 0))
+
+
+@pytest.fixture
+def stack(stack):
+    dynamodb, _ = stack
+    return dynamodb
+
+
+def add_users(dynamodb, registrations):
+    for user_id, registered_at in registrations:
+        dynamodb.put_item(TableName='users-test', Item=api_common.registration_item(user_id, registered_at))
+
+
+def list_page(**params):
+    response = user_api.lambda_handler({'routeKey': 'GET /users', 'queryStringParameters': params}, None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+def list_all(**params):
+    pages = []
+    while True:
+        status, body = list_page(**params)
+        assert status == 200
+        pages.append([user['userId'] for user in body['users']])
+        if not body['nextCursor']:
+            return pages
+        params = {'cursor': body['nextCursor'], 'limit': params.get('limit')}
+
+
+class TestListUsers:
+    """Offline tests for listing registrations by time through the index"""
+    
+    def test_range_is_listed_in_order_from_the_index(self, stack):
+        add_users(stack, [
+            ('carol', '2026-03-02T08:00:00.000Z'), ('alice', '2026-03-01T09:00:00.000Z'),
+            ('bob', '2026-03-01T23:59:59.999Z'), ('dave', '2026-03-04T00:00:00.000Z')
+        ])
+        
+        status, body = list_page(**{'from': '2026-03-01', 'to': '2026-03-02'})
+        
+        assert status == 200
+        assert body['users'] == [
+            {'userId': 'alice', 'registeredAt': '2026-03-01T09:00:00.000Z'},
+            {'userId': 'bob', 'registeredAt': '2026-03-01T23:59:59.999Z'},
+            {'userId': 'carol', 'registeredAt': '2026-03-02T08:00:00.000Z'}
+        ]
+        assert body['to'] == '2026-03-02T23:59:59.999Z'
+        assert body['nextCursor'] is None
+        assert stack.calls['Query'] == 2 * api_common.REGISTERED_AT_SHARDS
+        assert stack.calls['Scan'] == 0
+    
+    def test_cursor_pages_through_the_range(self, stack):
+        add_users(stack, [(f'user{i:02d}', f'2026-03-0{1 + i % 3}T00:00:{i:02d}.000Z') for i in range(10)])
+        
+        pages = list_all(**{'from': '2026-03-01', 'to': '2026-03-03', 'limit': '4'})
+        
+        assert [len(page) for page in pages] == [4, 4, 2]
+        assert sum(pages, []) == [f'user{i:02d}' for i in (0, 3, 6, 9, 1, 4, 7, 2, 5, 8)]
+    
+    def test_shards_of_a_day_are_merged_in_order_across_pages(self, stack):
+        registrations = [(f'user{i:02d}', f'2026-03-01T10:00:{i // 3:02d}.000Z') for i in range(40)]
+        add_users(stack, registrations)
+        partitions = {item['registeredDate']['S'] for item in stack._tables['users-test'].items.values()}
+        
+        pages = list_all(**{'from': '2026-03-01', 'to': '2026-03-01', 'limit': '7'})
+        
+        assert len(partitions) == api_common.REGISTERED_AT_SHARDS > 1
+        assert len(pages) == 6
+        listed = sum(pages, [])
+        assert sorted(listed) == [user_id for user_id, _ in registrations]
+        registered_at = dict(registrations)
+        assert [registered_at[user_id] for user_id in listed] == sorted(registered_at.values())
+    
+    def test_descending_order_pages_newest_first(self, stack):
+        add_users(stack, [(f'user{i}', f'2026-03-0{1 + i}T12:00:00.000Z') for i in range(3)])
+        
+        pages = list_all(**{'from': '2026-03-01', 'to': '2026-03-03', 'order': 'desc', 'limit': '2'})
+        
+        assert sum(pages, []) == ['user2', 'user1', 'user0']
+    
+    def test_queries_per_page_are_bounded(self, stack, monkeypatch):
+        monkeypatch.setattr(list_users, 'LIST_USERS_MAX_QUERIES', 2 * api_common.REGISTERED_AT_SHARDS + 1)
+        add_users(stack, [('alice', '2026-01-20T00:00:00.000Z')])
+        
+        pages = list_all(**{'from': '2026-01-01', 'to': '2026-01-31'})
+        
+        assert sum(pages, []) == ['alice']
+        assert len(pages) == 16
+        assert stack.calls['Query'] == 31 * api_common.REGISTERED_AT_SHARDS
+    
+    def test_items_without_the_index_attributes_are_not_listed(self, stack):
+        stack.put_item(TableName='users-test', Item={'userId': {'S': 'old'}, 'registeredAt': {'S': 'unknown'}})
+        add_users(stack, [('new', '2026-03-01T00:00:00.000Z')])
+        
+        _, body = list_page(**{'from': '2026-03-01', 'to': '2026-03-01'})
+        
+        assert [user['userId'] for user in body['users']] == ['new']
+    
+    @pytest.mark.parametrize('params', [
+        {'from': 'yesterday'},
+        {'from': '2026-03-02', 'to': '2026-03-01'},
+        {'from': '2020-01-01', 'to': '2026-01-01'},
+        {'limit': '0'},
+        {'order': 'sideways'},
+        {'cursor': 'not-a-cursor'},
+        {'cursor': list_users.encode_cursor({
+            'from': '2026-03-01T00:00:00.000Z', 'to': '2026-03-02T00:00:00.000Z',
+            'order': 'asc', 'day': '2026-04-01', 'after': None
+        })}
+    ])
+    def test_invalid_parameters_are_rejected(self, stack, params):
+        status, body = list_page(**params)
+        
+        assert status == 400
+        assert body['error']
+        assert stack.calls['Query'] == 0
+
+
+class TestRegistrationTimestamps:
+    """Offline tests for UTC registration items and TTL expiry"""
+    
+    def test_registrations_are_written_in_utc_with_their_day(self, stack):
+        response = register_user.lambda_handler({'queryStringParameters': {'userId': 'alice'}}, None)
+        
+        item = stack._tables['users-test'].items[('alice',)]
+        registered_at = item['registeredAt']['S']
+        assert json.loads(response['body'])['timestamp'] == registered_at
+        assert registered_at.endswith('Z') and len(registered_at) == 24
+        assert item['registeredDate']['S'] == f"{registered_at[:10]}#{api_common.registration_shard('alice')}"
+        assert 'expiresAt' not in item
+    
+    def test_naive_and_offset_timestamps_are_normalised(self):
+        assert api_common.registration_item('a', '2026-03-01T23:30:00+02:00')['registeredAt'] == \
+            {'S': '2026-03-01T21:30:00.000Z'}
+        assert api_common.registration_item('a', '2026-03-01T10:00:00.123456')['registeredDate'] == \
+            {'S': f"2026-03-01#{api_common.registration_shard('a')}"}
+    
+    def test_expired_registrations_read_as_unregistered_and_can_register_again(self, stack, monkeypatch):
+        monkeypatch.setattr(api_common, 'REGISTRATION_TTL_DAYS', 30)
+        add_users(stack, [('old', '2020-01-01T00:00:00.000Z')])
+        item = stack._tables['users-test'].items[('old',)]
+        assert int(item['expiresAt']['N']) == 1577836800 + 30 * 86400
+        
+        verified = user_api.lambda_handler({'routeKey': 'GET /', 'queryStringParameters': {'userId': 'old'}}, None)
+        _, listed = list_page(**{'from': '2020-01-01', 'to': '2020-01-01'})
+        registered = register_user.lambda_handler({'queryStringParameters': {'userId': 'old'}}, None)
+        
+        assert 'Verification Failed' in verified['body']
+        assert listed['users'] == []
+        assert 'registered successfully' in json.loads(registered['body'])['message']
+        assert float(stack._tables['users-test'].items[('old',)]['expiresAt']['N']) > time.time()
@@ -0,0 +1,77 @@
+import asyncio
+import random
+from collections import Counter
+
+from aiohttp import web
+
+from load_generator import LatencyHistogram, ZipfUserIds, run_load
+
+
+async def run_against_stub(handler, **kwargs):
+    app = web.Application()
+    app.router.add_route('*', '/{tail:.*}', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        return await run_load(f'http://127.0.0.1:{port}', **kwargs)
+    finally:
+        await runner.cleanup()
+
+
+class TestLoadGenerator:
+    """Offline tests for the open-loop load generator"""
+    
+    def test_histogram_percentiles_within_precision(self):
+        histogram = LatencyHistogram()
+        for ms in range(1, 1001):
+            histogram.record(ms / 1000)
+        
+        assert abs(histogram.percentile(50) - 0.5) <= 0.5 * 0.02
+        assert abs(histogram.percentile(99) - 0.99) <= 0.99 * 0.02
+        assert histogram.percentile(100) == 1.0
+    
+    def test_zipf_user_ids_are_skewed(self):
+        user_ids = ZipfUserIds(1000, 1.1, rng=random.Random(7))
+        counts = Counter(user_ids.sample() for _ in range(10000))
+        
+        assert counts.most_common(1)[0][0] == user_ids.user_id(1)
+        assert counts[user_ids.user_id(1)] > 10 * counts[user_ids.user_id(100)]
+    
+    def test_counts_throttles_errors_and_cold_starts(self):
+        calls = Counter()
+        
+        async def handler(request):
+            calls['n'] += 1
+            if calls['n'] == 1:
+                return web.Response(text='ok', headers={'X-Cold-Start': 'true'})
+            if calls['n'] % 4 == 0:
+                return web.Response(status=429)
+            if calls['n'] % 5 == 0:
+                return web.Response(status=500)
+            return web.Response(text='ok')
+        
+        report = asyncio.run(run_against_stub(handler, rate=200, duration=0.5, seed=1))
+        overall = report['overall']
+        
+        assert overall['requests'] == 100
+        assert overall['cold_starts'] == 1
+        assert overall['throttle_rate'] == 0.25
+        assert overall['error_rate'] == 0.15
+        assert report['operations']['verify']['requests'] + report['operations']['register']['requests'] == 100
+    
+    def test_latency_includes_queueing_behind_slow_requests(self):
+        async def slow_handler(request):
+            await asyncio.sleep(0.05)
+            return web.Response(text='ok')
+        
+        # One connection at a time: later requests queue behind earlier ones,
+        # which the corrected latency must show even though service time is flat
+        report = asyncio.run(run_against_stub(slow_handler, rate=100, duration=0.2, max_connections=1, seed=1))
+        latency = report['overall']['latency']
+        
+        assert latency['max_ms'] > 500
+        assert report['overall']['service_time']['p99_ms'] < 200
+        assert report['overall']['requests'] == 20
@@ -0,0 +1,157 @@
+import gzip
+import json
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import aws_clients
+import register_user
+import registration_consumer
+import user_api
+from local_api import (
+    BUCKET_NAME, TABLE_NAME, LocalApi, Persister, QueueConsumer,
+    build_stack, load_route_keys, match_route, to_event, to_http
+)
+from local_aws import InMemorySQS
+
+pytestmark = pytest.mark.stack(table=TABLE_NAME, bucket=BUCKET_NAME)
+
+
+@pytest.fixture
+def server(stack):
+    api = LocalApi(('127.0.0.1', 0), user_api.lambda_handler, load_route_keys())
+    thread = threading.Thread(target=api.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield api
+    api.shutdown()
+    api.server_close()
+
+
+def request(server, method, path, headers=None, body=None):
+    connection = http.client.HTTPConnection(*server.server_address[:2], timeout=5)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+
+class TestLocalApi:
+    """Offline tests for the local API Gateway v2 emulator"""
+    
+    def test_routes_are_the_deployed_route_keys(self):
+        assert set(load_route_keys()) == {'POST /register', 'GET /', 'POST /verify', 'GET /users'}
+        assert set(load_route_keys()) == set(user_api.ROUTES)
+    
+    def test_register_then_verify_over_http(self, server):
+        status, _, body = request(server, 'POST', '/register?userId=alice')
+        assert status == 200
+        assert json.loads(body)['userId'] == 'alice'
+        
+        status, headers, body = request(server, 'GET', '/?userId=alice')
+        
+        assert status == 200
+        assert headers['Content-Type'].startswith('text/html')
+        assert b'Welcome' in body
+    
+    def test_unmatched_route_is_answered_without_invoking_the_function(self, server, stack):
+        dynamodb, _ = stack
+        
+        status, _, body = request(server, 'DELETE', '/register?userId=alice')
+        
+        assert status == 404
+        assert json.loads(body) == {'message': 'Not Found'}
+        assert sum(dynamodb.calls.values()) == 0
+    
+    def test_base64_bodies_are_decoded(self, server):
+        status, headers, body = request(server, 'GET', '/?userId=nobody', {'Accept-Encoding': 'gzip'})
+        
+        assert status == 200
+        assert headers['Content-Encoding'] == 'gzip'
+        assert int(headers['Content-Length']) == len(body)
+        assert b'<html' in gzip.decompress(body).lower()
+    
+    def test_conditional_requests_get_304(self, server):
+        _, headers, _ = request(server, 'GET', '/?userId=nobody')
+        
+        status, _, body = request(server, 'GET', '/?userId=nobody', {'If-None-Match': headers['ETag']})
+        
+        assert status == 304
+        assert body == b''
+    
+    def test_requests_are_served_concurrently(self, server, stack):
+        dynamodb, _ = stack
+        user_ids = [f'user{i}' for i in range(20)]
+        
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            statuses = list(pool.map(lambda u: request(server, 'POST', f'/register?userId={u}')[0], user_ids))
+        
+        assert statuses == [200] * 20
+        assert len(dynamodb._tables['users-local'].items) == 20
+    
+    def test_event_follows_payload_format_2(self):
+        event = to_event(
+            'GET', '/?userId=alice&tag=a&tag=b',
+            [('Host', 'localhost:3000'), ('Accept', 'text/html'), ('Accept', 'application/json'),
+             ('Cookie', 'a=1; b=2')],
+            b'', 'GET /', '10.0.0.1'
+        )
+        
+        assert event['version'] == '2.0'
+        assert event['routeKey'] == event['requestContext']['routeKey'] == 'GET /'
+        assert event['rawQueryString'] == 'userId=alice&tag=a&tag=b'
+        assert event['queryStringParameters'] == {'userId': 'alice', 'tag': 'a,b'}
+        assert event['headers'] == {'host': 'localhost:3000', 'accept': 'text/html,application/json'}
+        assert event['cookies'] == ['a=1', 'b=2']
+        assert event['requestContext']['http']['sourceIp'] == '10.0.0.1'
+        assert 'body' not in event
+    
+    def test_binary_request_bodies_are_base64_encoded(self):
+        event = to_event('POST', '/register', [], b'\xff\xfe', 'POST /register', '127.0.0.1')
+        
+        assert event['isBase64Encoded'] is True
+        assert event['body'] == '//4='
+    
+    def test_results_without_status_code_are_json(self):
+        status, headers, body = to_http({'warmup': True})
+        
+        assert status == 200
+        assert headers == [('Content-Type', 'application/json')]
+        assert json.loads(body) == {'warmup': True}
+    
+    def test_route_matching_falls_back_to_any_and_default(self):
+        assert match_route({'GET /', 'ANY /items'}, 'DELETE', '/items') == 'ANY /items'
+        assert match_route({'GET /', '$default'}, 'POST', '/other') == '$default'
+        assert match_route({'GET /'}, 'POST', '/') is None
+    
+    def test_data_dir_keeps_the_stack_between_runs(self, tmp_path):
+        dynamodb, s3 = build_stack(str(tmp_path))
+        dynamodb.put_item(TableName='users-local', Item={'userId': {'S': 'alice'}})
+        s3.put_object(Bucket='static-local', Key='index.html', Body=b'<html>changed</html>')
+        Persister(str(tmp_path), dynamodb, s3, interval=60).start().stop()
+        
+        dynamodb, s3 = build_stack(str(tmp_path))
+        
+        assert 'Item' in dynamodb.get_item(TableName='users-local', Key={'userId': {'S': 'alice'}})
+        assert s3.get_object(Bucket='static-local', Key='index.html')['Body'].read() == b'<html>changed</html>'
+    
+    def test_queue_consumer_writes_queued_registrations(self, stack, monkeypatch):
+        dynamodb, _ = stack
+        sqs = InMemorySQS()
+        queue_url = sqs.create_queue(QueueName='registrations-local')['QueueUrl']
+        monkeypatch.setitem(aws_clients._clients, 'sqs', sqs)
+        monkeypatch.setattr(register_user, 'ASYNC_REGISTRATION', True)
+        monkeypatch.setattr(register_user, 'REGISTRATION_QUEUE_URL', queue_url)
+        consumer = QueueConsumer(sqs, queue_url, registration_consumer.lambda_handler)
+        
+        response = user_api.lambda_handler(
+            {'routeKey': 'POST /register', 'queryStringParameters': {'userId': 'alice'}}, None
+        )
+        
+        assert response['statusCode'] == 202
+        assert consumer.drain_once() == 1
+        assert 'Item' in dynamodb.get_item(TableName='users-local', Key={'userId': {'S': 'alice'}})
+        assert sqs.depth(queue_url) == 0
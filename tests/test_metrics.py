@@ -0,0 +1,52 @@
+import json
+
+import metrics
+
+
+@metrics.instrumented('test_function')
+def handler(event, context):
+    with metrics.phase('DynamoDB'):
+        pass
+    if event.get('outcome'):
+        metrics.set_outcome(event['outcome'])
+    return {'statusCode': event.get('statusCode', 200)}
+
+
+def emitted_record(capsys):
+    lines = [line for line in capsys.readouterr().out.splitlines() if line.startswith('{')]
+    assert len(lines) == 1
+    return json.loads(lines[0])
+
+
+class TestEmbeddedMetrics:
+    """Offline tests for the EMF per-phase latency records"""
+    
+    def test_record_contains_phase_timings_and_dimensions(self, capsys):
+        handler({'outcome': 'registered'}, None)
+        record = emitted_record(capsys)
+        
+        definition = record['_aws']['CloudWatchMetrics'][0]
+        names = {metric['Name'] for metric in definition['Metrics']}
+        assert {'DynamoDBMs', 'DurationMs'} <= names
+        assert record['Function'] == 'test_function'
+        assert record['Outcome'] == 'registered'
+        assert record['StartType'] in ('cold', 'warm')
+    
+    def test_outcome_defaults_to_status_class(self, capsys):
+        handler({'statusCode': 400}, None)
+        
+        assert emitted_record(capsys)['Outcome'] == 'client_error'
+    
+    def test_events_are_not_logged_by_default(self, caplog):
+        metrics.log_event({'userId': 'alice'})
+        
+        assert 'Event received' not in caplog.text
+    
+    def test_cold_start_header_only_on_first_invocation(self, monkeypatch, capsys):
+        monkeypatch.setattr(metrics.aws_clients, '_cold_start', True)
+        
+        cold = handler({}, None)
+        warm = handler({}, None)
+        
+        assert cold['headers'][metrics.COLD_START_HEADER] == 'true'
+        assert metrics.COLD_START_HEADER not in warm.get('headers', {})
@@ -0,0 +1,139 @@
+import json
+import pytest
+
+import aws_clients
+import profiling
+import user_api
+import verify_user
+from local_aws import InMemoryS3
+
+pytestmark = pytest.mark.stack(users=['alice'])
+
+
+def verify_event(user_id='alice'):
+    return {'routeKey': 'GET /', 'queryStringParameters': {'userId': user_id}}
+
+
+def profile_records(output):
+    records = [json.loads(line) for line in output.splitlines() if line.startswith('{')]
+    return [record for record in records if record.get('type') == profiling.RECORD_TYPE]
+
+
+def synthetic_record():
+    # handler (10 us own) -> lookup (60 us) and render (30 us); render -> lookup (20 us)
+    return {
+        'type': 'profile', 'function': 'user_api', 'requestId': 'r1',
+        'cpu': {
+            'functions': [
+                ['user_api.py:1(handler)', 1, 10, 100],
+                ['verify_user.py:2(lookup)', 2, 80, 80],
+                ['verify_user.py:3(render)', 1, 10, 30]
+            ],
+            'edges': [[0, 1, 1, 60, 60], [0, 2, 1, 10, 30], [2, 1, 1, 20, 20]]
+        },
+        'memory': {'peakBytes': 4096, 'top': [[2048, 3, ['user_api.py:1', 'verify_user.py:9']]]}
+    }
+
+
+class TestProfiledInvocations:
+    """Offline tests for sampled handler profiling"""
+    
+    def test_unsampled_invocations_write_no_profile(self, stack, capsys):
+        user_api.lambda_handler(verify_event(), None)
+        
+        assert profile_records(capsys.readouterr().out) == []
+    
+    def test_sampled_invocation_writes_cpu_and_memory_profile(self, stack, monkeypatch, capsys):
+        monkeypatch.setattr(profiling, 'PROFILE_SAMPLE_EVERY', 1)
+        
+        response = user_api.lambda_handler(verify_event(), None)
+        
+        assert response['statusCode'] == 200
+        output = capsys.readouterr().out
+        [record] = profile_records(output)
+        labels = [function[0] for function in record['cpu']['functions']]
+        assert record['function'] == 'user_api'
+        assert any('handle_verify' in label for label in labels)
+        assert len(labels) <= profiling.PROFILE_MAX_FUNCTIONS
+        assert record['memory']['peakBytes'] > 0
+        assert '"Profiled":1' in output
+    
+    def test_profiles_can_go_to_s3(self, stack, monkeypatch):
+        bucket = InMemoryS3()
+        monkeypatch.setattr(profiling, 'PROFILE_SAMPLE_EVERY', 1)
+        monkeypatch.setattr(profiling, 'PROFILE_DESTINATION', 's3')
+        monkeypatch.setattr(profiling, 'PROFILE_BUCKET', 'profiles-test')
+        monkeypatch.setattr(profiling.aws_clients, 'get_client', lambda name: bucket if name == 's3' else None)
+        
+        profiling.profiled(lambda event, context: {'statusCode': 200})({}, None)
+        
+        [(name, key)] = [(b, k) for b, k in bucket._objects]
+        assert name == 'profiles-test'
+        assert key.startswith('profiles/<lambda>/')
+        assert json.loads(bucket._objects[(name, key)]['Body'])['type'] == 'profile'
+    
+    def test_overlapping_invocations_are_not_profiled(self, monkeypatch, capsys):
+        monkeypatch.setattr(profiling, 'PROFILE_SAMPLE_EVERY', 1)
+        handler = profiling.profiled(lambda event, context: 'done')
+        
+        with profiling._lock:
+            assert handler({}, None) == 'done'
+        
+        assert profile_records(capsys.readouterr().out) == []
+    
+    def test_handler_errors_still_propagate(self, monkeypatch, capsys):
+        monkeypatch.setattr(profiling, 'PROFILE_SAMPLE_EVERY', 1)
+        
+        def broken(event, context):
+            raise ValueError('boom')
+        
+        with pytest.raises(ValueError):
+            profiling.profiled(broken)({}, None)
+        assert len(profile_records(capsys.readouterr().out)) == 1
+        assert not profiling._lock.locked()
+
+
+class TestProfileMerge:
+    """Offline tests for merging profile records into folded stacks"""
+    
+    def test_cpu_time_is_split_across_callers(self):
+        merged = profiling.MergedProfile()
+        merged.add(synthetic_record())
+        
+        folded = dict(line.rsplit(' ', 1) for line in merged.cpu_folded())
+        
+        assert folded == {
+            'user_api.py:1(handler)': '10',
+            'user_api.py:1(handler);verify_user.py:2(lookup)': '60',
+            'user_api.py:1(handler);verify_user.py:3(render)': '10',
+            'user_api.py:1(handler);verify_user.py:3(render);verify_user.py:2(lookup)': '20'
+        }
+    
+    def test_samples_are_summed(self):
+        merged = profiling.MergedProfile()
+        merged.add(synthetic_record())
+        merged.add(synthetic_record())
+        
+        assert merged.memory_folded() == ['user_api.py:1;verify_user.py:9 4096']
+        assert merged.top_functions(1) == [('verify_user.py:2(lookup)', [4, 160, 160])]
+    
+    def test_merge_tool_reads_log_lines_and_writes_folded_files(self, tmp_path, capsys):
+        logs = tmp_path / 'logs.txt'
+        logs.write_text(
+            '2026-10-17T00:00:00Z r1 {"_aws": {}, "Function": "user_api"}\n'
+            f'2026-10-17T00:00:00Z r1 {json.dumps(synthetic_record())}\n'
+            'START RequestId: r2\n'
+        )
+        
+        assert profiling.main([str(logs), '--cpu-output', str(tmp_path / 'cpu.folded'),
+                               '--memory-output', str(tmp_path / 'memory.folded')]) == 0
+        
+        assert (tmp_path / 'cpu.folded').read_text().splitlines()[0] == \
+            'user_api.py:1(handler);verify_user.py:2(lookup) 60'
+        assert (tmp_path / 'memory.folded').read_text() == 'user_api.py:1;verify_user.py:9 2048\n'
+        assert '1 profiles' in capsys.readouterr().out
+    
+    def test_merge_tool_fails_without_records(self, tmp_path):
+        (tmp_path / 'empty.ndjson').write_text('')
+        
+        assert profiling.main([str(tmp_path / 'empty.ndjson')]) == 1
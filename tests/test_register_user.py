@@ -0,0 +1,183 @@
+import json
+import time
+import pytest
+from botocore.exceptions import ClientError
+
+import api_common
+import aws_clients
+import register_user
+from local_aws import InMemoryDynamoDB
+
+
+class FakeDynamoDB:
+    """Minimal stand-in for the low-level DynamoDB client used by register_user"""
+    
+    def __init__(self):
+        self.items = {}
+        self.calls = []
+        self.unprocessed_once = False
+    
+    def put_item(self, TableName, Item, ConditionExpression=None, ReturnValuesOnConditionCheckFailure=None,
+                 ExpressionAttributeValues=None):
+        self.calls.append('put_item')
+        user_id = Item['userId']['S']
+        existing = self.items.get(user_id)
+        if ConditionExpression.startswith('attribute_not_exists(userId)') and existing:
+            response = {'Error': {'Code': 'ConditionalCheckFailedException'}}
+            if ReturnValuesOnConditionCheckFailure == 'ALL_OLD':
+                response['Item'] = existing
+            raise ClientError(response, 'PutItem')
+        self.items[user_id] = dict(Item)
+        return {}
+    
+    def batch_get_item(self, RequestItems):
+        self.calls.append('batch_get_item')
+        responses = {}
+        for name, request in RequestItems.items():
+            responses[name] = [
+                {'userId': key['userId']} for key in request['Keys']
+                if key['userId']['S'] in self.items
+            ]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+    
+    def batch_write_item(self, RequestItems):
+        self.calls.append('batch_write_item')
+        unprocessed = {}
+        for name, writes in RequestItems.items():
+            if self.unprocessed_once and len(writes) > 1:
+                self.unprocessed_once = False
+                unprocessed[name] = writes[1:]
+                writes = writes[:1]
+            for write in writes:
+                item = write['PutRequest']['Item']
+                self.items[item['userId']['S']] = dict(item)
+        return {'UnprocessedItems': unprocessed}
+
+
+class FailingDeltaDynamoDB(InMemoryDynamoDB):
+    """In-memory DynamoDB whose writes to the Bloom delta table always fail"""
+    
+    def put_item(self, **kwargs):
+        if kwargs['TableName'] == 'users-test-bloom-delta':
+            raise ClientError({'Error': {'Code': 'InternalServerError'}, 'ResponseMetadata': {'HTTPStatusCode': 500}},
+                              'PutItem')
+        return super().put_item(**kwargs)
+
+
+@pytest.fixture
+def fake_dynamodb(monkeypatch):
+    dynamodb = FakeDynamoDB()
+    monkeypatch.setenv('DYNAMODB_TABLE', 'users-test')
+    monkeypatch.setitem(aws_clients._clients, 'dynamodb', dynamodb)
+    monkeypatch.setattr(api_common, 'BATCH_BACKOFF_BASE_SECONDS', 0)
+    return dynamodb
+
+
+def register(user_id):
+    response = register_user.lambda_handler({'queryStringParameters': {'userId': user_id}}, None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+class TestRegisterUser:
+    """Offline tests for the register_user handler"""
+    
+    def test_new_user_is_registered_with_one_write(self, fake_dynamodb):
+        status, body = register('alice')
+        
+        assert status == 200
+        assert 'success' in body['message'].lower()
+        assert fake_dynamodb.calls == ['put_item']
+    
+    def test_existing_user_returns_original_registration_time(self, fake_dynamodb):
+        _, first = register('alice')
+        status, second = register('alice')
+        
+        assert status == 200
+        assert 'already registered' in second['message'].lower()
+        assert second['registeredAt'] == first['timestamp']
+        assert fake_dynamodb.calls == ['put_item', 'put_item']
+    
+    def test_bloom_delta_entry_is_written_alongside_the_user(self, monkeypatch):
+        dynamodb = InMemoryDynamoDB(latency=0.1).create_table('users-test', 'userId')
+        dynamodb.create_table('users-test-bloom-delta', 'shard', 'entry')
+        monkeypatch.setenv('DYNAMODB_TABLE', 'users-test')
+        monkeypatch.setitem(aws_clients._clients, 'dynamodb', dynamodb)
+        monkeypatch.setattr(register_user, 'BLOOM_DELTA_TABLE', 'users-test-bloom-delta')
+        
+        started = time.perf_counter()
+        status, _ = register('alice')
+        elapsed = time.perf_counter() - started
+        
+        assert status == 200
+        assert dynamodb.calls['PutItem'] == 2
+        assert len(dynamodb._tables['users-test-bloom-delta'].items) == 1
+        assert elapsed < 0.18
+    
+    def test_duplicate_registration_while_the_delta_write_fails(self, monkeypatch, fresh_dependencies):
+        dynamodb = FailingDeltaDynamoDB().create_table('users-test', 'userId')
+        dynamodb.put_item(TableName='users-test', Item=api_common.registration_item('alice', '2026-03-01T00:00:00.000Z'))
+        monkeypatch.setenv('DYNAMODB_TABLE', 'users-test')
+        monkeypatch.setitem(aws_clients._clients, 'dynamodb', dynamodb)
+        monkeypatch.setattr(register_user, 'BLOOM_DELTA_TABLE', 'users-test-bloom-delta')
+        
+        status, body = register('alice')
+        new_status, _ = register('bob')
+        
+        assert status == 200
+        assert 'already registered' in body['message'].lower()
+        assert body['registeredAt'] == '2026-03-01T00:00:00.000Z'
+        assert new_status == 500
+    
+    def test_missing_user_id_is_rejected(self, fake_dynamodb):
+        response = register_user.lambda_handler({'queryStringParameters': None}, None)
+        
+        assert response['statusCode'] == 400
+        assert fake_dynamodb.calls == []
+
+
+def register_bulk(body):
+    response = register_user.lambda_handler({'queryStringParameters': None, 'body': body}, None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+class TestBulkRegistration:
+    """Offline tests for bulk registration through BatchWriteItem"""
+    
+    def test_json_array_registers_users_and_reports_existing(self, fake_dynamodb):
+        register('alice')
+        status, body = register_bulk(json.dumps(['alice', 'bob', 'carol', 'bob']))
+        
+        assert status == 200
+        assert body['results'] == {
+            'alice': 'already_registered',
+            'bob': 'registered',
+            'carol': 'registered'
+        }
+        assert body['summary'] == {'already_registered': 1, 'registered': 2}
+        assert set(fake_dynamodb.items) == {'alice', 'bob', 'carol'}
+    
+    def test_ndjson_body_is_accepted(self, fake_dynamodb):
+        status, body = register_bulk('{"userId": "alice"}\n"bob"\n')
+        
+        assert status == 200
+        assert body['results'] == {'alice': 'registered', 'bob': 'registered'}
+    
+    def test_users_are_written_in_batches_of_25(self, fake_dynamodb):
+        register_bulk(json.dumps([f'user{i}' for i in range(60)]))
+        
+        assert fake_dynamodb.calls.count('batch_write_item') == 3
+        assert len(fake_dynamodb.items) == 60
+    
+    def test_unprocessed_items_are_retried(self, fake_dynamodb):
+        fake_dynamodb.unprocessed_once = True
+        status, body = register_bulk(json.dumps(['alice', 'bob', 'carol']))
+        
+        assert status == 200
+        assert set(body['results'].values()) == {'registered'}
+        assert len(fake_dynamodb.items) == 3
+    
+    def test_malformed_body_is_rejected(self, fake_dynamodb):
+        status, body = register_bulk('[1, 2')
+        
+        assert status == 400
+        assert 'error' in body
@@ -0,0 +1,150 @@
+import json
+import pytest
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+
+import api_common
+import aws_clients
+import register_user
+import registration_consumer
+from local_aws import InMemoryDynamoDB, InMemorySQS
+
+
+class FlakyDynamoDB(InMemoryDynamoDB):
+    """In-memory DynamoDB whose BatchWriteItem never accepts some userIds"""
+
+    def __init__(self, rejected):
+        super().__init__()
+        self.rejected = set(rejected)
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        accepted, unprocessed = {}, {}
+        for table_name, writes in RequestItems.items():
+            for write in writes:
+                user_id = write['PutRequest']['Item'].get('userId', {}).get('S')
+                target = unprocessed if user_id in self.rejected else accepted
+                target.setdefault(table_name, []).append(write)
+        if accepted:
+            super().batch_write_item(RequestItems=accepted)
+        return {'UnprocessedItems': unprocessed}
+
+
+class UnreachableSQS:
+    """SQS client whose SendMessage always fails"""
+
+    def send_message(self, **kwargs):
+        raise ClientError({'Error': {'Code': 'ServiceUnavailable'}}, 'SendMessage')
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    sqs = InMemorySQS()
+    url = sqs.create_queue(QueueName='registrations-test')['QueueUrl']
+    monkeypatch.setitem(aws_clients._clients, 'sqs', sqs)
+    monkeypatch.setattr(register_user, 'ASYNC_REGISTRATION', True)
+    monkeypatch.setattr(register_user, 'REGISTRATION_QUEUE_URL', url)
+    monkeypatch.setattr(register_user, 'BLOOM_DELTA_TABLE', None)
+    monkeypatch.setattr(register_user, 'BATCH_MAX_ATTEMPTS', 2)
+    monkeypatch.setattr(api_common, 'backoff', lambda attempt: None)
+    monkeypatch.setenv('DYNAMODB_TABLE', 'users-test')
+    return sqs, url
+
+
+def use_dynamodb(monkeypatch, dynamodb):
+    dynamodb.create_table('users-test', 'userId')
+    monkeypatch.setitem(aws_clients._clients, 'dynamodb', dynamodb)
+    return dynamodb
+
+
+def register(user_id):
+    return register_user.lambda_handler({'queryStringParameters': {'userId': user_id}}, None)
+
+
+class TestWriteBehindRegistration:
+    """Offline tests for the 202 enqueue path and the batching queue consumer"""
+    
+    def test_registration_is_accepted_and_written_by_consumer(self, queue, monkeypatch):
+        sqs, url = queue
+        dynamodb = use_dynamodb(monkeypatch, InMemoryDynamoDB())
+        
+        response = register('alice')
+        assert response['statusCode'] == 202
+        assert json.loads(response['body'])['userId'] == 'alice'
+        assert dynamodb.calls['PutItem'] == 0
+        
+        event = sqs.lambda_event(url)
+        result = registration_consumer.lambda_handler(event, None)
+        assert result == {'batchItemFailures': []}
+        assert sqs.complete(url, event, result) == 0
+        assert sqs.depth(url) == 0
+        assert 'Item' in dynamodb.get_item(TableName='users-test', Key={'userId': {'S': 'alice'}})
+    
+    def test_users_are_registered_at_the_time_they_were_requested(self, queue, monkeypatch):
+        sqs, url = queue
+        dynamodb = use_dynamodb(monkeypatch, InMemoryDynamoDB())
+        accepted = json.loads(register('alice')['body'])['timestamp']
+        for requested_at in ('2026-03-01T09:00:05.000Z', '2026-03-01T09:00:00.000Z'):
+            sqs.send_message(QueueUrl=url, MessageBody=json.dumps({'userId': 'bob', 'requestedAt': requested_at}))
+        sqs.send_message(QueueUrl=url, MessageBody=json.dumps({'userId': 'carol', 'requestedAt': 'soon'}))
+        consumed = datetime(2026, 3, 2, tzinfo=timezone.utc)
+        utc_timestamp = api_common.utc_timestamp
+        monkeypatch.setattr(api_common, 'utc_timestamp', lambda moment=None: utc_timestamp(moment or consumed))
+        
+        registration_consumer.lambda_handler(sqs.lambda_event(url), None)
+        
+        def registered_at(user_id):
+            return dynamodb.get_item(TableName='users-test', Key={'userId': {'S': user_id}})['Item']['registeredAt']['S']
+        assert registered_at('alice') == accepted
+        assert registered_at('bob') == '2026-03-01T09:00:00.000Z'
+        assert registered_at('carol') == '2026-03-02T00:00:00.000Z'
+    
+    def test_duplicates_are_written_once_and_existing_users_keep_registered_at(self, queue, monkeypatch):
+        sqs, url = queue
+        dynamodb = use_dynamodb(monkeypatch, InMemoryDynamoDB())
+        dynamodb.put_item(TableName='users-test', Item={'userId': {'S': 'bob'}, 'registeredAt': {'S': 'earlier'}})
+        for user_id in ('alice', 'alice', 'bob', 'alice'):
+            register(user_id)
+        
+        event = sqs.lambda_event(url)
+        result = registration_consumer.lambda_handler(event, None)
+        
+        assert result == {'batchItemFailures': []}
+        assert dynamodb.calls['BatchWriteItem'] == 1
+        bob = dynamodb.get_item(TableName='users-test', Key={'userId': {'S': 'bob'}})['Item']
+        assert bob['registeredAt']['S'] == 'earlier'
+    
+    def test_only_failed_users_are_reported_and_redelivered(self, queue, monkeypatch):
+        sqs, url = queue
+        use_dynamodb(monkeypatch, FlakyDynamoDB(rejected={'carol'}))
+        for user_id in ('alice', 'carol', 'carol'):
+            register(user_id)
+        
+        event = sqs.lambda_event(url)
+        result = registration_consumer.lambda_handler(event, None)
+        
+        carol_messages = {r['messageId'] for r in event['Records'] if json.loads(r['body'])['userId'] == 'carol'}
+        assert {failure['itemIdentifier'] for failure in result['batchItemFailures']} == carol_messages
+        sqs.complete(url, event, result)
+        assert sqs.depth(url) == 2
+    
+    def test_malformed_messages_are_dropped(self, queue, monkeypatch):
+        sqs, url = queue
+        use_dynamodb(monkeypatch, InMemoryDynamoDB())
+        sqs.send_message(QueueUrl=url, MessageBody='not json')
+        sqs.send_message(QueueUrl=url, MessageBody=json.dumps({'userId': ' '}))
+        
+        event = sqs.lambda_event(url)
+        result = registration_consumer.lambda_handler(event, None)
+        
+        assert result == {'batchItemFailures': []}
+        sqs.complete(url, event, result)
+        assert sqs.depth(url) == 0
+    
+    def test_falls_back_to_direct_write_when_queue_is_unreachable(self, queue, monkeypatch):
+        dynamodb = use_dynamodb(monkeypatch, InMemoryDynamoDB())
+        monkeypatch.setitem(aws_clients._clients, 'sqs', UnreachableSQS())
+        
+        response = register('alice')
+        
+        assert response['statusCode'] == 200
+        assert dynamodb.calls['PutItem'] == 1
@@ -0,0 +1,250 @@
+import json
+import time
+import pytest
+from botocore.exceptions import ClientError, ReadTimeoutError
+
+import metrics
+import register_user
+import resilience
+import verify_user
+
+pytestmark = pytest.mark.stack(users=['alice'], membership_ttls=(0, 0), circuit=(3, 60))
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch, fresh_dependencies):
+    request_metrics = metrics.RequestMetrics('test', cold_start=False)
+    monkeypatch.setattr(metrics._local, 'metrics', request_metrics, raising=False)
+    return request_metrics
+
+
+def throttled():
+    raise ClientError({'Error': {'Code': 'ThrottlingException'}, 'ResponseMetadata': {'HTTPStatusCode': 400}}, 'GetItem')
+
+
+def open_circuit(name):
+    breaker = resilience.breakers[name]
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(ClientError):
+            resilience.call(name, throttled)
+    assert breaker.state == resilience.OPEN
+
+
+class TestHedgedReads:
+    """Offline tests for hedged dependency reads"""
+    
+    def test_slow_primary_is_hedged_and_the_faster_attempt_wins(self, fresh_state, monkeypatch):
+        monkeypatch.setattr(resilience.trackers['S3'], 'delay', 0.01)
+        attempts = []
+        
+        def read():
+            attempts.append(time.perf_counter())
+            if len(attempts) == 1:
+                time.sleep(0.3)
+                return 'primary'
+            return 'hedge'
+        
+        started = time.perf_counter()
+        assert resilience.call('S3', read, hedge=True) == 'hedge'
+        assert time.perf_counter() - started < 0.2
+        assert fresh_state.values['S3Hedged'] == 1
+        assert fresh_state.values['S3HedgeWins'] == 1
+    
+    def test_fast_primary_is_not_hedged(self, fresh_state):
+        assert resilience.call('DynamoDB', lambda: 'item', hedge=True) == 'item'
+        assert 'DynamoDBHedged' not in fresh_state.values
+    
+    def test_submitted_tasks_report_to_the_request_and_are_not_hedged(self, fresh_state, monkeypatch):
+        monkeypatch.setattr(resilience.trackers['S3'], 'delay', 0.001)
+        attempts = []
+        
+        def read():
+            attempts.append(1)
+            time.sleep(0.02)
+            return 'page'
+        
+        future = resilience.submit(lambda: resilience.call('S3', read, hedge=True))
+        
+        assert future.result() == 'page'
+        assert attempts == [1]
+        assert 'S3Hedged' not in fresh_state.values
+        assert fresh_state.values['S3CircuitState'] == 0
+    
+    def test_tasks_that_opt_in_are_hedged_while_the_pool_has_headroom(self, fresh_state, monkeypatch):
+        monkeypatch.setattr(resilience.trackers['S3'], 'delay', 0.01)
+        attempts = []
+        
+        def read():
+            attempts.append(1)
+            if len(attempts) == 1:
+                time.sleep(0.3)
+                return 'primary'
+            return 'hedge'
+        
+        assert resilience.submit(lambda: resilience.call('S3', read, hedge=True), hedge=True).result() == 'hedge'
+        assert fresh_state.values['S3Hedged'] == 1
+        
+        attempts.clear()
+        monkeypatch.setattr(resilience, '_task_hedges', resilience.threading.Semaphore(0))
+        assert resilience.submit(lambda: resilience.call('S3', read, hedge=True), hedge=True).result() == 'primary'
+        assert attempts == [1]
+        assert fresh_state.values['S3Hedged'] == 1
+    
+    def test_hedge_delay_follows_the_latency_percentile(self, monkeypatch):
+        monkeypatch.setattr(resilience, 'HEDGE_PERCENTILE', 90)
+        tracker = resilience.LatencyTracker()
+        for i in range(100):
+            tracker.record((i + 1) / 1000)
+        
+        assert tracker.delay == pytest.approx(0.090)
+
+
+class TestCircuitBreaker:
+    """Offline tests for the per-dependency circuit breakers"""
+    
+    def test_consecutive_failures_open_the_circuit(self, fresh_state):
+        open_circuit('DynamoDB')
+        calls = []
+        
+        with pytest.raises(resilience.CircuitOpenError) as error:
+            resilience.call('DynamoDB', lambda: calls.append(1))
+        assert calls == []
+        assert error.value.retry_after > 0
+        assert fresh_state.values['DynamoDBCircuitOpened'] == 1
+        assert fresh_state.values['DynamoDBCircuitRejected'] == 1
+        assert fresh_state.values['DynamoDBCircuitState'] == resilience.STATE_VALUES[resilience.OPEN]
+    
+    def test_client_errors_do_not_count_as_failures(self):
+        def condition_failed():
+            raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException'},
+                               'ResponseMetadata': {'HTTPStatusCode': 400}}, 'PutItem')
+        
+        for _ in range(5):
+            with pytest.raises(ClientError):
+                resilience.call('DynamoDB', condition_failed)
+        assert resilience.breakers['DynamoDB'].state == resilience.CLOSED
+        assert resilience.is_failure(ReadTimeoutError(endpoint_url='https://dynamodb'))
+    
+    def test_trial_call_after_reset_closes_the_circuit(self, monkeypatch):
+        open_circuit('S3')
+        breaker = resilience.breakers['S3']
+        monkeypatch.setattr(breaker, 'opened_at', time.monotonic() - 61)
+        
+        assert resilience.call('S3', lambda: 'ok') == 'ok'
+        assert breaker.state == resilience.CLOSED
+    
+    def test_failed_trial_reopens_the_circuit(self, monkeypatch):
+        open_circuit('S3')
+        breaker = resilience.breakers['S3']
+        monkeypatch.setattr(breaker, 'opened_at', time.monotonic() - 61)
+        
+        with pytest.raises(ClientError):
+            resilience.call('S3', throttled)
+        assert breaker.state == resilience.OPEN
+
+
+class TestDegradedHandlers:
+    """Offline tests for verify and register while a dependency's circuit is open"""
+    
+    def test_verify_uses_last_known_membership_when_dynamodb_is_open(self, stack):
+        event = {'queryStringParameters': {'userId': 'alice'}}
+        assert 'Welcome' in verify_user.handle_verify(event, None)['body']
+        open_circuit('DynamoDB')
+        
+        response = verify_user.handle_verify(event, None)
+        
+        assert response['statusCode'] == 200
+        assert 'Welcome' in response['body']
+        assert verify_user.membership_cache.stats()['stale_hits'] == 1
+    
+    def test_verify_of_unseen_user_fails_fast_when_dynamodb_is_open(self, stack):
+        open_circuit('DynamoDB')
+        
+        response = verify_user.handle_verify({'queryStringParameters': {'userId': 'bob'}}, None)
+        
+        assert response['statusCode'] == 503
+        assert int(response['headers']['Retry-After']) > 0
+    
+    def test_verify_serves_cached_page_when_s3_is_open(self, stack, monkeypatch):
+        event = {'queryStringParameters': {'userId': 'alice'}}
+        verify_user.handle_verify(event, None)
+        monkeypatch.setattr(verify_user, 'HTML_CACHE_TTL_SECONDS', 0)
+        open_circuit('S3')
+        
+        response = verify_user.handle_verify(event, None)
+        
+        assert response['statusCode'] == 200
+        assert 'Welcome' in response['body']
+    
+    def test_register_fails_fast_when_dynamodb_is_open(self, stack):
+        dynamodb, _ = stack
+        open_circuit('DynamoDB')
+        writes = dynamodb.calls['PutItem']
+        
+        response = register_user.handle_register({'queryStringParameters': {'userId': 'carol'}}, None)
+        
+        assert response['statusCode'] == 503
+        assert json.loads(response['body'])['error'] == 'Service temporarily overloaded'
+        assert dynamodb.calls['PutItem'] == writes
+    
+    def test_precompressed_read_timeout_falls_back_to_local_compression(self, stack, monkeypatch):
+        _, s3 = stack
+        monkeypatch.setattr(verify_user, 'HTML_PRECOMPRESSED', True)
+        get_object = s3.get_object
+        precompressed_reads = []
+        
+        def timing_out(**kwargs):
+            if kwargs['Key'].endswith('.gz'):
+                precompressed_reads.append(kwargs['Key'])
+                raise ReadTimeoutError(endpoint_url='https://s3')
+            return get_object(**kwargs)
+        
+        monkeypatch.setattr(s3, 'get_object', timing_out)
+        # Counted as they are recorded: the error.html prefetch may still be
+        # running and its success resets the breaker's consecutive count
+        breaker = resilience.breakers['S3']
+        on_failure = breaker.on_failure
+        breaker_failures = []
+        
+        def counting():
+            breaker_failures.append(breaker.name)
+            return on_failure()
+        
+        monkeypatch.setattr(breaker, 'on_failure', counting)
+        event = {'queryStringParameters': {'userId': 'alice'}, 'headers': {'accept-encoding': 'gzip'}}
+        
+        responses = [verify_user.handle_verify(event, None) for _ in range(2)]
+        
+        assert [response['statusCode'] for response in responses] == [200, 200]
+        assert responses[0]['headers']['Content-Encoding'] == 'gzip'
+        assert precompressed_reads == ['index.html.gz']
+        assert len(breaker_failures) == 1
+    
+    def test_batch_verify_uses_last_known_membership_when_dynamodb_is_open(self, stack):
+        dynamodb, _ = stack
+        event = {'queryStringParameters': {'userIds': 'alice,bob'}}
+        verify_user.handle_verify(event, None)
+        open_circuit('DynamoDB')
+        reads = dynamodb.calls['BatchGetItem']
+        
+        response = verify_user.handle_verify(event, None)
+        
+        assert response['statusCode'] == 200
+        assert json.loads(response['body'])['results'] == {'alice': True, 'bob': False}
+        assert dynamodb.calls['BatchGetItem'] == reads
+    
+    def test_batch_verify_of_unseen_user_fails_fast_when_dynamodb_is_open(self, stack):
+        open_circuit('DynamoDB')
+        
+        response = verify_user.handle_verify({'queryStringParameters': {'userIds': 'alice,carol'}}, None)
+        
+        assert response['statusCode'] == 503
+    
+    def test_bulk_register_fails_fast_when_dynamodb_is_open(self, stack):
+        dynamodb, _ = stack
+        open_circuit('DynamoDB')
+        
+        response = register_user.handle_register({'queryStringParameters': None, 'body': '["carol", "dave"]'}, None)
+        
+        assert response['statusCode'] == 503
+        assert dynamodb.calls['BatchGetItem'] == 0
+        assert dynamodb.calls['BatchWriteItem'] == 0
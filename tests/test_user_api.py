@@ -0,0 +1,59 @@
+import json
+import pytest
+
+import api_common
+import aws_clients
+import metrics
+import user_api
+
+
+def route_event(route_key, query_params=None, body=None):
+    return {'routeKey': route_key, 'queryStringParameters': query_params, 'body': body}
+
+
+class TestUserApiRouter:
+    """Offline tests for the single-function register/verify router"""
+    
+    def test_routes_register_then_verify(self, stack):
+        register = user_api.lambda_handler(route_event('POST /register', {'userId': 'alice'}), None)
+        verify = user_api.lambda_handler(route_event('GET /', {'userId': 'alice'}), None)
+        
+        assert register['statusCode'] == 200
+        assert json.loads(register['body'])['userId'] == 'alice'
+        assert verify['statusCode'] == 200
+        assert 'Welcome' in verify['body']
+    
+    def test_unknown_route_is_404(self, stack):
+        response = user_api.lambda_handler(route_event('DELETE /'), None)
+        
+        assert response['statusCode'] == 404
+        assert json.loads(response['body'])['error'] == 'Route not found'
+    
+    def test_batch_verify_reads_a_body_only_on_post(self, stack):
+        user_api.lambda_handler(route_event('POST /register', {'userId': 'alice'}), None)
+        body = json.dumps({'userIds': ['alice', 'bob']})
+        
+        posted = user_api.lambda_handler(route_event('POST /verify', body=body), None)
+        got = user_api.lambda_handler(route_event('GET /', body=body), None)
+        
+        assert posted['statusCode'] == 200
+        assert json.loads(posted['body'])['results'] == {'alice': True, 'bob': False}
+        assert got['statusCode'] == 400
+    
+    def test_validation_responses_are_shared_across_routes(self, stack):
+        register = user_api.lambda_handler(route_event('POST /register'), None)
+        verify = user_api.lambda_handler(route_event('GET /'), None)
+        
+        assert register['statusCode'] == verify['statusCode'] == 400
+        assert register['body'] is verify['body'] is api_common.MISSING_USER_ID_BODY
+    
+    def test_cold_start_header_does_not_leak_into_shared_headers(self, stack, monkeypatch):
+        monkeypatch.setattr(metrics.aws_clients, '_cold_start', True)
+        
+        cold = user_api.lambda_handler(route_event('GET /', {'userId': 'bob'}), None)
+        warm = user_api.lambda_handler(route_event('GET /', {'userId': 'bob'}), None)
+        
+        assert metrics.COLD_START_HEADER in cold['headers']
+        again = user_api.lambda_handler(route_event('GET /', {'userId': 'bob'}), None)
+        assert warm['headers'] is again['headers']
+        assert metrics.COLD_START_HEADER not in warm['headers']
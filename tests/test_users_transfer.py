@@ -0,0 +1,156 @@
+import io
+import json
+import time
+import pytest
+
+import api_common
+import users_transfer
+from local_aws import InMemoryDynamoDB
+
+
+def users_table(count=0):
+    dynamodb = InMemoryDynamoDB().create_table('users-test', 'userId')
+    for i in range(count):
+        dynamodb.put_item(TableName='users-test', Item=api_common.registration_item(
+            f'user{i}', f'2024-01-01T00:00:{i % 60:02d}.000Z'
+        ))
+    return dynamodb
+
+
+def export_rows(dynamodb, **kwargs):
+    output = io.StringIO()
+    users_transfer.export_users(dynamodb, 'users-test', users_transfer.NdjsonWriter(output), **kwargs)
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def write_ndjson(path, records):
+    path.write_text(''.join(json.dumps(record) + '\n' for record in records))
+    return str(path)
+
+
+class FailingDynamoDB(InMemoryDynamoDB):
+    """In-memory DynamoDB whose BatchWriteItem raises once `fail_after` requests have succeeded"""
+
+    def __init__(self, fail_after):
+        super().__init__()
+        self.fail_after = fail_after
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        if self.fail_after is not None and self.calls['BatchWriteItem'] >= self.fail_after:
+            raise RuntimeError('connection reset')
+        return super().batch_write_item(RequestItems=RequestItems)
+
+
+class TestUsersTransfer:
+    """Offline tests for the parallel users table export/import tool"""
+    
+    def test_segmented_export_writes_every_user_once(self):
+        dynamodb = users_table(250)
+        
+        rows = export_rows(dynamodb, total_segments=4, page_size=20)
+        
+        assert sorted(row['userId'] for row in rows) == sorted(f'user{i}' for i in range(250))
+        assert rows[0].keys() == {'userId', 'registeredAt'}
+        assert dynamodb.calls['Scan'] > 4
+    
+    def test_failed_export_still_closes_the_writer(self, monkeypatch):
+        dynamodb = users_table(100)
+        scan = dynamodb.scan
+        
+        def flaky_scan(**request):
+            if dynamodb.calls['Scan'] >= 2:
+                raise RuntimeError('connection reset')
+            return scan(**request)
+        monkeypatch.setattr(dynamodb, 'scan', flaky_scan)
+        output = io.StringIO()
+        
+        with pytest.raises(RuntimeError, match='connection reset'):
+            users_transfer.export_users(dynamodb, 'users-test', users_transfer.NdjsonWriter(output, close_stream=True),
+                                        total_segments=2, page_size=10)
+        
+        assert output.closed
+    
+    def test_export_then_import_round_trips(self, tmp_path):
+        source = users_table(60)
+        path = tmp_path / 'users.ndjson'
+        path.write_text(''.join(json.dumps(row) + '\n' for row in export_rows(source, total_segments=3)))
+        target = users_table()
+        
+        checkpoint = users_transfer.Checkpoint(str(tmp_path / 'users.checkpoint'), str(path))
+        counts = users_transfer.import_users(target, 'users-test', users_transfer.read_rows(str(path), 'ndjson'),
+                                             checkpoint, workers=4)
+        
+        assert counts == {'imported': 60, 'invalid': 0}
+        assert target._tables['users-test'].items == source._tables['users-test'].items
+    
+    def test_import_validates_user_ids_like_register(self, tmp_path):
+        path = write_ndjson(tmp_path / 'users.ndjson', [
+            {'userId': '  alice  '}, {'userId': '   '}, {'userId': 42}, ['alice'], 'bob', {'userId': 'alice'}
+        ])
+        with open(path, 'a') as f:
+            f.write('not json\n')
+        dynamodb = users_table()
+        
+        checkpoint = users_transfer.Checkpoint(None, path)
+        counts = users_transfer.import_users(dynamodb, 'users-test', users_transfer.read_rows(path, 'ndjson'), checkpoint)
+        
+        assert counts == {'imported': 2, 'invalid': 4}
+        assert {key[0] for key in dynamodb._tables['users-test'].items} == {'alice', 'bob'}
+        assert checkpoint.offset == 7
+    
+    def test_interrupted_import_resumes_from_checkpoint(self, tmp_path):
+        path = write_ndjson(tmp_path / 'users.ndjson', [{'userId': f'user{i}'} for i in range(100)])
+        checkpoint_path = str(tmp_path / 'users.checkpoint')
+        dynamodb = FailingDynamoDB(fail_after=2).create_table('users-test', 'userId')
+        
+        with pytest.raises(RuntimeError):
+            users_transfer.import_users(dynamodb, 'users-test', users_transfer.read_rows(path, 'ndjson'),
+                                        users_transfer.Checkpoint(checkpoint_path, path), workers=1)
+        
+        checkpoint = users_transfer.Checkpoint(checkpoint_path, path)
+        assert checkpoint.load()
+        assert checkpoint.offset == 50
+        dynamodb.fail_after = None
+        counts = users_transfer.import_users(dynamodb, 'users-test', users_transfer.read_rows(path, 'ndjson'),
+                                             checkpoint, workers=1)
+        
+        assert counts == {'imported': 100, 'invalid': 0}
+        assert dynamodb.calls['BatchWriteItem'] == 4
+        assert len(dynamodb._tables['users-test'].items) == 100
+    
+    def test_checkpoint_for_another_file_is_rejected(self, tmp_path):
+        checkpoint_path = str(tmp_path / 'users.checkpoint')
+        users_transfer.Checkpoint(checkpoint_path, 'a.ndjson').save()
+        
+        with pytest.raises(ValueError):
+            users_transfer.Checkpoint(checkpoint_path, 'b.ndjson').load()
+    
+    def test_import_records_bloom_delta_entries(self, tmp_path):
+        path = write_ndjson(tmp_path / 'users.ndjson', [{'userId': 'alice'}, {'userId': 'bob'}])
+        dynamodb = users_table().create_table('users-test-bloom-delta', 'shard', 'entry')
+        
+        users_transfer.import_users(dynamodb, 'users-test', users_transfer.read_rows(path, 'ndjson'),
+                                    users_transfer.Checkpoint(None, path), delta_table_name='users-test-bloom-delta')
+        
+        entries = dynamodb._tables['users-test-bloom-delta'].items.values()
+        assert sorted(entry['entry']['S'].split('#', 1)[1] for entry in entries) == ['alice', 'bob']
+    
+    def test_rate_limiter_spaces_out_requests(self):
+        limiter = users_transfer.RateLimiter(rate=100, burst=10)
+        
+        started = time.perf_counter()
+        for _ in range(5):
+            limiter.acquire(10)
+        
+        assert time.perf_counter() - started >= 0.35
+    
+    def test_parquet_round_trip(self, tmp_path):
+        pytest.importorskip('pyarrow')
+        path = str(tmp_path / 'users.parquet')
+        users_transfer.export_users(users_table(30), 'users-test', users_transfer.ParquetWriter(path), total_segments=2)
+        target = users_table()
+        
+        counts = users_transfer.import_users(target, 'users-test', users_transfer.read_rows(path, 'parquet'),
+                                             users_transfer.Checkpoint(None, path))
+        
+        assert counts['imported'] == 30
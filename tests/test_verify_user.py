@@ -0,0 +1,384 @@
+import io
+import gzip
+import json
+import base64
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+
+import api_common
+import aws_clients
+import resilience
+import verify_user
+
+pytestmark = pytest.mark.stack(users=['alice'], membership_ttls=(60, 5))
+
+
+class FakeS3:
+    """Minimal stand-in for the S3 client used by verify_user"""
+    
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+        self.fail = False
+    
+    def get_object(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.fail:
+            raise ClientError({'Error': {'Code': 'ServiceUnavailable'}}, 'GetObject')
+        body, etag = self.pages[kwargs['Key']]
+        if kwargs.get('IfNoneMatch') == etag:
+            raise ClientError(
+                {'Error': {'Code': '304'}, 'ResponseMetadata': {'HTTPStatusCode': 304}},
+                'GetObject'
+            )
+        return {'Body': io.BytesIO(body.encode('utf-8')), 'ETag': etag}
+
+
+@pytest.fixture
+def fake_s3(monkeypatch):
+    s3 = FakeS3({'index.html': ('<h1>Welcome</h1>', '"v1"')})
+    monkeypatch.setitem(aws_clients._clients, 's3', s3)
+    monkeypatch.setattr(verify_user, '_html_cache', {})
+    return s3
+
+
+class TestHtmlPageCache:
+    """Offline tests for the warm-container HTML page cache"""
+    
+    def test_page_is_served_from_cache_within_ttl(self, fake_s3, monkeypatch):
+        monkeypatch.setattr(verify_user, 'HTML_CACHE_TTL_SECONDS', 300)
+        
+        assert verify_user.get_html_page('bucket', 'index.html') == '<h1>Welcome</h1>'
+        assert verify_user.get_html_page('bucket', 'index.html') == '<h1>Welcome</h1>'
+        assert len(fake_s3.calls) == 1
+    
+    def test_expired_page_is_revalidated_with_etag(self, fake_s3, monkeypatch):
+        monkeypatch.setattr(verify_user, 'HTML_CACHE_TTL_SECONDS', 0)
+        
+        verify_user.get_html_page('bucket', 'index.html')
+        assert verify_user.get_html_page('bucket', 'index.html') == '<h1>Welcome</h1>'
+        assert fake_s3.calls[1]['IfNoneMatch'] == '"v1"'
+    
+    def test_changed_page_replaces_cached_copy(self, fake_s3, monkeypatch):
+        monkeypatch.setattr(verify_user, 'HTML_CACHE_TTL_SECONDS', 0)
+        
+        verify_user.get_html_page('bucket', 'index.html')
+        fake_s3.pages['index.html'] = ('<h1>Welcome back</h1>', '"v2"')
+        assert verify_user.get_html_page('bucket', 'index.html') == '<h1>Welcome back</h1>'
+    
+    def test_stale_copy_is_served_when_s3_fails(self, fake_s3, monkeypatch):
+        monkeypatch.setattr(verify_user, 'HTML_CACHE_TTL_SECONDS', 0)
+        
+        verify_user.get_html_page('bucket', 'index.html')
+        fake_s3.fail = True
+        assert verify_user.get_html_page('bucket', 'index.html') == '<h1>Welcome</h1>'
+    
+    def test_error_is_raised_without_cached_copy(self, fake_s3):
+        fake_s3.fail = True
+        with pytest.raises(ClientError):
+            verify_user.get_html_page('bucket', 'index.html')
+
+
+class FakeBatchDynamoDB:
+    """Stand-in for the low-level DynamoDB client's batch_get_item"""
+    
+    def __init__(self, user_ids):
+        self.user_ids = set(user_ids)
+        self.requests = []
+        self.unprocessed_once = False
+    
+    def batch_get_item(self, RequestItems):
+        self.requests.append(RequestItems)
+        responses, unprocessed = {}, {}
+        for name, request in RequestItems.items():
+            keys = request['Keys']
+            if self.unprocessed_once and len(keys) > 1:
+                self.unprocessed_once = False
+                unprocessed[name] = dict(request, Keys=keys[1:])
+                keys = keys[:1]
+            responses[name] = [
+                {'userId': key['userId']} for key in keys
+                if key['userId']['S'] in self.user_ids
+            ]
+        return {'Responses': responses, 'UnprocessedKeys': unprocessed}
+
+
+@pytest.fixture
+def fake_batch_dynamodb(monkeypatch):
+    dynamodb = FakeBatchDynamoDB({'alice', 'carol'})
+    monkeypatch.setenv('DYNAMODB_TABLE', 'users-test')
+    monkeypatch.setenv('S3_BUCKET', 'static-test')
+    monkeypatch.setitem(aws_clients._clients, 'dynamodb', dynamodb)
+    monkeypatch.setattr(api_common, 'BATCH_BACKOFF_BASE_SECONDS', 0)
+    monkeypatch.setattr(verify_user, 'membership_cache', verify_user.MembershipCache(100, 60, 5))
+    return dynamodb
+
+
+class TestBatchVerification:
+    """Offline tests for batch verification through BatchGetItem"""
+    
+    def test_query_parameter_list_returns_status_map(self, fake_batch_dynamodb):
+        response = verify_user.lambda_handler(
+            {'queryStringParameters': {'userIds': 'alice,bob,carol'}}, None
+        )
+        
+        assert response['statusCode'] == 200
+        assert response['headers']['Content-Type'] == 'application/json'
+        assert json.loads(response['body'])['results'] == {'alice': True, 'bob': False, 'carol': True}
+        request = fake_batch_dynamodb.requests[0]['users-test']
+        assert request['ProjectionExpression'] == 'userId, expiresAt'
+    
+    def test_json_body_follows_unprocessed_keys(self, fake_batch_dynamodb):
+        fake_batch_dynamodb.unprocessed_once = True
+        response = verify_user.lambda_handler(
+            {'queryStringParameters': None, 'body': json.dumps({'userIds': ['alice', 'bob', 'carol']})}, None
+        )
+        
+        assert json.loads(response['body'])['results'] == {'alice': True, 'bob': False, 'carol': True}
+        assert len(fake_batch_dynamodb.requests) == 2
+    
+    def test_too_many_user_ids_are_rejected(self, fake_batch_dynamodb, monkeypatch):
+        monkeypatch.setattr(verify_user, 'BATCH_VERIFY_MAX_USERS', 2)
+        response = verify_user.lambda_handler(
+            {'queryStringParameters': {'userIds': 'alice,bob,carol'}}, None
+        )
+        
+        assert response['statusCode'] == 400
+        assert fake_batch_dynamodb.requests == []
+
+    def test_cached_users_are_not_fetched_again(self, fake_batch_dynamodb):
+        verify_user.verify_users_batch('users-test', ['alice', 'bob'])
+        verify_user.verify_users_batch('users-test', ['alice', 'bob', 'carol'])
+        
+        keys = fake_batch_dynamodb.requests[1]['users-test']['Keys']
+        assert keys == [{'userId': {'S': 'carol'}}]
+
+
+class FakeDynamoDB:
+    """Stand-in for the low-level DynamoDB client's get_item"""
+    
+    def __init__(self, user_ids):
+        self.user_ids = set(user_ids)
+        self.calls = []
+    
+    def get_item(self, **kwargs):
+        self.calls.append(kwargs)
+        if kwargs['Key']['userId']['S'] in self.user_ids:
+            return {'Item': {'userId': kwargs['Key']['userId']}}
+        return {}
+
+
+class TestMembershipCache:
+    """Offline tests for the in-process membership cache"""
+    
+    def test_hot_user_is_served_from_cache(self, monkeypatch):
+        monkeypatch.setattr(verify_user, 'membership_cache', verify_user.MembershipCache(100, 60, 5))
+        dynamodb = FakeDynamoDB({'alice'})
+        monkeypatch.setitem(aws_clients._clients, 'dynamodb', dynamodb)
+        
+        assert verify_user.user_is_registered('users-test', 'alice') is True
+        assert verify_user.user_is_registered('users-test', 'alice') is True
+        assert len(dynamodb.calls) == 1
+        assert verify_user.membership_cache.stats()['hits'] == 1
+    
+    def test_negative_results_use_their_own_ttl(self, monkeypatch):
+        monkeypatch.setattr(verify_user, 'membership_cache', verify_user.MembershipCache(100, 60, 0))
+        dynamodb = FakeDynamoDB({'alice'})
+        monkeypatch.setitem(aws_clients._clients, 'dynamodb', dynamodb)
+        
+        assert verify_user.user_is_registered('users-test', 'bob') is False
+        dynamodb.user_ids.add('bob')
+        assert verify_user.user_is_registered('users-test', 'bob') is True
+        assert len(dynamodb.calls) == 2
+    
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = verify_user.MembershipCache(2, 60, 60)
+        cache.put('alice', True)
+        cache.put('bob', True)
+        cache.get('alice')
+        cache.put('carol', False)
+        
+        assert cache.get('bob') is None
+        assert cache.get('alice') is True
+        assert cache.stats()['evictions'] == 1
+    
+    def test_concurrent_access_keeps_the_cache_consistent(self):
+        cache = verify_user.MembershipCache(50, 60, 60)
+        
+        def churn(worker):
+            for i in range(2000):
+                user_id = f'user{(worker * 7 + i) % 200}'
+                if cache.get(user_id) is None:
+                    cache.put(user_id, True)
+        
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(churn, range(8)))
+        
+        stats = cache.stats()
+        assert stats['size'] == 50
+        assert stats['hits'] + stats['misses'] == 8 * 2000
+    
+    def test_consistent_read_is_used_on_miss_when_enabled(self, monkeypatch):
+        monkeypatch.setattr(verify_user, 'membership_cache', verify_user.MembershipCache(100, 60, 5))
+        monkeypatch.setattr(verify_user, 'MEMBERSHIP_CONSISTENT_READ', True)
+        dynamodb = FakeDynamoDB({'alice'})
+        monkeypatch.setitem(aws_clients._clients, 'dynamodb', dynamodb)
+        
+        verify_user.user_is_registered('users-test', 'alice')
+        assert dynamodb.calls[0]['ConsistentRead'] is True
+
+
+def verify_event(accept_encoding=None):
+    event = {'queryStringParameters': {'userId': 'alice'}, 'headers': {}}
+    if accept_encoding is not None:
+        event['headers']['accept-encoding'] = accept_encoding
+    return event
+
+
+class TestCompressedResponses:
+    """Offline tests for Accept-Encoding negotiation and compressed page variants"""
+    
+    def test_gzip_is_negotiated_and_base64_encoded(self, stack):
+        response = verify_user.lambda_handler(verify_event('gzip, deflate'), None)
+        
+        assert response['isBase64Encoded'] is True
+        assert response['headers']['Content-Encoding'] == 'gzip'
+        assert response['headers']['Vary'] == 'Accept-Encoding'
+        assert 'Welcome' in gzip.decompress(base64.b64decode(response['body'])).decode('utf-8')
+    
+    def test_identity_without_accept_encoding_or_when_refused(self, stack):
+        for accept_encoding in (None, 'gzip;q=0, identity'):
+            response = verify_user.lambda_handler(verify_event(accept_encoding), None)
+            
+            assert 'isBase64Encoded' not in response
+            assert 'Content-Encoding' not in response['headers']
+            assert 'Welcome' in response['body']
+    
+    def test_page_is_compressed_once_per_version(self, stack, monkeypatch):
+        _, s3 = stack
+        monkeypatch.setattr(verify_user, 'HTML_CACHE_TTL_SECONDS', 0)
+        compressions = []
+        original = verify_user._compress
+        monkeypatch.setattr(verify_user, '_compress', lambda raw, encoding: compressions.append(encoding) or original(raw, encoding))
+        
+        verify_user.lambda_handler(verify_event('gzip'), None)
+        verify_user.lambda_handler(verify_event('gzip'), None)
+        assert compressions == ['gzip']
+        
+        s3.put_object(Bucket='static-test', Key='index.html', Body='<h1>Welcome back</h1>' * 20, ContentType='text/html')
+        response = verify_user.lambda_handler(verify_event('gzip'), None)
+        assert compressions == ['gzip', 'gzip']
+        assert 'Welcome back' in gzip.decompress(base64.b64decode(response['body'])).decode('utf-8')
+    
+    def test_precompressed_object_is_used_only_for_matching_version(self, stack, monkeypatch):
+        _, s3 = stack
+        monkeypatch.setattr(verify_user, 'HTML_PRECOMPRESSED', True)
+        page = s3.get_object(Bucket='static-test', Key='index.html')
+        source_md5 = page['ETag'].strip('"')
+        s3.put_object(Bucket='static-test', Key='index.html.gz', Body=gzip.compress(b'precompressed'),
+                      ContentEncoding='gzip', Metadata={'source-md5': source_md5})
+        
+        response = verify_user.lambda_handler(verify_event('gzip'), None)
+        assert gzip.decompress(base64.b64decode(response['body'])) == b'precompressed'
+        
+        monkeypatch.setattr(verify_user, '_html_cache', {})
+        s3.put_object(Bucket='static-test', Key='index.html.gz', Body=gzip.compress(b'precompressed'),
+                      ContentEncoding='gzip', Metadata={'source-md5': 'another-version'})
+        response = verify_user.lambda_handler(verify_event('gzip'), None)
+        assert b'Welcome' in gzip.decompress(base64.b64decode(response['body']))
+    
+    def test_accept_encoding_weights_and_wildcard(self):
+        def negotiate(value):
+            return api_common.accepted_encodings({'headers': {'Accept-Encoding': value}}, ('br', 'gzip'))
+        
+        assert negotiate('gzip, br') == ['br', 'gzip']
+        assert negotiate('br;q=0.5, gzip') == ['gzip', 'br']
+        assert negotiate('*;q=0.1, br;q=0') == ['gzip']
+        assert negotiate('') == []
+
+
+class TestHttpCaching:
+    """Offline tests for ETag, 304 and Cache-Control on verification pages"""
+    
+    def test_verified_page_carries_validators(self, stack):
+        response = verify_user.lambda_handler(verify_event(), None)
+        
+        assert response['statusCode'] == 200
+        assert response['headers']['ETag'].startswith('"')
+        assert response['headers']['Cache-Control'] == verify_user.VERIFY_CACHE_CONTROL
+        assert response['headers']['Vary'] == 'Accept-Encoding'
+    
+    def test_matching_if_none_match_returns_304_without_body(self, stack):
+        etag = verify_user.lambda_handler(verify_event(), None)['headers']['ETag']
+        event = verify_event()
+        event['headers']['if-none-match'] = f'"other", W/{etag}'
+        
+        response = verify_user.lambda_handler(event, None)
+        assert response['statusCode'] == 304
+        assert response['body'] == ''
+        assert response['headers']['ETag'] == etag
+    
+    def test_etag_differs_by_encoding_outcome_and_version(self, stack):
+        _, s3 = stack
+        identity = verify_user.lambda_handler(verify_event(), None)['headers']['ETag']
+        gzipped = verify_user.lambda_handler(verify_event('gzip'), None)['headers']['ETag']
+        not_registered_event = verify_event()
+        not_registered_event['queryStringParameters']['userId'] = 'mallory'
+        not_registered = verify_user.lambda_handler(not_registered_event, None)
+        
+        assert len({identity, gzipped, not_registered['headers']['ETag']}) == 3
+        assert not_registered['headers']['Cache-Control'] == verify_user.VERIFY_NEGATIVE_CACHE_CONTROL
+        
+        verify_user._html_cache.clear()
+        s3.put_object(Bucket='static-test', Key='index.html', Body='<h1>Welcome back</h1>', ContentType='text/html')
+        event = verify_event()
+        event['headers']['if-none-match'] = identity
+        response = verify_user.lambda_handler(event, None)
+        assert response['statusCode'] == 200
+        assert response['headers']['ETag'] != identity
+    
+    def test_etag_matching_rules(self):
+        assert api_common.etag_matches('*', '"a"')
+        assert api_common.etag_matches('"b", W/"a"', '"a"')
+        assert not api_common.etag_matches('"b"', '"a"')
+        assert not api_common.etag_matches(None, '"a"')
+
+
+class TestPagePrefetch:
+    """Offline tests for fetching pages concurrently with the membership lookup"""
+    
+    @pytest.mark.stack(users=['alice'], latency=0.1, membership_ttls=(0, 0))
+    def test_pages_are_fetched_while_the_membership_lookup_runs(self, stack, monkeypatch):
+        dynamodb, s3 = stack
+        monkeypatch.setattr(resilience, 'HEDGE_ENABLED', False)
+        
+        response = verify_user.lambda_handler(verify_event(), None)
+        
+        assert 'Welcome' in response['body']
+        [(_, lookup_started, lookup_finished)] = [span for span in dynamodb.spans if span[0] == 'GetItem']
+        page_reads = [span for span in s3.spans if span[0] == 'GetObject']
+        assert len(page_reads) == 2
+        assert all(started < lookup_finished and lookup_started < finished for _, started, finished in page_reads)
+        assert set(verify_user._html_cache) == {('static-test', 'index.html'), ('static-test', 'error.html')}
+    
+    def test_fresh_pages_are_not_fetched_again(self, stack, monkeypatch):
+        _, s3 = stack
+        verify_user.lambda_handler(verify_event(), None)
+        submitted = []
+        monkeypatch.setattr(resilience, 'submit', lambda operation, hedge=False: submitted.append(operation))
+        
+        response = verify_user.lambda_handler(verify_event(), None)
+        
+        assert response['statusCode'] == 200
+        assert submitted == []
+        assert s3.calls['GetObject'] == 2
+    
+    def test_failed_fetch_of_the_unused_page_does_not_fail_the_request(self, stack):
+        _, s3 = stack
+        del s3._objects[('static-test', 'error.html')]
+        
+        response = verify_user.lambda_handler(verify_event(), None)
+        
+        assert response['statusCode'] == 200
+        assert 'Welcome' in response['body']
@@ -0,0 +1,127 @@
+import json
+import time
+import threading
+import pytest
+
+import admission
+import aws_clients
+import metrics
+import user_api
+import verify_user
+import warmup
+
+pytestmark = pytest.mark.stack(users=['alice'], membership_ttls=(60, 60))
+
+
+class FakeLambda:
+
+    def __init__(self):
+        self.invocations = []
+        self.lock = threading.Lock()
+
+    def invoke(self, **kwargs):
+        with self.lock:
+            self.invocations.append(kwargs)
+        return {'StatusCode': 200}
+
+
+class FakeContext:
+    invoked_function_arn = 'arn:aws:lambda:us-east-1:123456789012:function:user_api'
+
+
+@pytest.fixture
+def stack(stack, monkeypatch):
+    lambda_client = FakeLambda()
+    monkeypatch.setitem(aws_clients._clients, 'lambda', lambda_client)
+    monkeypatch.setattr(warmup, 'WARMUP_HOLD_MS', 0)
+    return (*stack, lambda_client)
+
+
+class TestWarmup:
+    """Offline tests for warm-up invocations"""
+    
+    def test_warmup_primes_caches_without_routing(self, stack):
+        dynamodb, _, _ = stack
+        
+        result = user_api.lambda_handler({'warmup': True, 'userIds': ['alice', 'bob']}, FakeContext())
+        
+        assert result['warmup'] is True
+        assert 'statusCode' not in result
+        assert isinstance(result['primed']['verify_user'], float)
+        assert isinstance(result['primed']['register_user'], float)
+        assert {('static-test', 'index.html'), ('static-test', 'error.html')} <= set(verify_user._html_cache)
+        assert None in verify_user._html_cache[('static-test', 'index.html')]['representations']
+        assert verify_user.membership_cache.get('alice') is True
+        assert verify_user.membership_cache.get('bob') is False
+        assert dynamodb.calls['PutItem'] == 1
+    
+    def test_warmed_verify_does_not_touch_s3(self, stack):
+        _, s3, _ = stack
+        user_api.lambda_handler({'warmup': True}, FakeContext())
+        reads = s3.calls['GetObject']
+        
+        response = user_api.lambda_handler(
+            {'routeKey': 'GET /', 'queryStringParameters': {'userId': 'alice'}}, None
+        )
+        
+        assert response['statusCode'] == 200
+        assert s3.calls['GetObject'] == reads
+    
+    def test_concurrency_fans_out_to_more_containers(self, stack):
+        _, _, lambda_client = stack
+        
+        result = user_api.lambda_handler({'warmup': True, 'concurrency': 4}, FakeContext())
+        
+        assert result['invoked'] == 3
+        assert len(lambda_client.invocations) == 3
+        for invocation in lambda_client.invocations:
+            assert invocation['FunctionName'] == FakeContext.invoked_function_arn
+            assert invocation['InvocationType'] == 'RequestResponse'
+            assert json.loads(invocation['Payload']) == {'warmup': True, 'concurrency': 1}
+    
+    def test_concurrency_is_capped(self, stack, monkeypatch):
+        _, _, lambda_client = stack
+        monkeypatch.setattr(warmup, 'WARMUP_MAX_CONCURRENCY', 2)
+        
+        user_api.lambda_handler({'warmup': True, 'concurrency': 50}, FakeContext())
+        
+        assert len(lambda_client.invocations) == 1
+    
+    def test_container_is_held_for_the_minimum_time(self, stack, monkeypatch):
+        monkeypatch.setattr(warmup, 'WARMUP_HOLD_MS', 50)
+        
+        started = time.perf_counter()
+        user_api.lambda_handler({'warmup': True}, FakeContext())
+        
+        assert time.perf_counter() - started >= 0.05
+    
+    def test_failing_primer_does_not_fail_the_warmup(self, stack, monkeypatch):
+        def broken(event):
+            raise RuntimeError('boom')
+        monkeypatch.setattr(warmup, '_primers', warmup._primers + [('broken', broken)])
+        
+        result = user_api.lambda_handler({'warmup': True}, FakeContext())
+        
+        assert result['primed']['broken'] == 'failed'
+        assert isinstance(result['primed']['verify_user'], float)
+    
+    def test_warmup_bypasses_admission_control(self, stack, monkeypatch):
+        monkeypatch.setattr(admission, 'caller_limiter', admission.CallerLimiter(1, 1, 10))
+        
+        for _ in range(3):
+            assert user_api.lambda_handler({'warmup': True}, FakeContext())['warmup'] is True
+    
+    def test_cold_start_is_reported_in_the_result(self, stack, monkeypatch):
+        monkeypatch.setattr(metrics.aws_clients, '_cold_start', True)
+        
+        cold = user_api.lambda_handler({'warmup': True}, FakeContext())
+        warm = user_api.lambda_handler({'warmup': True}, FakeContext())
+        
+        assert cold['coldStart'] is True
+        assert warm['coldStart'] is False
+        assert 'headers' not in cold
+    
+    def test_only_a_literal_true_is_a_warmup(self):
+        assert warmup.is_warmup({'warmup': True})
+        assert not warmup.is_warmup({'warmup': 'true'})
+        assert not warmup.is_warmup({'routeKey': 'GET /', 'queryStringParameters': {'warmup': True}})